@@ -1,926 +1,798 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-
-import streamlit as st
-import mysql.connector
-import bcrypt
-from datetime import datetime
-
-# Database Connection 
-conn = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password="root",
-    database="khoj_db1"
-)
-cursor = conn.cursor()
-
-# Create Users Table
-cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    name VARCHAR(100),
-    email VARCHAR(100) UNIQUE,
-    password VARCHAR(255),
-    phone VARCHAR(15),
-    role ENUM('USER', 'VOLUNTEER')
-)''')
-
-# Create Lost & Found Table
-cursor.execute('''CREATE TABLE IF NOT EXISTS lost_found (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    user_name VARCHAR(100),
-    train_number VARCHAR(50),
-    compartment_number VARCHAR(50),
-    seat_number VARCHAR(50),
-    item_description TEXT,
-    phone_number VARCHAR(15),
-    status ENUM('Pending', 'Received', 'Assigned to Volunteer', 'Searching', 'Found', 'Out for Delivery', 'Resolved') DEFAULT 'Pending',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)''')
-
-# Create Medical Assistance Table
-cursor.execute('''CREATE TABLE IF NOT EXISTS medical_assistance (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    user_name VARCHAR(100),
-    symptoms TEXT,
-    station_left VARCHAR(100),
-    arriving_station VARCHAR(100),
-    assistance_type VARCHAR(50),
-    status ENUM('Pending', 'Received', 'Assigned to Volunteer', 'In Progress', 'Out for Assistance', 'Resolved') DEFAULT 'Pending',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)''')
-
-# Create Women's Safety Table with Travel Companion Features
-cursor.execute('''CREATE TABLE IF NOT EXISTS womens_safety (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    user_name VARCHAR(100),
-    boarding_station VARCHAR(100),
-    destination_station VARCHAR(100),
-    time_of_boarding VARCHAR(50),
-    phone_number VARCHAR(15),
-    travel_date DATE,
-    looking_for_companion BOOLEAN DEFAULT FALSE,
-    status ENUM('Pending', 'Received', 'Assigned to Volunteer', 'In Progress', 'Assistance Dispatched', 'Resolved') DEFAULT 'Pending',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)''')
-
-# Create Travel Companions Table
-cursor.execute('''CREATE TABLE IF NOT EXISTS travel_companions (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    request_id INT,
-    companion_name VARCHAR(100),
-    companion_phone VARCHAR(15),
-    status ENUM('Pending', 'Accepted', 'Rejected') DEFAULT 'Pending',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (request_id) REFERENCES womens_safety(id)
-)''')
-
-# Create Volunteer Assignments Table
-cursor.execute('''CREATE TABLE IF NOT EXISTS volunteer_assignments (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    complaint_type VARCHAR(50),
-    complaint_id INT,
-    volunteer_name VARCHAR(100),
-    volunteer_phone VARCHAR(15),
-    volunteer_email VARCHAR(100),
-    assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)''')
-
-conn.commit()
-
-# User Management Functions
-def register_user(name, email, password, phone, role):
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    try:
-        cursor.execute("INSERT INTO users (name, email, password, phone, role) VALUES (%s, %s, %s, %s, %s)", 
-                      (name, email, hashed_pw, phone, role))
-        conn.commit()
-        return True
-    except mysql.connector.IntegrityError:
-        return False
-
-def authenticate_user(email, password):
-    cursor.execute("SELECT id, name, password, role, phone FROM users WHERE email=%s", (email,))
-    user = cursor.fetchone()
-    if user and bcrypt.checkpw(password.encode(), user[2].encode()):
-        return user[0], user[1], user[3], user[4], email
-    return None, None, None, None, None
-
-# Complaint Management Functions
-def add_lost_found(user_name, train_number, compartment_number, seat_number, item_description, phone_number):
-    cursor.execute("""
-        INSERT INTO lost_found 
-        (user_name, train_number, compartment_number, seat_number, item_description, phone_number) 
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (user_name, train_number, compartment_number, seat_number, item_description, phone_number))
-    conn.commit()
-
-def add_medical_assistance(user_name, symptoms, station_left, arriving_station, assistance_type):
-    cursor.execute("""
-        INSERT INTO medical_assistance 
-        (user_name, symptoms, station_left, arriving_station, assistance_type) 
-        VALUES (%s, %s, %s, %s, %s)
-    """, (user_name, symptoms, station_left, arriving_station, assistance_type))
-    conn.commit()
-
-def add_womens_safety(user_name, boarding_station, destination_station, time_of_boarding, phone_number, travel_date, looking_for_companion):
-    cursor.execute("""
-        INSERT INTO womens_safety 
-        (user_name, boarding_station, destination_station, time_of_boarding, phone_number, travel_date, looking_for_companion) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    """, (user_name, boarding_station, destination_station, time_of_boarding, phone_number, travel_date, looking_for_companion))
-    conn.commit()
-
-# Travel Companion Functions
-def find_travel_companions(boarding_station, destination_station, travel_date):
-    cursor.execute("""
-        SELECT id, user_name, time_of_boarding, phone_number 
-        FROM womens_safety 
-        WHERE boarding_station = %s 
-        AND destination_station = %s 
-        AND travel_date = %s 
-        AND looking_for_companion = TRUE 
-        AND status != 'Resolved'
-    """, (boarding_station, destination_station, travel_date))
-    return cursor.fetchall()
-
-def request_companion(request_id, companion_name, companion_phone):
-    cursor.execute("""
-        INSERT INTO travel_companions 
-        (request_id, companion_name, companion_phone) 
-        VALUES (%s, %s, %s)
-    """, (request_id, companion_name, companion_phone))
-    conn.commit()
-
-def get_companion_requests(user_name):
-    cursor.execute("""
-        SELECT tc.id, ws.user_name AS requester_name, tc.companion_name, 
-               ws.boarding_station, ws.destination_station, ws.travel_date, 
-               ws.time_of_boarding, tc.status, tc.created_at,
-               ws.phone_number AS requester_phone,
-               tc.companion_phone
-        FROM travel_companions tc
-        JOIN womens_safety ws ON tc.request_id = ws.id
-        WHERE ws.user_name = %s OR tc.companion_name = %s
-        ORDER BY tc.created_at DESC
-    """, (user_name, user_name))
-    return cursor.fetchall()
-
-# Volunteer Functions
-def assign_volunteer(complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email):
-    cursor.execute("""
-        INSERT INTO volunteer_assignments 
-        (complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email))
-    conn.commit()
-
-def get_lost_found_complaints(volunteer_email=None):
-    if volunteer_email:
-        cursor.execute("""
-            SELECT lf.id, lf.user_name, lf.train_number, lf.compartment_number, 
-                   lf.seat_number, lf.item_description, lf.phone_number, lf.status, 
-                   lf.created_at
-            FROM lost_found lf
-            LEFT JOIN volunteer_assignments va 
-            ON va.complaint_type='lost_found' AND va.complaint_id=lf.id
-            WHERE (lf.status = 'Pending' OR lf.status = 'Received')
-            OR (va.volunteer_email = %s)
-            ORDER BY lf.status, lf.created_at DESC
-        """, (volunteer_email,))
-    else:
-        cursor.execute("""
-            SELECT lf.id, lf.user_name, lf.train_number, lf.compartment_number, 
-                   lf.seat_number, lf.item_description, lf.phone_number, lf.status, 
-                   lf.created_at
-            FROM lost_found lf
-            WHERE status IN ('Pending', 'Received')
-            ORDER BY lf.status, lf.created_at DESC
-        """)
-    return cursor.fetchall()
-
-def get_medical_assistance_complaints(volunteer_email=None):
-    if volunteer_email:
-        cursor.execute("""
-            SELECT ma.id, ma.user_name, ma.symptoms, ma.station_left, 
-                   ma.arriving_station, ma.assistance_type, ma.status, ma.created_at
-            FROM medical_assistance ma
-            LEFT JOIN volunteer_assignments va 
-            ON va.complaint_type='medical_assistance' AND va.complaint_id=ma.id
-            WHERE (ma.status = 'Pending' OR ma.status = 'Received')
-            OR (va.volunteer_email = %s)
-            ORDER BY ma.status, ma.created_at DESC
-        """, (volunteer_email,))
-    else:
-        cursor.execute("""
-            SELECT ma.id, ma.user_name, ma.symptoms, ma.station_left, 
-                   ma.arriving_station, ma.assistance_type, ma.status, ma.created_at
-            FROM medical_assistance ma
-            WHERE status IN ('Pending', 'Received')
-            ORDER BY ma.status, ma.created_at DESC
-        """)
-    return cursor.fetchall()
-
-def get_womens_safety_complaints(volunteer_email=None):
-    if volunteer_email:
-        cursor.execute("""
-            SELECT ws.id, ws.user_name, ws.boarding_station, ws.destination_station, 
-                   ws.time_of_boarding, ws.phone_number, ws.status, ws.created_at
-            FROM womens_safety ws
-            LEFT JOIN volunteer_assignments va 
-            ON va.complaint_type='womens_safety' AND va.complaint_id=ws.id
-            WHERE (ws.status = 'Pending' OR ws.status = 'Received')
-            OR (va.volunteer_email = %s)
-            ORDER BY ws.status, ws.created_at DESC
-        """, (volunteer_email,))
-    else:
-        cursor.execute("""
-            SELECT ws.id, ws.user_name, ws.boarding_station, ws.destination_station, 
-                   ws.time_of_boarding, ws.phone_number, ws.status, ws.created_at
-            FROM womens_safety ws
-            WHERE status IN ('Pending', 'Received')
-            ORDER BY ws.status, ws.created_at DESC
-        """)
-    return cursor.fetchall()
-
-def update_complaint_status(table_name, complaint_id, new_status, volunteer_details=None):
-    cursor.execute(f"UPDATE {table_name} SET status=%s WHERE id=%s", (new_status, complaint_id))
-    if new_status == 'Assigned to Volunteer' and volunteer_details:
-        assign_volunteer(
-            table_name,
-            complaint_id,
-            volunteer_details['name'],
-            volunteer_details['phone'],
-            volunteer_details['email']
-        )
-    conn.commit()
-
-def get_user_complaints(user_name):
-    complaints = {
-        'lost_found': [],
-        'medical_assistance': [],
-        'womens_safety': []
-    }
-    
-    # Lost & Found
-    cursor.execute("""
-        SELECT lf.id, lf.train_number, lf.compartment_number, lf.seat_number, 
-               lf.item_description, lf.phone_number, lf.status, lf.created_at,
-               va.volunteer_name, va.volunteer_phone, va.volunteer_email, va.assigned_at
-        FROM lost_found lf
-        LEFT JOIN volunteer_assignments va 
-        ON va.complaint_type='lost_found' AND va.complaint_id=lf.id
-        WHERE lf.user_name = %s
-        ORDER BY lf.created_at DESC
-    """, (user_name,))
-    complaints['lost_found'] = cursor.fetchall()
-    
-    # Medical Assistance
-    cursor.execute("""
-        SELECT ma.id, ma.symptoms, ma.station_left, ma.arriving_station, 
-               ma.assistance_type, ma.status, ma.created_at,
-               va.volunteer_name, va.volunteer_phone, va.volunteer_email, va.assigned_at
-        FROM medical_assistance ma
-        LEFT JOIN volunteer_assignments va 
-        ON va.complaint_type='medical_assistance' AND va.complaint_id=ma.id
-        WHERE ma.user_name = %s
-        ORDER BY ma.created_at DESC
-    """, (user_name,))
-    complaints['medical_assistance'] = cursor.fetchall()
-    
-    # Women's Safety
-    cursor.execute("""
-        SELECT ws.id, ws.boarding_station, ws.destination_station, 
-               ws.time_of_boarding, ws.phone_number, ws.status, ws.created_at,
-               va.volunteer_name, va.volunteer_phone, va.volunteer_email, va.assigned_at
-        FROM womens_safety ws
-        LEFT JOIN volunteer_assignments va 
-        ON va.complaint_type='womens_safety' AND va.complaint_id=ws.id
-        WHERE ws.user_name = %s
-        ORDER BY ws.created_at DESC
-    """, (user_name,))
-    complaints['womens_safety'] = cursor.fetchall()
-    
-    return complaints
-
-def analyze_lost_found_patterns():
-    """Analyze patterns in lost & found items"""
-    cursor.execute("""
-        SELECT train_number, compartment_number, item_description, 
-               created_at, status, HOUR(created_at) as hour_of_day,
-               DAYOFWEEK(created_at) as day_of_week
-        FROM lost_found
-    """)
-    df = pd.DataFrame(cursor.fetchall(), columns=['train_number', 'compartment_number', 
-                                                  'item_description', 'created_at', 'status',
-                                                  'hour_of_day', 'day_of_week'])
-    return df
-
-def analyze_medical_emergencies():
-    """Analyze medical emergency patterns"""
-    cursor.execute("""
-        SELECT station_left, arriving_station, symptoms, 
-               assistance_type, created_at, status,
-               HOUR(created_at) as hour_of_day,
-               DAYOFWEEK(created_at) as day_of_week
-        FROM medical_assistance
-    """)
-    df = pd.DataFrame(cursor.fetchall(), columns=['station_left', 'arriving_station', 
-                                                  'symptoms', 'assistance_type', 'created_at',
-                                                  'status', 'hour_of_day', 'day_of_week'])
-    return df
-
-def analyze_safety_hotspots():
-    """Analyze women's safety request patterns"""
-    cursor.execute("""
-        SELECT boarding_station, destination_station, 
-               time_of_boarding, status, created_at,
-               HOUR(created_at) as hour_of_day,
-               DAYOFWEEK(created_at) as day_of_week
-        FROM womens_safety
-    """)
-    df = pd.DataFrame(cursor.fetchall(), columns=['boarding_station', 'destination_station',
-                                                  'time_of_boarding', 'status', 'created_at',
-                                                  'hour_of_day', 'day_of_week'])
-    return df
-
-def generate_insights():
-    """Generate comprehensive insights from all data"""
-    lost_found_df = analyze_lost_found_patterns()
-    medical_df = analyze_medical_emergencies()
-    safety_df = analyze_safety_hotspots()
-    
-    insights = {
-        'lost_found': {
-            'total_cases': len(lost_found_df),
-            'resolution_rate': (lost_found_df['status'] == 'Resolved').mean() * 100,
-            'peak_hours': lost_found_df['hour_of_day'].mode().iloc[0],
-            'common_items': lost_found_df['item_description'].value_counts().head(5).to_dict()
-        },
-        'medical': {
-            'total_cases': len(medical_df),
-            'emergency_rate': (medical_df['assistance_type'] == 'Ambulance Assistance').mean() * 100,
-            'common_symptoms': medical_df['symptoms'].value_counts().head(5).to_dict(),
-            'high_risk_stations': medical_df['station_left'].value_counts().head(3).to_dict()
-        },
-        'safety': {
-            'total_requests': len(safety_df),
-            'risky_hours': safety_df['hour_of_day'].mode().iloc[0],
-            'common_routes': pd.DataFrame({
-                'route': safety_df['boarding_station'] + ' to ' + safety_df['destination_station']
-            }).value_counts().head(5).to_dict()
-        }
-    }
-    
-    return insights
-
-def create_visualizations():
-    """Create interactive visualizations for the dashboard"""
-    lost_found_df = analyze_lost_found_patterns()
-    medical_df = analyze_medical_emergencies()
-    safety_df = analyze_safety_hotspots()
-    
-    # Lost & Found Heatmap
-    lost_found_heatmap = px.density_heatmap(
-        lost_found_df,
-        x='hour_of_day',
-        y='day_of_week',
-        title='Lost & Found Reports Distribution'
-    )
-    
-    # Medical Emergency Timeline
-    medical_timeline = px.line(
-        medical_df.groupby('created_at').size().reset_index(),
-        x='created_at',
-        y=0,
-        title='Medical Emergencies Over Time'
-    )
-    
-    # Safety Requests Map (if coordinates available)
-    safety_stations = pd.concat([
-        safety_df['boarding_station'],
-        safety_df['destination_station']
-    ]).value_counts().reset_index()
-    safety_stations.columns = ['station', 'count']
-    
-    return {
-        'lost_found_heatmap': lost_found_heatmap,
-        'medical_timeline': medical_timeline,
-        'station_data': safety_stations
-    }
-
-def predict_resource_needs(days_ahead=7):
-    """Predict resource requirements for upcoming days"""
-    cursor.execute("""
-        SELECT DATE(created_at) as date, 
-               COUNT(*) as total_cases,
-               SUM(CASE WHEN status = 'Resolved' THEN 1 ELSE 0 END) as resolved_cases
-        FROM (
-            SELECT created_at, status FROM lost_found
-            UNION ALL
-            SELECT created_at, status FROM medical_assistance
-            UNION ALL
-            SELECT created_at, status FROM womens_safety
-        ) combined
-        GROUP BY DATE(created_at)
-    """)
-
-    historical_data = pd.DataFrame(cursor.fetchall(), 
-                                   columns=['date', 'total_cases', 'resolved_cases'])
-
-    # Check if historical_data is empty
-    if historical_data.empty:
-        avg_cases = 0  # Default to zero if no historical data
-        avg_resolution_rate = 0  # Default to zero
-    else:
-        avg_cases = historical_data['total_cases'].rolling(window=7).mean().iloc[-1]
-        avg_resolution_rate = (historical_data['resolved_cases'] / historical_data['total_cases']).mean()
-
-        # Handle NaN cases
-        if pd.isna(avg_cases):
-            avg_cases = historical_data['total_cases'].mean()  # Use mean instead
-        if pd.isna(avg_resolution_rate):
-            avg_resolution_rate = 0  # Default to zero
-
-    predictions = pd.DataFrame({
-        'date': [datetime.now().date() + timedelta(days=i) for i in range(days_ahead)],
-        'predicted_cases': [round(avg_cases)] * days_ahead,
-        'predicted_resolutions': [round(avg_cases * avg_resolution_rate)] * days_ahead
-    })
-
-    return predictions
-
-
-def add_analytics_dashboard():
-    """Add analytics dashboard to Streamlit interface"""
-    st.title("KHOJ Analytics Dashboard")
-    
-    insights = generate_insights()
-    visualizations = create_visualizations()
-    predictions = predict_resource_needs()
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("Total Lost & Found Cases", insights['lost_found']['total_cases'])
-        st.metric("Resolution Rate", f"{insights['lost_found']['resolution_rate']:.1f}%")
-    
-    with col2:
-        st.metric("Medical Emergencies", insights['medical']['total_cases'])
-        st.metric("Emergency Rate", f"{insights['medical']['emergency_rate']:.1f}%")
-    
-    with col3:
-        st.metric("Safety Requests", insights['safety']['total_requests'])
-        st.metric("Peak Hour", f"{insights['safety']['risky_hours']:02d}:00")
-    
-    st.plotly_chart(visualizations['lost_found_heatmap'])
-    st.plotly_chart(visualizations['medical_timeline'])
-    
-    st.subheader("Resource Needs Forecast")
-    st.dataframe(predictions)
-
-
-# Streamlit UI
-st.title("KHOJ - Find & Help")
-
-# Initialize session state
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-    st.session_state.user_id = None
-    st.session_state.user_name = ""
-    st.session_state.user_phone = ""
-    st.session_state.user_email = ""
-    st.session_state.role = ""
-
-# Menu options based on user role
-menu = st.sidebar.selectbox(
-    "Menu", 
-    ["Login", "Register"] if not st.session_state.logged_in 
-    else ["Home", "Track Applications", "Analytics Dashboard", "Logout"]
-)
-
-
-# Register Page
-if menu == "Register":
-    st.subheader("Register")
-    name = st.text_input("Full Name")
-    email = st.text_input("Email")
-    phone = st.text_input("Phone Number")
-    password = st.text_input("Password", type="password")
-    role = st.selectbox("Register as", ["USER", "VOLUNTEER"])
-    if st.button("Register"):
-        if register_user(name, email, password, phone, role):
-            st.success("Registered successfully! You can now login.")
-        else:
-            st.error("Email already exists. Try logging in.")
-
-# Login Page
-elif menu == "Login":
-    st.subheader("Login")
-    email = st.text_input("Email")
-    password = st.text_input("Password", type="password")
-    if st.button("Login"):
-        # Login Page (continued)
-        user_id, user_name, role, phone, email = authenticate_user(email, password)
-        if role:
-            st.session_state.logged_in = True
-            st.session_state.user_id = user_id
-            st.session_state.user_name = user_name
-            st.session_state.user_phone = phone
-            st.session_state.user_email = email
-            st.session_state.role = role
-            st.success(f"Welcome, {user_name} ({role})!")
-            st.rerun()
-
-        else:
-            st.error("Invalid email or password")
-
-# Track Applications Page
-elif menu == "Track Applications":
-    st.subheader("Track Your Applications")
-    
-    complaints = get_user_complaints(st.session_state.user_name)
-    
-    tab1, tab2, tab3, tab4 = st.tabs(["Lost & Found", "Medical Assistance", "Women's Safety", "Travel Companions"])
-    
-    with tab1:
-        st.write("### Lost & Found Complaints")
-        if complaints['lost_found']:
-            for complaint in complaints['lost_found']:
-                id, train_number, compartment_number, seat_number, \
-                item_description, phone_number, status, created_at, \
-                volunteer_name, volunteer_phone, volunteer_email, assigned_at = complaint
-                
-                with st.expander(f"Complaint Status: {status} - {created_at}"):
-                    st.write(f"**Train Number:** {train_number}")
-                    st.write(f"**Compartment:** {compartment_number}")
-                    st.write(f"**Seat:** {seat_number}")
-                    st.write(f"**Item:** {item_description}")
-                    st.write(f"**Current Status:** {status}")
-                    
-                    if status == "Assigned to Volunteer" and volunteer_name:
-                        st.write("---")
-                        st.write("### Volunteer Details")
-                        st.write(f"**Name:** {volunteer_name}")
-                        st.write(f"**Contact:** {volunteer_phone}")
-                        st.write(f"**Email:** {volunteer_email}")
-                        st.write(f"**Assigned:** {assigned_at}")
-        else:
-            st.info("No Lost & Found complaints found.")
-    
-    with tab2:
-        st.write("### Medical Assistance Requests")
-        if complaints['medical_assistance']:
-            for complaint in complaints['medical_assistance']:
-                id, symptoms, station_left, arriving_station, \
-                assistance_type, status, created_at, \
-                volunteer_name, volunteer_phone, volunteer_email, assigned_at = complaint
-                
-                with st.expander(f"Request Status: {status} - {created_at}"):
-                    st.write(f"**Symptoms:** {symptoms}")
-                    st.write(f"**Last Station:** {station_left}")
-                    st.write(f"**Arriving Station:** {arriving_station}")
-                    st.write(f"**Assistance Type:** {assistance_type}")
-                    st.write(f"**Current Status:** {status}")
-                    
-                    if status == "Assigned to Volunteer" and volunteer_name:
-                        st.write("---")
-                        st.write("### Volunteer Details")
-                        st.write(f"**Name:** {volunteer_name}")
-                        st.write(f"**Contact:** {volunteer_phone}")
-                        st.write(f"**Email:** {volunteer_email}")
-                        st.write(f"**Assigned:** {assigned_at}")
-        else:
-            st.info("No Medical Assistance requests found.")
-    
-    with tab3:
-        st.write("### Women's Safety Requests")
-        if complaints['womens_safety']:
-            for complaint in complaints['womens_safety']:
-                id, boarding_station, destination_station, \
-                time_of_boarding, phone_number, status, created_at, \
-                volunteer_name, volunteer_phone, volunteer_email, assigned_at = complaint
-                
-                with st.expander(f"Request Status: {status} - {created_at}"):
-                    st.write(f"**Boarding Station:** {boarding_station}")
-                    st.write(f"**Destination Station:** {destination_station}")
-                    st.write(f"**Time of Boarding:** {time_of_boarding}")
-                    st.write(f"**Current Status:** {status}")
-                    
-                    if status == "Assigned to Volunteer" and volunteer_name:
-                        st.write("---")
-                        st.write("### Volunteer Details")
-                        st.write(f"**Name:** {volunteer_name}")
-                        st.write(f"**Contact:** {volunteer_phone}")
-                        st.write(f"**Email:** {volunteer_email}")
-                        st.write(f"**Assigned:** {assigned_at}")
-        else:
-            st.info("No Women's Safety requests found.")
-    
-    with tab4:
-        st.write("### Travel Companion Requests")
-        companion_requests = get_companion_requests(st.session_state.user_name)
-    
-    if companion_requests:
-        sent_requests = []
-        received_requests = []
-        
-        for request in companion_requests:
-            (id, requester, companion, boarding, destination, 
-             date, time, status, created_at, requester_phone, companion_phone) = request
-            
-            # Separate requests into sent and received
-            if requester == st.session_state.user_name:
-                sent_requests.append(request)
-            else:
-                received_requests.append(request)
-        
-        # Display Received Requests
-        st.write("#### Received Requests")
-        if received_requests:
-            for request in received_requests:
-                (id, requester, companion, boarding, destination, 
-                 date, time, status, created_at, requester_phone, companion_phone) = request
-                
-                with st.expander(f"Request from {requester} - {status}"):
-                    st.write(f"**Route:** {boarding} to {destination}")
-                    st.write(f"**Date:** {date}")
-                    st.write(f"**Time:** {time}")
-                    
-                    if status == 'Pending':
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if st.button("Accept", key=f"accept_{id}"):
-                                cursor.execute("""
-                                    UPDATE travel_companions 
-                                    SET status='Accepted', companion_phone=%s 
-                                    WHERE id=%s
-                                """, (st.session_state.user_phone, id))
-                                conn.commit()
-                                st.success("Request accepted!")
-                                st.experimental_rerun()
-                        with col2:
-                            if st.button("Reject", key=f"reject_{id}"):
-                                cursor.execute("""
-                                    UPDATE travel_companions 
-                                    SET status='Rejected' 
-                                    WHERE id=%s
-                                """, (id,))
-                                conn.commit()
-                                st.success("Request rejected!")
-                                st.experimental_rerun()
-                    elif status == 'Accepted':
-                        st.write("#### Contact Details")
-                        st.write(f"**Requester Phone:** {requester_phone}")
-        else:
-            st.info("No received requests.")
-        
-        # Display Sent Requests
-        st.write("#### Sent Requests")
-        if sent_requests:
-            for request in sent_requests:
-                (id, requester, companion, boarding, destination, 
-                 date, time, status, created_at, requester_phone, companion_phone) = request
-                
-                with st.expander(f"Request to {companion} - {status}"):
-                    st.write(f"**Route:** {boarding} to {destination}")
-                    st.write(f"**Date:** {date}")
-                    st.write(f"**Time:** {time}")
-                    st.write(f"**Status:** {status}")
-                    
-                    if status == 'Accepted':
-                        st.write("#### Contact Details")
-                        st.write(f"**Companion Phone:** {companion_phone}")
-        else:
-            st.info("No sent requests.")
-    else:
-        st.info("No travel companion requests found.")
-
-elif menu == "Analytics Dashboard":
-    add_analytics_dashboard()
-
-# Home Page
-elif st.session_state.logged_in and menu == "Home":
-    if st.session_state.role == "USER":
-        st.subheader(f"Welcome {st.session_state.user_name} ({st.session_state.role})")
-        
-        tab1, tab2, tab3 = st.tabs(["Lost & Found", "Medical Assistance", "Women's Safety Travel"])
-        
-        with tab1:
-            st.write("### Lost & Found")
-            with st.form("lost_found_form"):
-                train_number = st.text_input("Train Number or Name")
-                compartment_number = st.text_input("Compartment Number")
-                seat_number = st.text_input("Seat Number")
-                item_description = st.text_area("Item Description")
-                phone_number = st.text_input("Your Phone Number", value=st.session_state.user_phone)
-                submitted = st.form_submit_button("Submit")
-                if submitted and all([train_number, compartment_number, seat_number, item_description, phone_number]):
-                    add_lost_found(st.session_state.user_name, train_number, compartment_number, 
-                                 seat_number, item_description, phone_number)
-                    st.success("Lost & Found request submitted successfully!")
-
-        with tab2:
-            st.write("### Medical Assistance")
-            with st.form("medical_assistance_form"):
-                symptoms = st.text_area("Symptoms")
-                station_left = st.text_input("Last Station Left")
-                arriving_station = st.text_input("Arriving Station")
-                assistance_type = st.radio("Do you need assistance?", ["Ambulance Assistance", "Volunteer Assistance"])
-                submitted = st.form_submit_button("Submit")
-                if submitted and all([symptoms, station_left, arriving_station, assistance_type]):
-                    add_medical_assistance(st.session_state.user_name, symptoms, station_left, 
-                                        arriving_station, assistance_type)
-                    st.success("Medical assistance request submitted successfully!")
-
-        with tab3:
-            st.write("### Women's Safety Travel")
-            with st.form("womens_safety_form"):
-                boarding_station = st.text_input("Boarding Station")
-                destination_station = st.text_input("Destination Station")
-                travel_date = st.date_input("Date of Travel")
-                time_of_boarding = st.time_input("Time of Boarding")
-                phone_number = st.text_input("Your Phone Number", value=st.session_state.user_phone)
-                looking_for_companion = st.checkbox("Looking for Travel Companion?")
-                
-                submitted = st.form_submit_button("Submit")
-                if submitted and all([boarding_station, destination_station, time_of_boarding, phone_number]):
-                    add_womens_safety(
-                        st.session_state.user_name, 
-                        boarding_station, 
-                        destination_station, 
-                        time_of_boarding.strftime("%H:%M"), 
-                        phone_number,
-                        travel_date,
-                        looking_for_companion
-                    )
-                    st.success("Women's Safety Travel details submitted successfully!")
-
-            if looking_for_companion:
-                st.write("### Available Travel Companions")
-                companions = find_travel_companions(boarding_station, destination_station, travel_date)
-                
-                if companions:
-                    st.write("Found potential travel companions on your route:")
-                    for companion in companions:
-                        id, name, time, phone = companion
-                        if name != st.session_state.user_name:  # Don't show own request
-                            with st.expander(f"Traveller: {name}"):
-                                st.write(f"**Boarding Time:** {time}")
-                                st.write(f"**Contact:** {phone}")
-                                if st.button("Request to Travel Together", key=f"companion_{id}"):
-                                    request_companion(id, st.session_state.user_name, st.session_state.user_phone)
-                                    st.success("Request sent successfully!")
-                else:
-                    st.info("No travel companions found for your route and date. Your request has been posted for others to find.")
-
-    # Volunteer Dashboard
-    elif st.session_state.role == "VOLUNTEER":
-        st.subheader("Volunteer Dashboard")
-        
-        tab1, tab2, tab3 = st.tabs(["Lost & Found", "Medical Assistance", "Women's Safety"])
-        
-        with tab1:
-            st.write("### Lost & Found Complaints")
-            complaints = get_lost_found_complaints(st.session_state.user_email)
-            for complaint in complaints:
-                id, user_name, train_number, compartment_number, seat_number, \
-                item_description, phone_number, status, created_at = complaint
-                
-                with st.expander(f"Lost & Found - {status} (by {user_name}) - {created_at}"):
-                    st.write(f"**Train Number:** {train_number}")
-                    st.write(f"**Compartment:** {compartment_number}")
-                    st.write(f"**Seat:** {seat_number}")
-                    st.write(f"**Item:** {item_description}")
-                    st.write(f"**Phone:** {phone_number}")
-                    st.write(f"**Current Status:** {status}")
-                    
-                    if status != "Resolved":
-                        status_options = [
-                            'Pending',
-                            'Received',
-                            'Assigned to Volunteer',
-                            'Searching',
-                            'Found',
-                            'Out for Delivery',
-                            'Resolved'
-                        ]
-                        new_status = st.selectbox(
-                            "Update Status",
-                            status_options,
-                            key=f"lf_status_{id}"
-                        )
-                        
-                        if new_status == "Assigned to Volunteer":
-                            volunteer_details = {
-                                'name': st.session_state.user_name,
-                                'phone': st.session_state.user_phone,
-                                'email': st.session_state.user_email
-                            }
-                        else:
-                            volunteer_details = None
-                            
-                        if st.button(f"Update Status", key=f"lf_{id}"):
-                            update_complaint_status("lost_found", id, new_status, volunteer_details)
-                            st.success("Status updated successfully!")
-                            st.experimental_rerun()
-        
-        with tab2:
-            st.write("### Medical Assistance Requests")
-            complaints = get_medical_assistance_complaints(st.session_state.user_email)
-            for complaint in complaints:
-                id, user_name, symptoms, station_left, arriving_station, \
-                assistance_type, status, created_at = complaint
-                
-                with st.expander(f"Medical Assistance - {status} (by {user_name}) - {created_at}"):
-                    st.write(f"**Symptoms:** {symptoms}")
-                    st.write(f"**Last Station:** {station_left}")
-                    st.write(f"**Arriving Station:** {arriving_station}")
-                    st.write(f"**Assistance Type:** {assistance_type}")
-                    st.write(f"**Current Status:** {status}")
-                    
-                    if status != "Resolved":
-                        status_options = [
-                            'Pending',
-                            'Received',
-                            'Assigned to Volunteer',
-                            'In Progress',
-                            'Out for Assistance',
-                            'Resolved'
-                        ]
-                        new_status = st.selectbox(
-                            "Update Status",
-                            status_options,
-                            key=f"ma_status_{id}"
-                        )
-                        
-                        if new_status == "Assigned to Volunteer":
-                            volunteer_details = {
-                                'name': st.session_state.user_name,
-                                'phone': st.session_state.user_phone,
-                                'email': st.session_state.user_email
-                            }
-                        else:
-                            volunteer_details = None
-                            
-                        if st.button(f"Update Status", key=f"ma_{id}"):
-                            update_complaint_status("medical_assistance", id, new_status, volunteer_details)
-                            st.success("Status updated successfully!")
-                            st.experimental_rerun()
-        
-        with tab3:
-            st.write("### Women's Safety Travel Requests")
-            complaints = get_womens_safety_complaints(st.session_state.user_email)
-            for complaint in complaints:
-                id, user_name, boarding_station, destination_station, \
-                time_of_boarding, phone_number, status, created_at = complaint
-                
-                with st.expander(f"Women's Safety - {status} (by {user_name}) - {created_at}"):
-                    st.write(f"**Boarding Station:** {boarding_station}")
-                    st.write(f"**Destination Station:** {destination_station}")
-                    st.write(f"**Time of Boarding:** {time_of_boarding}")
-                    st.write(f"**Phone Number:** {phone_number}")
-                    st.write(f"**Current Status:** {status}")
-                    
-                    if status != "Resolved":
-                        status_options = [
-                            'Pending',
-                            'Received',
-                            'Group Created',
-                            'RPF Informed',
-                            'Resolved'
-                        ]
-                        new_status = st.selectbox(
-                            "Update Status",
-                            status_options,
-                            key=f"ws_status_{id}"
-                        )
-                        
-                        if new_status == "Assigned to Volunteer":
-                            volunteer_details = {
-                                'name': st.session_state.user_name,
-                                'phone': st.session_state.user_phone,
-                                'email': st.session_state.user_email
-                            }
-                        else:
-                            volunteer_details = None
-                            
-                        if st.button(f"Update Status", key=f"ws_{id}"):
-                            update_complaint_status("womens_safety", id, new_status, volunteer_details)
-                            st.success("Status updated successfully!")
-                            st.experimental_rerun()
-
-# Logout
-elif menu == "Logout":
-    st.session_state.logged_in = False
-    st.session_state.user_id = None
-    st.session_state.user_name = ""
-    st.session_state.user_phone = ""
-    st.session_state.user_email = ""
-    st.session_state.role = ""
-    st.success("Logged out successfully.")
-    st.rerun()
+import json
+import os
+
+import streamlit as st
+import datetime
+
+from khoj.migrations import ensure_schema
+from khoj.auth import SESSION_SECRET, SESSION_TTL, AuthBusy, LoginThrottled, issue_session_token
+from khoj.users import register_user, authenticate_user, end_session, restore_session
+from khoj.complaints import (
+    CLAIM_BATCH, CLAIM_LEASE_SECONDS, COMPLAINT_TABLES, ComplaintClaimed, claim_complaints, release_claims,
+    application_changes, changed_since, feed_cursor, find_travel_companions, request_companion, respond_to_companion_request,
+    get_queue_page, update_complaint_status, search_lost_found
+)
+from khoj.analytics import (
+    generate_insights, create_visualizations, hotspot_table, predict_resource_needs, station_forecast,
+    status_durations
+)
+from khoj.ingest import COLUMNS
+from khoj.matching import register_found_item
+from khoj import metrics, snapshot, stations, writebehind
+
+# Database Setup (connections come from the shared pool in khoj.db;
+# migrations only run on the first script run in this process)
+ensure_schema()
+writebehind.start()
+metrics.start()
+
+
+# Seconds between change-feed polls that rerun Track Applications and the
+# Volunteer Dashboard when something changed (0 = only on interaction)
+AUTO_REFRESH_SECONDS = float(os.environ.get('KHOJ_AUTO_REFRESH_SECONDS', '0'))
+
+# Dashboard periods (days shown; None = all history)
+DASHBOARD_PERIODS = {
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "Last 90 days": 90,
+    "Last 365 days": 365,
+    "All time": None,
+}
+
+
+def add_analytics_dashboard():
+    """Add analytics dashboard to Streamlit interface"""
+    st.title("KHOJ Analytics Dashboard")
+    if snapshot.enabled():
+        age = snapshot.age_seconds()
+        st.caption("Read from the database until the first analytics snapshot export" if age is None
+                   else f"Read from the analytics snapshot exported {age / 60:.0f} min ago")
+
+    period = st.selectbox("Period", list(DASHBOARD_PERIODS), index=len(DASHBOARD_PERIODS) - 1)
+    days = DASHBOARD_PERIODS[period]
+    since = datetime.date.today() - datetime.timedelta(days=days - 1) if days else None
+    
+    insights = generate_insights(since)
+    visualizations = create_visualizations(since)
+    predictions = predict_resource_needs(since=since)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Lost & Found Cases", insights['lost_found']['total_cases'])
+        st.metric("Resolution Rate", f"{insights['lost_found']['resolution_rate']:.1f}%")
+    
+    with col2:
+        st.metric("Medical Emergencies", insights['medical']['total_cases'])
+        st.metric("Emergency Rate", f"{insights['medical']['emergency_rate']:.1f}%")
+    
+    with col3:
+        st.metric("Safety Requests", insights['safety']['total_requests'])
+        peak_hour = insights['safety']['risky_hours']
+        st.metric("Peak Hour", f"{peak_hour:02d}:00" if peak_hour is not None else "N/A")
+    
+    st.plotly_chart(visualizations['lost_found_heatmap'])
+    st.plotly_chart(visualizations['medical_timeline'])
+
+    st.subheader("Hotspots")
+    for label, complaint_type in [("Medical Emergencies", 'medical_assistance'), ("Safety Requests", 'womens_safety')]:
+        hotspots = hotspot_table(complaint_type)
+        st.write(f"**{label}**")
+        if hotspots.empty:
+            st.info("No hotspot model yet; run `python -m khoj.hotspots update`.")
+        else:
+            st.dataframe(hotspots, hide_index=True)
+    
+    st.subheader("Time to Resolution")
+    durations = status_durations(since)
+    st.dataframe(durations['resolution'], hide_index=True)
+    st.write("**Hours in each status**")
+    st.dataframe(durations['time_in_state'], hide_index=True)
+
+    st.subheader("Resource Needs Forecast")
+    st.dataframe(predictions)
+    st.write("**By station**")
+    st.dataframe(station_forecast(since=since), hide_index=True)
+
+
+# Track Applications sections -> khoj.complaints.APPLICATION_SECTIONS keys
+APPLICATION_SECTIONS = {
+    "Lost & Found": 'lost_found',
+    "Medical Assistance": 'medical_assistance',
+    "Women's Safety": 'womens_safety',
+    "Travel Companions": 'travel_companions',
+}
+
+
+def date_range_filter(key):
+    """Optional (since, until) date range picker"""
+    picked = st.date_input("Reported between", value=(), key=key)
+    if len(picked) == 2:
+        return picked[0], picked[1]
+    return None, None
+
+
+def station_input(label):
+    """Station picker over the suburban stations; other names can be typed in (see khoj.stations)"""
+    return st.selectbox(label, stations.KNOWN_STATIONS, index=None, accept_new_options=True,
+                        placeholder="Choose or type a station")
+
+
+def tracked_applications(section):
+    """The user's applications in section: the session's copy merged with the change feed"""
+    key = f"applications_{st.session_state.user_name}_{section}"
+    held = st.session_state.get(key)
+    records, cursor = application_changes(section, st.session_state.user_name, held['cursor'] if held else None)
+    if held is None or cursor is None:
+        held = st.session_state[key] = {'records': {}}
+    held['records'].update((record.id, record) for record in records)
+    held['cursor'] = cursor
+    return sorted(held['records'].values(), key=lambda record: record.created_at, reverse=True)
+
+
+def queue_page(table_name, key, filters):
+    """Current page of a volunteer queue; changing the filters goes back to page 1
+
+    The page is kept in the session and only read again once the change feed
+    shows a write to the table or a claim lease running out.
+    """
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[f"{key}_pages"] = [None]
+    pages = st.session_state[f"{key}_pages"]
+    held = st.session_state.get(f"{key}_page")
+    if (held and held['after'] == pages[-1] and held['filters'] == filters
+            and not changed_since(table_name, held['cursor'], claims_since=held['cursor'])):
+        return held['result']
+    cursor = feed_cursor()
+    result = get_queue_page(table_name, st.session_state.user_email, pages[-1], **filters)
+    st.session_state[f"{key}_page"] = {'after': pages[-1], 'filters': dict(filters), 'cursor': cursor,
+                                       'result': result}
+    return result
+
+
+def auto_refresh(poll):
+    """Rerun the page when poll() sees changes, checking every AUTO_REFRESH_SECONDS"""
+    if not AUTO_REFRESH_SECONDS:
+        return
+
+    @st.fragment(run_every=AUTO_REFRESH_SECONDS)
+    def watch():
+        if poll():
+            st.rerun(scope="app")
+
+    watch()
+
+
+def claim_controls(table_name, key, filters):
+    """Claim the oldest open complaints (hidden from other volunteers while the claim lasts) or let them go"""
+    if st.checkbox("Only my claims", key=f"{key}_mine"):
+        filters['claimed_by'] = st.session_state.user_email
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"Claim next {CLAIM_BATCH}", key=f"{key}_claim"):
+            claimed = claim_complaints(table_name, st.session_state.user_email)
+            st.session_state[f"{key}_pages"] = [None]
+            st.info(f"You hold {len(claimed)} open complaint(s) for the next "
+                    f"{int(CLAIM_LEASE_SECONDS // 60)} minutes.")
+    with col2:
+        if st.button("Release my claims", key=f"{key}_release"):
+            released = release_claims(table_name, st.session_state.user_email)
+            st.info(f"Released {released} claim(s).")
+
+
+def change_status(table_name, complaint_id, new_status, volunteer_details):
+    try:
+        update_complaint_status(table_name, complaint_id, new_status, st.session_state.user_email,
+                                volunteer_details)
+    except ComplaintClaimed:
+        st.error("Another volunteer has claimed this complaint.")
+        return
+    st.success("Status updated successfully!")
+    st.rerun()
+
+
+def queue_navigation(key, next_cursor):
+    pages = st.session_state[f"{key}_pages"]
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(pages) > 1 and st.button("Previous page", key=f"{key}_prev"):
+            pages.pop()
+            st.rerun()
+    with col2:
+        if next_cursor and st.button("Next page", key=f"{key}_next"):
+            pages.append(next_cursor)
+            st.rerun()
+
+
+# Streamlit UI
+st.title("KHOJ - Find & Help")
+
+# Initialize session state
+if 'logged_in' not in st.session_state:
+    st.session_state.logged_in = False
+    st.session_state.user_id = None
+    st.session_state.user_name = ""
+    st.session_state.user_phone = ""
+    st.session_state.user_email = ""
+    st.session_state.role = ""
+    st.session_state.session_token = None
+
+SESSION_COOKIE = 'khoj_session'
+
+
+def set_session_cookie(token, max_age):
+    """Keep the session token in a cookie (Streamlit can only set one from JavaScript); max_age 0 deletes it"""
+    secure = '; Secure' if str(st.context.url or '').startswith('https:') else ''
+    cookie = f"{SESSION_COOKIE}={token}; Path=/; Max-Age={max_age}; SameSite=Strict{secure}"
+    st.html(f"<script>document.cookie = {json.dumps(cookie)};</script>", unsafe_allow_javascript=True)
+
+
+def start_session(user_id, user_name, role, phone, email):
+    st.session_state.logged_in = True
+    st.session_state.user_id = user_id
+    st.session_state.user_name = user_name
+    st.session_state.user_phone = phone
+    st.session_state.user_email = email
+    st.session_state.role = role
+
+
+# A browser refresh starts a new session; restore the login from the session
+# cookie. The token is kept out of the URL, where history, proxy logs and
+# shared links would hold on to it; drop one left there by an older link.
+# Without KHOJ_SESSION_SECRET no cookie is issued or read (khoj.auth logs why).
+st.query_params.pop('session', None)
+session_cookie = st.context.cookies.get(SESSION_COOKIE)
+if (SESSION_SECRET and not st.session_state.logged_in and session_cookie
+        and st.session_state.get('checked_cookie') != session_cookie):
+    st.session_state.checked_cookie = session_cookie
+    restored = restore_session(session_cookie)
+    if restored:
+        start_session(*restored)
+        st.session_state.session_token = session_cookie
+    else:
+        set_session_cookie('', 0)
+
+# Written on the run after login or logout: their st.rerun() would discard the script
+if st.session_state.get('cookie_pending') is not None:
+    pending_cookie = st.session_state.pop('cookie_pending')
+    set_session_cookie(pending_cookie, SESSION_TTL if pending_cookie else 0)
+
+def lost_found_card(complaint):
+    """Expander with a lost & found report and its status controls (volunteer view)"""
+    id, user_name, train_number, compartment_number, seat_number, \
+    item_description, phone_number, status, created_at = complaint
+
+    with st.expander(f"Lost & Found - {status} (by {user_name}) - {created_at}"):
+        st.write(f"**Train Number:** {train_number}")
+        st.write(f"**Compartment:** {compartment_number}")
+        st.write(f"**Seat:** {seat_number}")
+        st.write(f"**Item:** {item_description}")
+        st.write(f"**Phone:** {phone_number}")
+        st.write(f"**Current Status:** {status}")
+
+        if status != "Resolved":
+            status_options = [
+                'Pending',
+                'Received',
+                'Assigned to Volunteer',
+                'Searching',
+                'Found',
+                'Out for Delivery',
+                'Resolved'
+            ]
+            new_status = st.selectbox(
+                "Update Status",
+                status_options,
+                key=f"lf_status_{id}"
+            )
+
+            if new_status == "Assigned to Volunteer":
+                volunteer_details = {
+                    'name': st.session_state.user_name,
+                    'phone': st.session_state.user_phone,
+                    'email': st.session_state.user_email
+                }
+            else:
+                volunteer_details = None
+
+            if st.button(f"Update Status", key=f"lf_{id}"):
+                change_status("lost_found", id, new_status, volunteer_details)
+
+
+def max_chars(table_name, column):
+    """Input limit for a complaint column (khoj.ingest.COLUMNS); TEXT holds up to 4 bytes a character"""
+    kind, limit, _ = COLUMNS[table_name][column]
+    return limit // 4 if kind == 'text' else limit
+
+
+def submit_form(table_name, values, message, immediate=False):
+    try:
+        submission = writebehind.submit(table_name, values, immediate=immediate)
+    except ValueError as error:
+        st.error(f"Please check your details: {error}")
+        return
+    if submission.queued:
+        st.success(f"{message} Your ticket number is {submission.ticket}.")
+    else:
+        st.success(message)
+
+
+# Menu options based on user role
+menu = st.sidebar.selectbox(
+    "Menu", 
+    ["Login", "Register"] if not st.session_state.logged_in 
+    else ["Home", "Track Applications", "Analytics Dashboard", "Logout"]
+)
+page_render = metrics.page_timer(menu, st.session_state.role)
+
+
+try:
+    # Register Page
+    if menu == "Register":
+        st.subheader("Register")
+        name = st.text_input("Full Name", max_chars=100)
+        email = st.text_input("Email", max_chars=100)
+        phone = st.text_input("Phone Number", max_chars=15)
+        password = st.text_input("Password", type="password")
+        role = st.selectbox("Register as", ["USER", "VOLUNTEER"])
+        if st.button("Register"):
+            try:
+                registered = register_user(name, email, password, phone, role,
+                                           getattr(st.context, 'ip_address', None))
+            except (LoginThrottled, AuthBusy) as error:
+                st.error(str(error))
+            else:
+                if registered:
+                    st.success("Registered successfully! You can now login.")
+                else:
+                    st.error("Email already exists. Try logging in.")
+
+    # Login Page
+    elif menu == "Login":
+        st.subheader("Login")
+        email = st.text_input("Email")
+        password = st.text_input("Password", type="password")
+        if st.button("Login"):
+            # Login Page (continued)
+            try:
+                user_id, user_name, role, phone, email = authenticate_user(
+                    email, password, getattr(st.context, 'ip_address', None))
+            except (LoginThrottled, AuthBusy) as error:
+                st.error(str(error))
+            else:
+                if role:
+                    start_session(user_id, user_name, role, phone, email)
+                    if SESSION_SECRET:
+                        st.session_state.session_token = issue_session_token(user_id)
+                        st.session_state.cookie_pending = st.session_state.session_token
+                    st.success(f"Welcome, {user_name} ({role})!")
+                    st.rerun()
+
+                else:
+                    st.error("Invalid email or password")
+
+    # Track Applications Page
+    elif menu == "Track Applications":
+        st.subheader("Track Your Applications")
+
+        pending = writebehind.pending_submissions(st.session_state.user_name)
+        if pending:
+            st.info(f"{pending} recent submission(s) are still being saved and will appear here shortly.")
+        for ticket, complaint_type, _ in writebehind.failed_submissions(st.session_state.user_name):
+            st.error(f"Ticket {ticket} ({complaint_type.replace('_', ' ')}) could not be saved. "
+                     f"Please submit it again or contact the helpdesk.")
+
+        section = st.radio("Application Type", list(APPLICATION_SECTIONS), horizontal=True)
+        # Only the selected section is read, and after the first load only its changes
+        complaints = {APPLICATION_SECTIONS[section]: tracked_applications(APPLICATION_SECTIONS[section])}
+
+        if section == "Lost & Found":
+            st.write("### Lost & Found Complaints")
+            if complaints['lost_found']:
+                for complaint in complaints['lost_found']:
+                    id, train_number, compartment_number, seat_number, \
+                    item_description, phone_number, status, created_at, \
+                    volunteer_name, volunteer_phone, volunteer_email, assigned_at = complaint
+
+                    with st.expander(f"Complaint Status: {status} - {created_at}"):
+                        st.write(f"**Train Number:** {train_number}")
+                        st.write(f"**Compartment:** {compartment_number}")
+                        st.write(f"**Seat:** {seat_number}")
+                        st.write(f"**Item:** {item_description}")
+                        st.write(f"**Current Status:** {status}")
+
+                        if status == "Assigned to Volunteer" and volunteer_name:
+                            st.write("---")
+                            st.write("### Volunteer Details")
+                            st.write(f"**Name:** {volunteer_name}")
+                            st.write(f"**Contact:** {volunteer_phone}")
+                            st.write(f"**Email:** {volunteer_email}")
+                            st.write(f"**Assigned:** {assigned_at}")
+            else:
+                st.info("No Lost & Found complaints found.")
+
+        elif section == "Medical Assistance":
+            st.write("### Medical Assistance Requests")
+            if complaints['medical_assistance']:
+                for complaint in complaints['medical_assistance']:
+                    id, symptoms, station_left, arriving_station, \
+                    assistance_type, status, created_at, \
+                    volunteer_name, volunteer_phone, volunteer_email, assigned_at = complaint
+
+                    with st.expander(f"Request Status: {status} - {created_at}"):
+                        st.write(f"**Symptoms:** {symptoms}")
+                        st.write(f"**Last Station:** {station_left}")
+                        st.write(f"**Arriving Station:** {arriving_station}")
+                        st.write(f"**Assistance Type:** {assistance_type}")
+                        st.write(f"**Current Status:** {status}")
+
+                        if status == "Assigned to Volunteer" and volunteer_name:
+                            st.write("---")
+                            st.write("### Volunteer Details")
+                            st.write(f"**Name:** {volunteer_name}")
+                            st.write(f"**Contact:** {volunteer_phone}")
+                            st.write(f"**Email:** {volunteer_email}")
+                            st.write(f"**Assigned:** {assigned_at}")
+            else:
+                st.info("No Medical Assistance requests found.")
+
+        elif section == "Women's Safety":
+            st.write("### Women's Safety Requests")
+            if complaints['womens_safety']:
+                for complaint in complaints['womens_safety']:
+                    id, boarding_station, destination_station, \
+                    time_of_boarding, phone_number, status, created_at, \
+                    volunteer_name, volunteer_phone, volunteer_email, assigned_at = complaint
+
+                    with st.expander(f"Request Status: {status} - {created_at}"):
+                        st.write(f"**Boarding Station:** {boarding_station}")
+                        st.write(f"**Destination Station:** {destination_station}")
+                        st.write(f"**Time of Boarding:** {time_of_boarding}")
+                        st.write(f"**Current Status:** {status}")
+
+                        if status == "Assigned to Volunteer" and volunteer_name:
+                            st.write("---")
+                            st.write("### Volunteer Details")
+                            st.write(f"**Name:** {volunteer_name}")
+                            st.write(f"**Contact:** {volunteer_phone}")
+                            st.write(f"**Email:** {volunteer_email}")
+                            st.write(f"**Assigned:** {assigned_at}")
+            else:
+                st.info("No Women's Safety requests found.")
+
+        elif section == "Travel Companions":
+            st.write("### Travel Companion Requests")
+            companion_requests = complaints['travel_companions']
+
+            if companion_requests:
+                sent_requests = []
+                received_requests = []
+
+                for request in companion_requests:
+                    (id, requester, companion, boarding, destination, 
+                     date, time, status, created_at, requester_phone, companion_phone) = request
+
+                    # Separate requests into sent and received
+                    if requester == st.session_state.user_name:
+                        sent_requests.append(request)
+                    else:
+                        received_requests.append(request)
+
+                # Display Received Requests
+                st.write("#### Received Requests")
+                if received_requests:
+                    for request in received_requests:
+                        (id, requester, companion, boarding, destination, 
+                         date, time, status, created_at, requester_phone, companion_phone) = request
+
+                        with st.expander(f"Request from {requester} - {status}"):
+                            st.write(f"**Route:** {boarding} to {destination}")
+                            st.write(f"**Date:** {date}")
+                            st.write(f"**Time:** {time}")
+
+                            if status == 'Pending':
+                                col1, col2 = st.columns(2)
+                                with col1:
+                                    if st.button("Accept", key=f"accept_{id}"):
+                                        respond_to_companion_request(id, True, st.session_state.user_phone)
+                                        st.success("Request accepted!")
+                                        st.rerun()
+                                with col2:
+                                    if st.button("Reject", key=f"reject_{id}"):
+                                        respond_to_companion_request(id, False)
+                                        st.success("Request rejected!")
+                                        st.rerun()
+                            elif status == 'Accepted':
+                                st.write("#### Contact Details")
+                                st.write(f"**Requester Phone:** {requester_phone}")
+                else:
+                    st.info("No received requests.")
+
+                # Display Sent Requests
+                st.write("#### Sent Requests")
+                if sent_requests:
+                    for request in sent_requests:
+                        (id, requester, companion, boarding, destination, 
+                         date, time, status, created_at, requester_phone, companion_phone) = request
+
+                        with st.expander(f"Request to {companion} - {status}"):
+                            st.write(f"**Route:** {boarding} to {destination}")
+                            st.write(f"**Date:** {date}")
+                            st.write(f"**Time:** {time}")
+                            st.write(f"**Status:** {status}")
+
+                            if status == 'Accepted':
+                                st.write("#### Contact Details")
+                                st.write(f"**Companion Phone:** {companion_phone}")
+                else:
+                    st.info("No sent requests.")
+            else:
+                st.info("No travel companion requests found.")
+
+        tracked = st.session_state[f"applications_{st.session_state.user_name}_{APPLICATION_SECTIONS[section]}"]
+        if tracked['cursor'] is not None:
+            auto_refresh(lambda: changed_since(APPLICATION_SECTIONS[section], tracked['cursor'],
+                                               st.session_state.user_name))
+
+    elif menu == "Analytics Dashboard":
+        add_analytics_dashboard()
+
+    # Home Page
+    elif st.session_state.logged_in and menu == "Home":
+        if st.session_state.role == "USER":
+            st.subheader(f"Welcome {st.session_state.user_name} ({st.session_state.role})")
+
+            tab1, tab2, tab3 = st.tabs(["Lost & Found", "Medical Assistance", "Women's Safety Travel"])
+
+            with tab1:
+                st.write("### Lost & Found")
+                with st.form("lost_found_form"):
+                    train_number = st.text_input("Train Number or Name",
+                                                 max_chars=max_chars('lost_found', 'train_number'))
+                    compartment_number = st.text_input("Compartment Number",
+                                                       max_chars=max_chars('lost_found', 'compartment_number'))
+                    seat_number = st.text_input("Seat Number", max_chars=max_chars('lost_found', 'seat_number'))
+                    item_description = st.text_area("Item Description",
+                                                    max_chars=max_chars('lost_found', 'item_description'))
+                    phone_number = st.text_input("Your Phone Number", value=st.session_state.user_phone,
+                                                 max_chars=max_chars('lost_found', 'phone_number'))
+                    submitted = st.form_submit_button("Submit")
+                    if submitted and all([train_number, compartment_number, seat_number, item_description, phone_number]):
+                        submit_form('lost_found', {
+                            'user_name': st.session_state.user_name, 'train_number': train_number,
+                            'compartment_number': compartment_number, 'seat_number': seat_number,
+                            'item_description': item_description, 'phone_number': phone_number,
+                        }, "Lost & Found request submitted successfully!")
+
+            with tab2:
+                st.write("### Medical Assistance")
+                with st.form("medical_assistance_form"):
+                    symptoms = st.text_area("Symptoms", max_chars=max_chars('medical_assistance', 'symptoms'))
+                    station_left = station_input("Last Station Left")
+                    arriving_station = station_input("Arriving Station")
+                    assistance_type = st.radio("Do you need assistance?", ["Ambulance Assistance", "Volunteer Assistance"])
+                    submitted = st.form_submit_button("Submit")
+                    if submitted and all([symptoms, station_left, arriving_station, assistance_type]):
+                        submit_form('medical_assistance', {
+                            'user_name': st.session_state.user_name, 'symptoms': symptoms,
+                            'station_left': station_left, 'arriving_station': arriving_station,
+                            'assistance_type': assistance_type,
+                        }, "Medical assistance request submitted successfully!", immediate=writebehind.MEDICAL_IMMEDIATE)
+
+            with tab3:
+                st.write("### Women's Safety Travel")
+                with st.form("womens_safety_form"):
+                    boarding_station = station_input("Boarding Station")
+                    destination_station = station_input("Destination Station")
+                    travel_date = st.date_input("Date of Travel")
+                    time_of_boarding = st.time_input("Time of Boarding")
+                    phone_number = st.text_input("Your Phone Number", value=st.session_state.user_phone,
+                                                 max_chars=max_chars('womens_safety', 'phone_number'))
+                    looking_for_companion = st.checkbox("Looking for Travel Companion?")
+
+                    submitted = st.form_submit_button("Submit")
+                    if submitted and all([boarding_station, destination_station, time_of_boarding, phone_number]):
+                        submit_form('womens_safety', {
+                            'user_name': st.session_state.user_name,
+                            'boarding_station': boarding_station,
+                            'destination_station': destination_station,
+                            'time_of_boarding': time_of_boarding.strftime("%H:%M"),
+                            'phone_number': phone_number,
+                            'travel_date': travel_date,
+                            'looking_for_companion': looking_for_companion,
+                        }, "Women's Safety Travel details submitted successfully!")
+
+                if looking_for_companion:
+                    st.write("### Available Travel Companions")
+                    companions = find_travel_companions(boarding_station, destination_station, travel_date,
+                                                        time_of_boarding.strftime("%H:%M"),
+                                                        exclude_user=st.session_state.user_name)
+
+                    if companions:
+                        st.write("Found potential travel companions on your route:")
+                        for companion in companions:
+                            with st.expander(f"Traveller: {companion.user_name}"):
+                                st.write(f"**Journey:** {companion.boarding_station} to {companion.destination_station}")
+                                st.write(f"**Boarding Time:** {companion.time_of_boarding}")
+                                if companion.minutes_apart is not None:
+                                    st.write(f"**Time Apart:** about {companion.minutes_apart} min")
+                                if not companion.same_route:
+                                    st.write(f"**Shared Stops:** {companion.shared_stops}")
+                                st.write(f"**Contact:** {companion.phone_number}")
+                                if st.button("Request to Travel Together", key=f"companion_{companion.id}"):
+                                    request_companion(companion.id, st.session_state.user_name, st.session_state.user_phone)
+                                    st.success("Request sent successfully!")
+                    else:
+                        st.info("No travel companions found for your route and date. Your request has been posted for others to find.")
+
+        # Volunteer Dashboard
+        elif st.session_state.role == "VOLUNTEER":
+            st.subheader("Volunteer Dashboard")
+
+            tab1, tab2, tab3 = st.tabs(["Lost & Found", "Medical Assistance", "Women's Safety"])
+
+            with tab1:
+                st.write("### Lost & Found Complaints")
+                with st.expander("Register a Found Item"):
+                    with st.form("found_item_form"):
+                        found_train = st.text_input("Train Number or Name", max_chars=50)
+                        found_compartment = st.text_input("Compartment Number", max_chars=50)
+                        found_description = st.text_area("Item Description")
+                        found_on = st.date_input("Found On")
+                        if st.form_submit_button("Register") and all([found_train, found_description]):
+                            found_at = datetime.datetime.combine(found_on, datetime.datetime.now().time())
+                            found_item_id, match = register_found_item(found_train, found_compartment, found_description,
+                                                                       st.session_state.user_name, found_at)
+                            if match:
+                                st.success(f"Found item #{found_item_id} matches report #{match.complaint_id}, "
+                                           f"which is now marked Found.")
+                            else:
+                                st.info(f"Found item #{found_item_id} registered. No open report matches it yet; "
+                                        f"new reports are checked against it as they come in.")
+                search_query = st.text_input("Search items, trains or compartments", key="lf_search").strip()
+                if search_query:
+                    matches = search_lost_found(search_query)
+                    st.caption(f"{len(matches)} matching reports, best first")
+                    for complaint in matches:
+                        lost_found_card(complaint)
+                else:
+                    with st.expander("Filters"):
+                        since, until = date_range_filter("lf_filter_dates")
+                        filters = {
+                            'train_number': st.text_input("Train Number", key="lf_filter_train").strip() or None,
+                            'since': since,
+                            'until': until,
+                        }
+                    claim_controls("lost_found", "lf_queue", filters)
+                    complaints, next_cursor = queue_page("lost_found", "lf_queue", filters)
+                    for complaint in complaints:
+                        lost_found_card(complaint)
+                    queue_navigation("lf_queue", next_cursor)
+
+            with tab2:
+                st.write("### Medical Assistance Requests")
+                with st.expander("Filters"):
+                    since, until = date_range_filter("ma_filter_dates")
+                    assistance_type = st.selectbox("Assistance Type", ["Any", "Ambulance Assistance", "Volunteer Assistance"],
+                                                   key="ma_filter_type")
+                    filters = {
+                        'station': st.text_input("Station", key="ma_filter_station").strip() or None,
+                        'assistance_type': None if assistance_type == "Any" else assistance_type,
+                        'since': since,
+                        'until': until,
+                    }
+                claim_controls("medical_assistance", "ma_queue", filters)
+                complaints, next_cursor = queue_page("medical_assistance", "ma_queue", filters)
+                for complaint in complaints:
+                    id, user_name, symptoms, station_left, arriving_station, \
+                    assistance_type, status, created_at = complaint
+
+                    with st.expander(f"Medical Assistance - {status} (by {user_name}) - {created_at}"):
+                        st.write(f"**Symptoms:** {symptoms}")
+                        st.write(f"**Last Station:** {station_left}")
+                        st.write(f"**Arriving Station:** {arriving_station}")
+                        st.write(f"**Assistance Type:** {assistance_type}")
+                        st.write(f"**Current Status:** {status}")
+
+                        if status != "Resolved":
+                            status_options = [
+                                'Pending',
+                                'Received',
+                                'Assigned to Volunteer',
+                                'In Progress',
+                                'Out for Assistance',
+                                'Resolved'
+                            ]
+                            new_status = st.selectbox(
+                                "Update Status",
+                                status_options,
+                                key=f"ma_status_{id}"
+                            )
+
+                            if new_status == "Assigned to Volunteer":
+                                volunteer_details = {
+                                    'name': st.session_state.user_name,
+                                    'phone': st.session_state.user_phone,
+                                    'email': st.session_state.user_email
+                                }
+                            else:
+                                volunteer_details = None
+
+                            if st.button(f"Update Status", key=f"ma_{id}"):
+                                change_status("medical_assistance", id, new_status, volunteer_details)
+                queue_navigation("ma_queue", next_cursor)
+
+            with tab3:
+                st.write("### Women's Safety Travel Requests")
+                with st.expander("Filters"):
+                    since, until = date_range_filter("ws_filter_dates")
+                    filters = {
+                        'station': st.text_input("Station", key="ws_filter_station").strip() or None,
+                        'since': since,
+                        'until': until,
+                    }
+                claim_controls("womens_safety", "ws_queue", filters)
+                complaints, next_cursor = queue_page("womens_safety", "ws_queue", filters)
+                for complaint in complaints:
+                    id, user_name, boarding_station, destination_station, \
+                    time_of_boarding, phone_number, status, created_at = complaint
+
+                    with st.expander(f"Women's Safety - {status} (by {user_name}) - {created_at}"):
+                        st.write(f"**Boarding Station:** {boarding_station}")
+                        st.write(f"**Destination Station:** {destination_station}")
+                        st.write(f"**Time of Boarding:** {time_of_boarding}")
+                        st.write(f"**Phone Number:** {phone_number}")
+                        st.write(f"**Current Status:** {status}")
+
+                        if status != "Resolved":
+                            status_options = [
+                                'Pending',
+                                'Received',
+                                'Group Created',
+                                'RPF Informed',
+                                'Resolved'
+                            ]
+                            new_status = st.selectbox(
+                                "Update Status",
+                                status_options,
+                                key=f"ws_status_{id}"
+                            )
+
+                            if new_status == "Assigned to Volunteer":
+                                volunteer_details = {
+                                    'name': st.session_state.user_name,
+                                    'phone': st.session_state.user_phone,
+                                    'email': st.session_state.user_email
+                                }
+                            else:
+                                volunteer_details = None
+
+                            if st.button(f"Update Status", key=f"ws_{id}"):
+                                change_status("womens_safety", id, new_status, volunteer_details)
+                queue_navigation("ws_queue", next_cursor)
+
+            queue_pages = [(table_name, st.session_state[f"{key}_page"])
+                             for table_name, key in zip(COMPLAINT_TABLES, ["lf_queue", "ma_queue", "ws_queue"])
+                             if f"{key}_page" in st.session_state]
+            auto_refresh(lambda: any(changed_since(table_name, held['cursor'], claims_since=held['cursor'])
+                                     for table_name, held in queue_pages))
+
+    # Logout
+    elif menu == "Logout":
+        # Revoked server-side: a copy of the token left in the browser no longer logs in
+        if st.session_state.session_token:
+            end_session(st.session_state.session_token)
+        st.session_state.session_token = None
+        st.session_state.cookie_pending = ''
+        st.session_state.logged_in = False
+        st.session_state.user_id = None
+        st.session_state.user_name = ""
+        st.session_state.user_phone = ""
+        st.session_state.user_email = ""
+        st.session_state.role = ""
+        st.success("Logged out successfully.")
+        st.rerun()
+finally:
+    # Also runs when st.rerun() or st.stop() ends the script early
+    page_render.done()
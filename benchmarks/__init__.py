@@ -0,0 +1 @@
+"""Throughput benchmarks for the KHOJ data layer (run each module with python -m)"""
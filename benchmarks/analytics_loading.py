@@ -0,0 +1,80 @@
+"""Load time and peak memory of the analyze_* frames on a large table
+
+    python -m benchmarks.analytics_loading [--rows 2000000] [--db /tmp/khoj-analytics.sqlite3]
+
+Linux only (reads /proc). Seeds a SQLite database (once; reused on later runs) with synthetic
+complaints, then loads the medical_assistance frame in a fresh process per
+loader, so each reports its own peak RSS:
+
+  fetchall   every column through fetchall() into an object DataFrame
+  streamed   load_frame(): chunked fetchmany, categorical/integer dtypes
+  columns    load_frame() with only station_left and hour_of_day
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+LOADERS = ['fetchall', 'streamed', 'columns']
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 2**20
+
+
+def measure(loader):
+    import pandas as pd
+
+    from khoj import analytics, db
+
+    baseline = current_rss_mb()
+    started = time.perf_counter()
+    if loader == 'fetchall':
+        spec = analytics.FRAME_COLUMNS['medical_assistance']
+        with db.transaction() as cursor:
+            cursor.execute(f"SELECT {', '.join(sql for sql, _ in spec.values())} FROM medical_assistance")
+            frame = pd.DataFrame(cursor.fetchall(), columns=list(spec))
+    elif loader == 'streamed':
+        frame = analytics.load_frame('medical_assistance')
+    else:
+        frame = analytics.load_frame('medical_assistance', ('station_left', 'hour_of_day'))
+    elapsed = time.perf_counter() - started
+    print(f"{loader:<9} {len(frame):>9} rows  {elapsed:6.2f}s  "
+          f"frame {frame.memory_usage(deep=True).sum() / 2**20:7.1f} MB  "
+          f"peak RSS +{peak_rss_mb() - baseline:7.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000, help="rows per complaint table")
+    parser.add_argument('--db', default='/tmp/khoj-analytics.sqlite3')
+    parser.add_argument('--measure', choices=LOADERS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    os.environ['KHOJ_DB_BACKEND'] = 'sqlite'
+    os.environ['KHOJ_SQLITE_PATH'] = args.db
+    if args.measure:
+        measure(args.measure)
+        return 0
+
+    if not os.path.exists(args.db):
+        from khoj import migrations, plancheck
+        started = time.perf_counter()
+        migrations.migrate()
+        plancheck.seed(args.rows)
+        print(f"seeded {args.rows} rows per table in {time.perf_counter() - started:.0f}s")
+    for loader in LOADERS:
+        subprocess.run([sys.executable, '-m', 'benchmarks.analytics_loading', '--db', args.db,
+                        '--measure', loader], check=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Volunteer queue timings before and after archiving, and a check that history reads are unchanged
+
+    python -m benchmarks.archive [--scale 100000] [--days 180] [--repeat 3]
+    KHOJ_DB_NAME=khoj_scratch python -m benchmarks.archive --backend mysql --scale 1000000
+
+Uses a copy of the benchmarks.synthetic database of the scale (generated the
+first time, as for benchmarks.suite), times the volunteer queues and the
+history reads of benchmarks.suite, archives every complaint resolved more
+than --days ago with khoj.archive and times them again. Fails (exit 1) if a
+history read (Track Applications, the analytics) returns something different
+after archiving.
+
+The MySQL variant archives the configured database in place, so only point it
+at a scratch one.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks import suite, synthetic
+from benchmarks.snapshot import ANALYTICS_CASES, _comparable
+
+QUEUE_CASES = ('get_lost_found_complaints', 'get_medical_assistance_complaints', 'get_womens_safety_complaints')
+HISTORY_CASES = ('get_user_complaints', 'get_companion_requests') + ANALYTICS_CASES
+
+
+def _copy(source, target):
+    with sqlite3.connect(source) as database, sqlite3.connect(target) as copy:
+        database.backup(copy)
+
+
+def timed_cases(generator, repeat):
+    """{name: (median seconds, comparable result or None)} for the queue and history cases"""
+    results = {}
+    for name, function, args in suite.cases(generator):
+        if not name.startswith(QUEUE_CASES + HISTORY_CASES):
+            continue
+        median = suite.measure(function, args, repeat)['median']
+        results[name] = (median, _comparable(function(*args)) if name.startswith(HISTORY_CASES) else None)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=100000, help="rows per complaint table")
+    parser.add_argument('--seed', type=int, default=18)
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--db', help="SQLite path (default /tmp/khoj-bench-<scale>.sqlite3)")
+    parser.add_argument('--days', type=int, default=180, help="archive complaints resolved more than this "
+                                                               "many days ago")
+    parser.add_argument('--batch', type=int, default=1000, help="complaints per archiving transaction")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from khoj import archive, db
+    path = args.db or f'/tmp/khoj-bench-{args.scale}.sqlite3'
+    synthetic.configure(args.backend, path, args.scale, args.seed)
+    generator = synthetic.Generator(args.scale, args.seed)
+    failures = []
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.backend == 'sqlite':
+            db.get_pool().close()
+            _copy(path, os.path.join(scratch, 'archive.sqlite3'))
+            db.configure('sqlite', os.path.join(scratch, 'archive.sqlite3'))
+        before = timed_cases(generator, args.repeat)
+        started = time.perf_counter()
+        moved = archive.run(args.days, args.batch, pause=0)
+        print(f"archived {sum(moved.values())} complaints in {time.perf_counter() - started:.2f}s")
+        for table, (live, archived) in archive.status().items():
+            print(f"{table:<22} {live:>10} live {archived:>10} archived")
+        after = timed_cases(generator, args.repeat)
+        db.get_pool().close()
+    print(f"{'case':<48} {'before':>12} {'after':>12}")
+    for name, (seconds, result) in before.items():
+        print(f"{name:<48} {seconds * 1e3:9.1f} ms {after[name][0] * 1e3:9.1f} ms")
+        if result is not None and after[name][1] != result:
+            failures.append(f"{name} differs after archiving")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
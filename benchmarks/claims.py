@@ -0,0 +1,145 @@
+"""Stress check for volunteer claims: many volunteers draining one queue at once
+
+    python -m benchmarks.claims [--complaints 2000] [--volunteers 16] [--batch 5]
+    KHOJ_DB_NAME=khoj_scratch python -m benchmarks.claims --backend mysql
+
+Seeds open medical assistance requests into a scratch database, then runs one
+thread per volunteer that claims a batch (khoj.complaints.claim_complaints),
+assigns itself every complaint it got and claims again until the queue is
+empty. Fails (exit 1) if any complaint was handed to two volunteers, was
+assigned twice or was never claimed. A second round checks that an abandoned
+claim is hidden from other volunteers until its lease runs out.
+
+The MySQL variant writes into the configured database, so only point it at a
+scratch one.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from khoj import db
+
+TABLE = 'medical_assistance'
+
+
+def seed(complaints, prefix):
+    start = datetime.now() - timedelta(hours=complaints)
+    with db.transaction() as cursor:
+        cursor.executemany("""
+            INSERT INTO medical_assistance
+            (user_name, symptoms, station_left, arriving_station, assistance_type, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [(f'{prefix}_{number}', 'fever', 'Dadar', 'Thane', 'Volunteer Assistance',
+               'Pending' if number % 3 else 'Received', start + timedelta(hours=number))
+              for number in range(complaints)])
+        cursor.execute("SELECT id FROM medical_assistance WHERE user_name LIKE %s", (f'{prefix}_%',))
+        return {row[0] for row in cursor.fetchall()}
+
+
+def drain(volunteers, batch):
+    """Every volunteer claims and assigns until nothing is left; returns ([(id, volunteer)], conflicts, seconds)"""
+    from khoj.complaints import ComplaintClaimed, claim_complaints, update_complaint_status
+    claims, conflicts, lock = [], [], threading.Lock()
+
+    def volunteer(number):
+        email = f'stress_{number}@khoj.in'
+        details = {'name': f'stress_{number}', 'phone': '9100000000', 'email': email}
+        while True:
+            rows = claim_complaints(TABLE, email, batch)
+            if not rows:
+                return
+            with lock:
+                claims.extend((row[0], email) for row in rows)
+            for row in rows:
+                try:
+                    update_complaint_status(TABLE, row[0], 'Assigned to Volunteer', email, details)
+                except ComplaintClaimed as error:
+                    with lock:
+                        conflicts.append(str(error))
+
+    threads = [threading.Thread(target=volunteer, args=(number,)) for number in range(volunteers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return claims, conflicts, time.perf_counter() - started
+
+
+def check_drain(ids, claims, conflicts):
+    failures = []
+    claimed = Counter(complaint_id for complaint_id, _ in claims)
+    doubled = [complaint_id for complaint_id, count in claimed.items() if count > 1]
+    if doubled:
+        failures.append(f"{len(doubled)} complaints claimed more than once, e.g. #{doubled[0]}")
+    if set(claimed) != ids:
+        failures.append(f"{len(ids - set(claimed))} complaints never claimed")
+    if conflicts:
+        failures.append(f"{len(conflicts)} assignments refused: {conflicts[0]}")
+    with db.transaction() as cursor:
+        cursor.execute(f"""
+            SELECT complaint_id, COUNT(*) FROM volunteer_assignments
+            WHERE complaint_type = %s AND complaint_id IN ({', '.join(['%s'] * len(ids))})
+            GROUP BY complaint_id
+        """, (TABLE, *ids))
+        assigned = dict(cursor.fetchall())
+    twice = [complaint_id for complaint_id, count in assigned.items() if count > 1]
+    if twice:
+        failures.append(f"{len(twice)} complaints assigned more than once, e.g. #{twice[0]}")
+    if len(assigned) != len(ids):
+        failures.append(f"{len(ids) - len(assigned)} complaints never assigned")
+    return failures
+
+
+def check_lease(lease):
+    """An abandoned claim stays hidden until it expires, then goes to the next volunteer"""
+    from khoj.complaints import claim_complaints
+    failures = []
+    ids = seed(3, 'lease')
+    held = {row[0] for row in claim_complaints(TABLE, 'leaver@khoj.in', 3, lease=lease)}
+    if held != ids:
+        failures.append(f"first claim got {sorted(held)}, expected {sorted(ids)}")
+    if claim_complaints(TABLE, 'waiter@khoj.in', 3):
+        failures.append("a live claim was handed to another volunteer")
+    # Leases are database time, which counts whole seconds
+    time.sleep(lease + 1.1)
+    taken = {row[0] for row in claim_complaints(TABLE, 'waiter@khoj.in', 3)}
+    if taken != ids:
+        failures.append(f"after the lease ran out the next claim got {sorted(taken)}, expected {sorted(ids)}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--complaints', type=int, default=2000)
+    parser.add_argument('--volunteers', type=int, default=16)
+    parser.add_argument('--batch', type=int, default=5)
+    parser.add_argument('--lease', type=float, default=1.0, help="seconds, for the expiry check")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db.configure(args.backend, os.path.join(scratch, 'claims.sqlite3'))
+        from khoj.migrations import migrate
+        migrate()
+        ids = seed(args.complaints, 'stress')
+        claims, conflicts, seconds = drain(args.volunteers, args.batch)
+        print(f"{args.volunteers} volunteers claimed {len(claims)} of {len(ids)} complaints in {seconds:.2f}s "
+              f"({len(claims) / seconds:.0f} claims/s, batches of {args.batch})")
+        failures = check_drain(ids, claims, conflicts) + check_lease(args.lease)
+        db.get_pool().close()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        return 1
+    print("no complaint was claimed or assigned twice; expired claims were handed on")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Travel-companion match latency against a large in-memory index
+
+    python -m benchmarks.companion_matching [--requests 300000] [--queries 20000] [--days 30]
+
+Builds a CompanionIndex from synthetic open requests spread over the
+suburban lines and `--days` travel dates, then times match() calls and
+incremental add/discard. Stations are looked up in the registry of a scratch
+SQLite database (khoj.stations).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from khoj import db
+from khoj.companions import CompanionIndex, OpenJourney
+from khoj.stations import LINES
+
+
+def synthetic_journeys(count, days, seed_value=11):
+    rng = random.Random(seed_value)
+    lines = list(LINES.values())
+    start = date.today()
+    for request_id in range(1, count + 1):
+        stations = rng.choice(lines)
+        boarding, destination = rng.sample(stations, 2)
+        yield OpenJourney(request_id, f'user_{request_id % 5000}', boarding, destination,
+                          f'{rng.randrange(5, 24):02d}:{rng.randrange(60):02d}', '9000000000',
+                          start + timedelta(days=rng.randrange(days)))
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300000, help="open requests in the index")
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=30, help="distinct travel dates")
+    parser.add_argument('--window', type=int, default=None, help="minutes either side")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db.configure('sqlite', os.path.join(scratch, 'stations.sqlite3'))
+        from khoj.migrations import migrate
+        migrate()
+        return run(args)
+
+
+def run(args):
+    index = CompanionIndex()
+    started = time.perf_counter()
+    index.load(synthetic_journeys(args.requests, args.days))
+    print(f"built index of {len(index)} requests in {time.perf_counter() - started:.2f}s")
+
+    queries = list(synthetic_journeys(args.queries, args.days, seed_value=29))
+    latencies, matches = [], 0
+    for query in queries:
+        started = time.perf_counter()
+        found = index.match(query.boarding_station, query.destination_station, query.travel_date,
+                            query.time_of_boarding, args.window)
+        latencies.append(time.perf_counter() - started)
+        matches += len(found)
+    print(f"match       p50 {statistics.median(latencies) * 1e6:7.1f} us   "
+          f"p99 {percentile(latencies, 0.99) * 1e6:7.1f} us   "
+          f"avg {matches / len(queries):.1f} companions")
+
+    additions = [query._replace(id=args.requests + query.id) for query in queries]
+    started = time.perf_counter()
+    for journey in additions:
+        index.add(journey)
+    added = time.perf_counter() - started
+    started = time.perf_counter()
+    for journey in additions:
+        index.discard(journey.id)
+    discarded = time.perf_counter() - started
+    print(f"add         {added / len(additions) * 1e6:7.1f} us each")
+    print(f"discard     {discarded / len(additions) * 1e6:7.1f} us each")
+    db.get_pool().close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Per-station seasonal forecasts: backtest error and runtime on synthetic series
+
+    python -m benchmarks.forecasting [--stations 1500] [--days 365] [--horizon 7]
+
+Generates daily complaints for every station and complaint type (Poisson
+counts around a per-series level with a drifting trend, day-of-week and
+hour-of-day seasonality), runs the rolling-origin backtest of
+khoj.forecast against the flat 7-day mean, and times one hourly forecast of
+every series.
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from khoj.forecast import CHUNK_DAYS, SeasonalForecaster, backtest
+
+TYPES = ['lost_found', 'medical_assistance', 'womens_safety']
+
+
+def synthetic_counts(stations, days, seed_value=16):
+    """counts[day, series, hour] for len(TYPES) * stations series"""
+    rng = np.random.default_rng(seed_value)
+    series = len(TYPES) * stations
+    level = rng.lognormal(mean=0.5, sigma=1.0, size=series)
+    # Busier on weekdays (or weekends) by station, in a few broad shapes
+    weekly = np.array([[1.1, 1.1, 1.1, 1.1, 1.2, 0.7, 0.7],
+                       [0.9, 0.9, 0.9, 1.0, 1.1, 1.2, 1.0],
+                       [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0]])
+    weekday = weekly[rng.integers(len(weekly), size=series)] * rng.uniform(0.9, 1.1, size=(series, 7))
+    peaks = rng.choice([9, 18, 21], size=series)
+    distance = np.minimum(np.abs(np.arange(24)[None, :] - peaks[:, None]),
+                          24 - np.abs(np.arange(24)[None, :] - peaks[:, None]))
+    hours = np.exp(-distance ** 2 / 18) + 0.05
+    hours /= hours.sum(axis=1, keepdims=True)
+    trend = np.exp(np.cumsum(rng.normal(0, 0.01, size=(days, series)), axis=0))
+    first = date(2025, 1, 1)
+    weekdays = (first.weekday() + np.arange(days)) % 7
+    expected = level[None, :] * trend * weekday[:, weekdays].T
+    return first, rng.poisson(expected[:, :, None] * hours[None, :, :]).astype(np.float64)
+
+
+def blocks(first, counts):
+    for start in range(0, len(counts), CHUNK_DAYS):
+        yield first + timedelta(days=start), counts[start:start + CHUNK_DAYS]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=1500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--horizon', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    first, counts = synthetic_counts(args.stations, args.days)
+    print(f"generated {counts.shape[1]} series over {args.days} days in {time.perf_counter() - started:.1f}s")
+
+    model = SeasonalForecaster()
+    model.series_ids([(complaint_type, f'station {number}')
+                      for complaint_type in TYPES for number in range(args.stations)])
+    result = backtest(blocks(first, counts), args.horizon, model=model)
+    print(f"backtest over {result.days} days: MAE {result.mae:.3f} (flat 7-day mean {result.naive_mae:.3f}), "
+          f"WAPE {result.wape:.1f}% ({result.naive_wape:.1f}%)")
+    print(f"folded {args.days} days in {result.fold_seconds:.2f}s "
+          f"({result.fold_seconds / args.days * 1e3:.1f} ms per day)")
+
+    started = time.perf_counter()
+    hourly = model.forecast_hourly(model.through + timedelta(days=1), args.horizon)
+    elapsed = time.perf_counter() - started
+    print(f"hourly forecast of {hourly.shape[0]} series x {args.horizon} days in {elapsed * 1e3:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
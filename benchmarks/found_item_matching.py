@@ -0,0 +1,91 @@
+"""Found-item matching throughput with blocking keys
+
+    python -m benchmarks.found_item_matching [--reports 1000000] [--items 100000] [--trains 2000]
+
+Generates a year of synthetic lost reports and found items (a share of the
+items are copies of real reports, reworded, on a nearby day), blocks the
+reports by train and day, and pairs every item. Also times brute-force
+scoring of a sample of items against every report, to show what blocking
+saves, and how many planted pairs were recovered.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from khoj.matching import ItemRecord, ReportBlocks, match_score, pair
+
+COLOURS = ['black', 'blue', 'brown', 'grey', 'red', 'white', 'green', 'silver']
+MATERIALS = ['', '', 'leather', 'plastic', 'cloth', 'steel']
+ITEMS = ['bag', 'wallet', 'phone', 'umbrella', 'water bottle', 'laptop', 'spectacles', 'earphones',
+         'watch', 'keys', 'tiffin box', 'jacket', 'shawl', 'charger', 'power bank', 'book', 'purse',
+         'id card', 'shoes', 'suitcase']
+EXTRAS = ['', '', '', 'with papers', 'with cash', 'samsung', 'small', 'new', 'old']
+
+
+def describe(rng):
+    words = [rng.choice(COLOURS), rng.choice(MATERIALS), rng.choice(ITEMS), rng.choice(EXTRAS)]
+    return ' '.join(word for word in words if word)
+
+
+def synthetic_data(reports, items, trains, planted=0.3, seed_value=17):
+    rng = random.Random(seed_value)
+    start = datetime(2025, 1, 1)
+    numbers = [str(rng.randrange(10000, 23000)) for _ in range(trains)]
+    lost = []
+    for report_id in range(1, reports + 1):
+        lost.append(ItemRecord(report_id, rng.choice(numbers), f'S{rng.randrange(1, 12)}', describe(rng),
+                               start + timedelta(seconds=rng.randrange(365 * 24 * 3600))))
+    found, truth = [], {}
+    for item_id in range(1, items + 1):
+        if rng.random() < planted:
+            report = rng.choice(lost)
+            words = report.item_description.split()
+            rng.shuffle(words)
+            found.append(ItemRecord(item_id, f'{report.train_number} Express', report.compartment_number.lower(),
+                                    ' '.join(words), report.seen_at + timedelta(hours=rng.randrange(-24, 48))))
+            truth[item_id] = report.id
+        else:
+            found.append(ItemRecord(item_id, rng.choice(numbers), f'S{rng.randrange(1, 12)}', describe(rng),
+                                    start + timedelta(seconds=rng.randrange(365 * 24 * 3600))))
+    return lost, found, truth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=1000000)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--trains', type=int, default=2000)
+    parser.add_argument('--window', type=int, default=None, help="days either side of the find")
+    parser.add_argument('--brute-force-sample', type=int, default=5, help="items scored against every report")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    lost, found, truth = synthetic_data(args.reports, args.items, args.trains)
+    print(f"generated {len(lost)} reports and {len(found)} found items in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    blocks = ReportBlocks(lost)
+    print(f"blocked reports by train and day in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    pairs = pair(found, blocks, args.window)
+    elapsed = time.perf_counter() - started
+    recovered = sum(1 for match in pairs if truth.get(match.found_item_id) == match.complaint_id)
+    print(f"paired {len(found)} items in {elapsed:.2f}s ({elapsed / len(found) * 1e6:.0f} us per item): "
+          f"{len(pairs)} matches, {recovered} of {len(truth)} planted pairs recovered")
+
+    sample = found[:args.brute_force_sample]
+    started = time.perf_counter()
+    for item in sample:
+        for report in lost:
+            match_score(item, report)
+    per_item = (time.perf_counter() - started) / len(sample)
+    print(f"brute force {per_item * 1e3:.0f} ms per item, about {per_item * len(found) / 60:.0f} min "
+          f"for every item")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Hotspot model fit time and memory on a large incident history
+
+    python -m benchmarks.hotspot_clustering [--incidents 10000000] [--clusters 12]
+
+Generates synthetic incidents (station codes, hours, weekdays) with a few
+planted station/time hotspots, fits a HotspotModel chunk by chunk as
+`khoj.hotspots.update` does, then times an incremental update. Peak RSS is
+the process high-water mark, so it includes the generated arrays.
+"""
+import argparse
+import resource
+import sys
+import time
+
+import numpy as np
+
+from khoj.hotspots import CHUNK_ROWS, OTHER, STATIONS, HotspotModel
+
+HOTSPOTS = [('Dadar', 19, 2), ('Thane', 9, 2), ('Andheri', 18, 6), ('Kurla', 8, 1)]  # station, hour, weekday
+
+
+def synthetic_incidents(count, seed_value=5):
+    rng = np.random.default_rng(seed_value)
+    stations = rng.integers(0, OTHER + 1, count, dtype=np.int16)
+    hours = rng.integers(0, 24, count).astype(np.float32)
+    weekdays = rng.integers(1, 8, count).astype(np.float32)
+    planted = rng.integers(0, len(HOTSPOTS) * 2, count)  # half the incidents fall in a hotspot
+    for index, (station, hour, weekday) in enumerate(HOTSPOTS):
+        rows = planted == index
+        stations[rows] = STATIONS.index(station)
+        hours[rows] = (hour + rng.integers(-1, 2, rows.sum())) % 24
+        weekdays[rows] = weekday
+    return stations, hours, weekdays
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--incidents', type=int, default=10000000)
+    parser.add_argument('--clusters', type=int, default=12)
+    parser.add_argument('--update', type=int, default=10000, help="incidents in the incremental update")
+    args = parser.parse_args(argv)
+
+    stations, hours, weekdays = synthetic_incidents(args.incidents + args.update)
+    print(f"generated {args.incidents} incidents, peak RSS {peak_rss_mb():.0f} MB")
+
+    model = HotspotModel(args.clusters)
+    started = time.perf_counter()
+    for start in range(0, args.incidents, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, args.incidents)
+        model.partial_fit(stations[start:end], hours[start:end], weekdays[start:end])
+    elapsed = time.perf_counter() - started
+    print(f"fitted in {elapsed:.1f}s ({args.incidents / elapsed:,.0f} incidents/s), "
+          f"peak RSS {peak_rss_mb():.0f} MB")
+
+    started = time.perf_counter()
+    model.partial_fit(stations[args.incidents:], hours[args.incidents:], weekdays[args.incidents:])
+    print(f"incremental update of {args.update} incidents in {(time.perf_counter() - started) * 1e3:.0f} ms")
+
+    for cluster in sorted(model.clusters(), key=lambda cluster: -cluster.incidents)[:len(HOTSPOTS) + 2]:
+        print(f"  {cluster.station:<12} {cluster.hour:02d}:00  day {cluster.weekday}  "
+              f"{cluster.incidents:>9} incidents")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Bulk ingestion rows per second against the row-at-a-time add_* path
+
+    python -m benchmarks.ingest_throughput [--rows 50000] [--single-rows 2000] [--batch-size 1000]
+
+Writes a synthetic lost & found CSV, loads it with khoj.ingest into a
+temporary SQLite database, and times add_lost_found (one insert and commit
+per complaint) over the first --single-rows rows of the same data.
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from khoj import db
+from khoj.complaints import add_lost_found
+from khoj.ingest import ingest
+from khoj.migrations import migrate
+
+ITEMS = ['black bag', 'phone', 'wallet', 'umbrella', 'laptop bag', 'spectacles', 'water bottle']
+
+
+def write_feed(path, rows, seed_value=3):
+    rng = random.Random(seed_value)
+    start = datetime(2025, 1, 1)
+    with open(path, 'w', newline='') as feed:
+        writer = csv.writer(feed)
+        writer.writerow(['user_name', 'train_number', 'compartment_number', 'seat_number',
+                         'item_description', 'phone_number', 'status', 'created_at'])
+        for i in range(rows):
+            writer.writerow([f'user_{rng.randrange(2000)}', str(rng.randrange(11000, 11100)),
+                             f'S{rng.randrange(1, 12)}', str(rng.randrange(1, 72)), rng.choice(ITEMS),
+                             '9000000000', rng.choice(['Pending', 'Resolved']),
+                             (start + timedelta(seconds=rng.randrange(365 * 86400))).isoformat(sep=' ')])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000, help="rows in the bulk feed")
+    parser.add_argument('--single-rows', type=int, default=2000, help="rows loaded one at a time")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='khoj-ingestbench-')
+    feed = os.path.join(workdir, 'feed.csv')
+    write_feed(feed, args.rows)
+    db.configure('sqlite', os.path.join(workdir, 'bench.sqlite3'))
+    migrate()
+
+    with open(feed, newline='') as rows:
+        sample = [row for _, row in zip(range(args.single_rows), csv.DictReader(rows))]
+    started = time.perf_counter()
+    for row in sample:
+        add_lost_found(row['user_name'], row['train_number'], row['compartment_number'],
+                       row['seat_number'], row['item_description'], row['phone_number'])
+    single = len(sample) / (time.perf_counter() - started)
+    print(f"row at a time   {single:9.0f} rows/s   ({len(sample)} rows)")
+
+    result = ingest('lost_found', feed, batch_size=args.batch_size, rejects=False)
+    print(f"bulk ingest     {result.rows_per_second:9.0f} rows/s   ({result.inserted} rows, "
+          f"batches of {args.batch_size})   {result.rows_per_second / single:.0f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
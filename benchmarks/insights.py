@@ -0,0 +1,76 @@
+"""generate_insights() from the rollups against the pandas reference over full frames
+
+    python -m benchmarks.insights [--rows 200000] [--db /tmp/khoj-insights.sqlite3] [--repeat 3]
+
+Seeds a SQLite database (once; reused on later runs) with synthetic
+complaints and rebuilds the rollups, then checks that generate_insights()
+returns exactly what insights_from_frames() computes from the analyze_*
+frames, on the seeded tables and on empty ones, and times both.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def reference():
+    from khoj import analytics
+    return analytics.insights_from_frames(analytics.analyze_lost_found_patterns.uncached(),
+                                          analytics.analyze_medical_emergencies.uncached(),
+                                          analytics.analyze_safety_hotspots.uncached())
+
+
+def compare(label, repeat):
+    from khoj import analytics
+    expected, reference_time = best_of(repeat, reference)
+    actual, sql_time = best_of(repeat, analytics.generate_insights.uncached)
+    if actual != expected:
+        for section in expected:
+            for metric in expected[section]:
+                if actual[section][metric] != expected[section][metric]:
+                    print(f"  {section}.{metric}: frames {expected[section][metric]!r}, "
+                          f"rollups {actual[section][metric]!r}")
+        raise SystemExit(f"{label}: generate_insights() differs from the reference")
+    print(f"{label:<7} frames {reference_time * 1e3:8.1f} ms  rollups {sql_time * 1e3:6.1f} ms  "
+          f"({reference_time / sql_time:.0f}x), identical")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help="rows per complaint table")
+    parser.add_argument('--db', default='/tmp/khoj-insights.sqlite3')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from khoj import db, migrations, plancheck, rollups
+
+    with tempfile.TemporaryDirectory() as directory:
+        db.configure('sqlite', os.path.join(directory, 'empty.sqlite3'))
+        migrations.migrate()
+        compare('empty', 1)
+
+    seeded = os.path.exists(args.db)
+    db.configure('sqlite', args.db)
+    if not seeded:
+        started = time.perf_counter()
+        migrations.migrate()
+        plancheck.seed(args.rows)
+        with db.transaction() as cursor:
+            rollups.rebuild(cursor)
+        print(f"seeded {args.rows} rows per table in {time.perf_counter() - started:.0f}s")
+    compare('seeded', args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Lost & found search latency over a large synthetic history
+
+    python -m benchmarks.item_search [--reports 1000000] [--queries 500]
+
+Builds an ItemSearchIndex from synthetic reports (no database) and times
+ranked searches, including prefix queries for a half-typed last word.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from khoj.search import ItemSearchIndex
+
+COLOURS = ['black', 'brown', 'blue', 'red', 'grey', 'white', 'green', 'pink', 'silver', '']
+ITEMS = ['bag', 'laptop bag', 'phone', 'mobile phone', 'wallet', 'purse', 'umbrella', 'spectacles',
+         'water bottle', 'tiffin box', 'keys', 'earphones', 'watch', 'jacket', 'shoes', 'book',
+         'suitcase', 'passport', 'id card', 'charger', 'power bank', 'backpack', 'saree', 'toy']
+EXTRAS = ['', '', '', 'with charger', 'near window seat', 'left on rack', 'with papers inside',
+          'Samsung', 'leather', 'small', 'big', 'kids']
+
+
+def synthetic_reports(count, seed_value=5):
+    rng = random.Random(seed_value)
+    for report_id in range(1, count + 1):
+        description = ' '.join(part for part in (rng.choice(COLOURS), rng.choice(ITEMS), rng.choice(EXTRAS)) if part)
+        yield report_id, description, str(rng.randrange(11000, 13000)), f'S{rng.randrange(1, 12)}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    index = ItemSearchIndex()
+    started = time.perf_counter()
+    index.add_many(synthetic_reports(args.reports))
+    print(f"indexed {len(index)} reports in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(17)
+    queries = {
+        'one word': lambda: rng.choice(ITEMS).split()[-1],
+        'item + colour': lambda: f"{rng.choice(COLOURS[:-1])} {rng.choice(ITEMS)}",
+        'item + train': lambda: f"{rng.choice(ITEMS)} {rng.randrange(11000, 13000)}",
+        'prefix': lambda: f"{rng.choice(COLOURS[:-1])} {rng.choice(ITEMS)[:3]}",
+    }
+    for label, make_query in queries.items():
+        latencies = []
+        for _ in range(args.queries):
+            query = make_query()
+            started = time.perf_counter()
+            index.search(query, args.limit)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        print(f"{label:<14} p50 {statistics.median(latencies) * 1000:6.2f} ms   "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:6.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
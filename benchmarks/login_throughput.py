@@ -0,0 +1,78 @@
+"""Concurrent logins per second, with bcrypt in the worker pool and inline
+
+    python -m benchmarks.login_throughput [--users 20] [--logins 200] [--threads 16] [--rounds 12]
+
+Each login is a full authenticate_user call against a temporary SQLite
+database. Inline mode (KHOJ_HASH_WORKERS=0) runs bcrypt on the calling
+thread, as every login did before khoj.auth.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from khoj import auth, db
+from khoj.migrations import migrate
+from khoj.users import authenticate_user, register_user
+
+
+def seed_users(count):
+    users = [(f'bench_{i}@khoj.in', f'password-{i}') for i in range(count)]
+    for i, (email, password) in enumerate(users):
+        register_user(f'bench_{i}', email, password, '9000000000', 'USER')
+    return users
+
+
+def run_logins(users, logins, threads):
+    """Return (elapsed seconds, per-login latencies) for `logins` logins over `threads` threads"""
+    def login(i):
+        email, password = users[i % len(users)]
+        started = time.perf_counter()
+        assert authenticate_user(email, password)[0] is not None
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(login, range(logins)))
+    return time.perf_counter() - started, latencies
+
+
+def report(label, elapsed, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<12} {len(latencies) / elapsed:8.1f} logins/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16, help="concurrent sessions logging in")
+    parser.add_argument('--rounds', type=int, default=auth.BCRYPT_ROUNDS, help="bcrypt cost factor")
+    parser.add_argument('--workers', type=int, default=max(auth.HASH_WORKERS, 1),
+                        help="hash worker processes for the pooled run")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='khoj-loginbench-'), 'bench.sqlite3')
+    db.configure('sqlite', path, size=args.threads)
+    migrate()
+    auth.BCRYPT_ROUNDS = args.rounds
+    auth.LOGIN_ATTEMPTS_PER_ACCOUNT = args.logins  # measure hashing, not the throttle
+    auth.HASH_WORKERS = 0
+    users = seed_users(args.users)
+
+    print(f"{args.logins} logins, {args.threads} threads, bcrypt cost {args.rounds}")
+    report('inline', *run_logins(users, args.logins, args.threads))
+
+    auth.HASH_WORKERS = args.workers
+    auth.hash_password('warm-up')  # start the worker processes before timing
+    report(f'pool ({args.workers})', *run_logins(users, args.logins, args.threads))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Dashboard timings on the database versus the analytics snapshot, and export times
+
+    python -m benchmarks.snapshot [--scale 100000] [--repeat 3] [--writes 500]
+    KHOJ_DB_NAME=khoj_bench python -m benchmarks.snapshot --backend mysql --scale 10000000
+
+Uses the benchmarks.synthetic database of the scale (generated the first time,
+as for benchmarks.suite) and exports it in full to a scratch snapshot
+directory. Every analytics case of benchmarks.suite is then timed on both
+backends, and its results compared. Finally --writes complaints get their
+current status saved again, which leaves the data as it was but puts them on
+the change feed, and the incremental export that picks them up is timed.
+Fails (exit 1) if a case returns something different from the snapshot.
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+from benchmarks import suite, synthetic
+
+ANALYTICS_CASES = ('generate_insights', 'create_visualizations', 'predict_resource_needs', 'status_durations')
+
+
+def _comparable(result):
+    if isinstance(result, dict):
+        return {key: _comparable(value) for key, value in result.items()}
+    if hasattr(result, 'to_json'):  # DataFrames and plotly figures
+        return result.to_json()
+    return result
+
+
+def resave(writes):
+    """Save the current status of `writes` complaints per table again; returns seconds"""
+    from khoj import db
+    from khoj.complaints import COMPLAINT_TABLES, update_complaint_status
+    started = time.perf_counter()
+    for table in COMPLAINT_TABLES:
+        with db.transaction() as cursor:
+            cursor.execute(f"SELECT id, status FROM {table} ORDER BY id DESC LIMIT {int(writes)}")
+            rows = cursor.fetchall()
+        for complaint_id, status in rows:
+            update_complaint_status(table, complaint_id, status, None)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=100000, help="rows per complaint table")
+    parser.add_argument('--seed', type=int, default=18)
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--db', help="SQLite path (default /tmp/khoj-bench-<scale>.sqlite3)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--writes', type=int, default=500, help="complaints per table saved before the "
+                                                                 "incremental export")
+    args = parser.parse_args(argv)
+
+    from khoj import snapshot
+    synthetic.configure(args.backend, args.db or f'/tmp/khoj-bench-{args.scale}.sqlite3', args.scale, args.seed)
+    generator = synthetic.Generator(args.scale, args.seed)
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        tables = snapshot.export(full=True, directory=directory)
+        print(f"full export of {sum(table.rows for table in tables)} rows in {time.perf_counter() - started:.2f}s")
+        print(f"{'case':<40} {'database':>12} {'snapshot':>12}")
+        for name, function, call_args in suite.cases(generator):
+            if not name.startswith(ANALYTICS_CASES):
+                continue
+            timings = {}
+            for backend in ('database', 'snapshot'):
+                snapshot.configure(backend, directory)
+                function(*call_args)  # the snapshot's views are created on first use
+                timings[backend] = suite.measure(function, call_args, args.repeat)['median']
+                if backend == 'database':
+                    expected = _comparable(function(*call_args))
+                elif _comparable(function(*call_args)) != expected:
+                    failures.append(f"{name} differs on the snapshot")
+            print(f"{name:<40} {timings['database'] * 1e3:9.1f} ms {timings['snapshot'] * 1e3:9.1f} ms")
+        snapshot.configure('database')
+        seconds = resave(args.writes)
+        print(f"saved {args.writes} complaints per table in {seconds:.2f}s")
+        started = time.perf_counter()
+        tables = snapshot.export(directory=directory)
+        print(f"incremental export of {sum(table.changed for table in tables)} rows "
+              f"in {time.perf_counter() - started:.2f}s")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Timings of the dashboard's data functions on synthetic data, as comparable JSON
+
+    python -m benchmarks.suite [--scale 100000] [--repeat 5] [--json run.json]
+    python -m benchmarks.suite --scale 1000000 --json new.json --compare baseline.json [--tolerance 1.25]
+    KHOJ_DB_NAME=khoj_bench python -m benchmarks.suite --backend mysql --scale 10000000
+
+Generates the benchmark database with benchmarks.synthetic the first time a
+scale is used (SQLite: /tmp/khoj-bench-<scale>.sqlite3), then times every
+function KHOJ1.py reads data through. Cached dashboard functions are timed
+through .uncached. Each case runs --repeat times; the report has the
+minimum, median and maximum seconds and the size of the result.
+
+--json writes the report; --compare reads an earlier one and fails (exit 1)
+when a case's median is more than --tolerance times its baseline median.
+Only compare runs made at the same scale on the same machine.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks import synthetic
+
+
+def cases(generator):
+    """(name, function, args) for every timed function"""
+    from khoj import analytics
+    from khoj.complaints import (
+        application_changes, companion_index, feed_cursor, find_travel_companions, get_companion_requests,
+        get_lost_found_complaints, get_medical_assistance_complaints, get_user_complaints,
+        get_womens_safety_complaints
+    )
+    busiest, second = generator.stations[0], generator.stations[1]
+    tomorrow = date.today() + timedelta(days=1)
+    month_ago = date.today() - timedelta(days=29)
+    return [
+        ('get_lost_found_complaints', get_lost_found_complaints, ()),
+        ('get_medical_assistance_complaints', get_medical_assistance_complaints, ()),
+        ('get_womens_safety_complaints', get_womens_safety_complaints, ()),
+        ('get_lost_found_complaints (volunteer)', get_lost_found_complaints, ('volunteer_0@khoj.in',)),
+        ('get_medical_assistance_complaints (volunteer)', get_medical_assistance_complaints,
+         ('volunteer_0@khoj.in',)),
+        ('get_womens_safety_complaints (volunteer)', get_womens_safety_complaints, ('volunteer_0@khoj.in',)),
+        # user_0 is the heaviest repeat user
+        ('get_user_complaints', get_user_complaints, ('user_0',)),
+        ('application_changes (delta)', application_changes, ('lost_found', 'user_0', feed_cursor())),
+        ('get_companion_requests', get_companion_requests, ('user_0',)),
+        ('companion index load', companion_index.refresh, (True,)),
+        ('find_travel_companions', find_travel_companions, (busiest, second, tomorrow, '09:00')),
+        ('generate_insights', analytics.generate_insights.uncached, ()),
+        ('generate_insights (30 days)', analytics.generate_insights.uncached, (month_ago,)),
+        ('create_visualizations', analytics.create_visualizations.uncached, ()),
+        ('create_visualizations (30 days)', analytics.create_visualizations.uncached, (month_ago,)),
+        ('predict_resource_needs', analytics.predict_resource_needs.uncached, ()),
+        ('status_durations', analytics.status_durations.uncached, ()),
+        ('status_durations (30 days)', analytics.status_durations.uncached, (month_ago,)),
+    ]
+
+
+def _size(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def measure(function, args, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - started)
+    return {'min': min(timings), 'median': statistics.median(timings), 'max': max(timings),
+            'runs': repeat, 'size': _size(result)}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scale, seed_value=18, backend='sqlite', path=None, repeat=5, only=None, log=print):
+    """Generate (if needed) and time every case; returns the report dict"""
+    path = path or f'/tmp/khoj-bench-{scale}.sqlite3'
+    synthetic.configure(backend, path, scale, seed_value)
+    generator = synthetic.Generator(scale, seed_value)
+    results = {}
+    for name, function, args in cases(generator):
+        if only and not any(part in name for part in only):
+            continue
+        results[name] = measure(function, args, repeat)
+        log(f"{name:<48} median {results[name]['median'] * 1e3:9.2f} ms  "
+            f"min {results[name]['min'] * 1e3:9.2f} ms  size {results[name]['size']}")
+    return {
+        'meta': {'scale': scale, 'seed': seed_value, 'backend': backend, 'repeat': repeat,
+                 'python': platform.python_version(), 'machine': platform.machine(),
+                 'commit': _commit(), 'started_at': datetime.now().isoformat(timespec='seconds')},
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """[(name, baseline median, median, ratio)] for cases slower than tolerance times the baseline"""
+    regressions = []
+    for name, result in report['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before['median']:
+            continue
+        ratio = result['median'] / before['median']
+        print(f"{name:<48} {before['median'] * 1e3:9.2f} -> {result['median'] * 1e3:9.2f} ms  {ratio:5.2f}x")
+        if ratio > tolerance:
+            regressions.append((name, before['median'], result['median'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=100000, help="rows per complaint table")
+    parser.add_argument('--seed', type=int, default=18)
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--db', help="SQLite path (default /tmp/khoj-bench-<scale>.sqlite3)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', help="time only cases whose name contains this")
+    parser.add_argument('--json', help="write the report here")
+    parser.add_argument('--compare', help="an earlier --json report to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="allowed median slowdown")
+    args = parser.parse_args(argv)
+
+    report = run(args.scale, args.seed, args.backend, args.db, args.repeat, args.only)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['meta']['scale'] != args.scale or baseline['meta']['backend'] != args.backend:
+            print(f"warning: baseline ran at scale {baseline['meta']['scale']} on {baseline['meta']['backend']}")
+        regressions = compare(report, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before * 1e3:.2f} -> {after * 1e3:.2f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
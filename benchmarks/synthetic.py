@@ -0,0 +1,291 @@
+"""Deterministic synthetic KHOJ data at production-like volume
+
+    python -m benchmarks.synthetic --scale 1000000 [--db /tmp/khoj-bench.sqlite3] [--seed 18] [--end 2025-12-31]
+    KHOJ_DB_NAME=khoj_bench python -m benchmarks.synthetic --backend mysql --scale 10000000
+
+Fills users, lost_found, medical_assistance, womens_safety,
+travel_companions, volunteer_assignments and each complaint's status
+history, then rebuilds the analytics rollups month by month. --scale is the number of rows per complaint table;
+the other tables are sized from it. The same scale, seed and end date always
+give the same rows; the end date defaults to today, so that recent safety
+requests are upcoming journeys for the companion search. The data is skewed the way real traffic is:
+
+  stations   Zipf-like: the busiest interchanges take most incidents
+  times      morning and evening rush hours, quieter weekends, the year up to --end
+  users      a few repeat users file many complaints, most file one or two
+  volunteers a core of volunteers takes most assignments
+
+Rows are generated with numpy and written BATCH_ROWS at a time, one
+transaction per batch, so tens of millions of rows need no more memory than
+one batch. The MySQL variant writes into the configured database, so only
+point it at a scratch one.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+BATCH_ROWS = 50000
+HISTORY_DAYS = 365
+
+# Share of a day's incidents per hour: rush hours around 09:00 and 19:00
+HOUR_WEIGHTS = np.array([1, 0.5, 0.3, 0.3, 0.5, 1.5, 3, 5, 8, 9, 6, 4,
+                         4, 4, 4, 5, 6, 8, 9, 8, 6, 4, 3, 2], dtype=np.float64)
+WEEKDAY_WEIGHTS = np.array([1.1, 1.1, 1.1, 1.1, 1.1, 0.8, 0.7])  # Monday first
+
+ITEMS = ['black bag', 'phone', 'wallet', 'umbrella', 'laptop bag', 'water bottle', 'spectacles',
+         'earphones', 'keys', 'tiffin box', 'jacket', 'blue backpack', 'purse', 'id card', 'charger']
+SYMPTOMS = ['fever', 'chest pain', 'fainting', 'breathlessness', 'injury from fall', 'dizziness',
+            'abdominal pain', 'asthma attack', 'high blood pressure', 'seizure']
+ASSISTANCE_TYPES = ['Ambulance Assistance', 'Volunteer Assistance', 'First Aid']
+# Mean hours a complaint stays in a status before the next one (ENUM order)
+STATE_HOURS = [0.5, 2, 6, 18, 8, 4]
+
+
+def _zipf_weights(count, exponent):
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+class Generator:
+    """Deterministic rows for every table at a given scale"""
+
+    def __init__(self, scale, seed_value=18, end=None):
+        from khoj.stations import LINES
+        self.scale = scale
+        self.seed_value = seed_value
+        first_day = (end or date.today()) - timedelta(days=HISTORY_DAYS - 1)
+        self.start = datetime(first_day.year, first_day.month, first_day.day)
+        self.recent = self.start + timedelta(days=HISTORY_DAYS - 14)
+        rng = np.random.default_rng(seed_value)
+        stations = sorted({station for names in LINES.values() for station in names})
+        # Popularity is random per station but fixed by the seed
+        self.stations = np.array(stations, dtype=object)[rng.permutation(len(stations))]
+        self.station_weights = _zipf_weights(len(stations), 1.1)
+        self.users = max(scale // 10, 10)
+        self.volunteers = max(scale // 2000, 20)
+        self.trains = np.array([str(number) for number in rng.choice(np.arange(10000, 23000), 800, replace=False)],
+                               dtype=object)
+        day_weights = WEEKDAY_WEIGHTS[(self.start.weekday() + np.arange(HISTORY_DAYS)) % 7]
+        self.day_weights = day_weights / day_weights.sum()
+        self.hour_weights = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+    def _rng(self, table, batch):
+        # One stream per (table, batch): any batch can be regenerated on its own
+        return np.random.default_rng([self.seed_value, sum(map(ord, table)), batch])
+
+    def _created_at(self, rng, size):
+        days = rng.choice(HISTORY_DAYS, size, p=self.day_weights)
+        seconds = rng.choice(24, size, p=self.hour_weights) * 3600 + rng.integers(3600, size=size)
+        return [self.start + timedelta(days=int(day), seconds=int(second)) for day, second in zip(days, seconds)]
+
+    def _user_names(self, rng, size):
+        # Heavy-tailed: user_0 files the most complaints
+        return [f'user_{index}' for index in (self.users * rng.random(size) ** 2).astype(np.int64)]
+
+    def _stations(self, rng, size):
+        return self.stations[rng.choice(len(self.stations), size, p=self.station_weights)]
+
+    def _statuses(self, rng, created, statuses):
+        # Most history is resolved; the open queues are mostly the last two weeks
+        open_statuses = np.array([status for status in statuses if status != 'Resolved'], dtype=object)
+        picked = open_statuses[rng.integers(len(open_statuses), size=len(created))]
+        recent = np.array([moment >= self.recent for moment in created])
+        picked[rng.random(len(created)) < np.where(recent, 0.3, 0.97)] = 'Resolved'
+        return picked
+
+    def users_rows(self, batch, size):
+        rows = []
+        for index in range(batch * BATCH_ROWS, batch * BATCH_ROWS + size):
+            if index < self.users:
+                rows.append((f'user_{index}', f'user_{index}@example.in', 'x', f'9{index:09d}'[:10], 'USER'))
+            else:
+                volunteer = index - self.users
+                rows.append((f'volunteer_{volunteer}', f'volunteer_{volunteer}@khoj.in', 'x',
+                             f'8{volunteer:09d}'[:10], 'VOLUNTEER'))
+        return rows
+
+    def lost_found_rows(self, batch, size):
+        from khoj.complaints import STATUSES
+        rng = self._rng('lost_found', batch)
+        created = self._created_at(rng, size)
+        return list(zip(
+            self._user_names(rng, size), self.trains[rng.choice(len(self.trains), size,
+                                                                 p=_zipf_weights(len(self.trains), 0.8))],
+            [f'S{number}' for number in rng.integers(1, 12, size)],
+            [str(number) for number in rng.integers(1, 73, size)],
+            np.array(ITEMS, dtype=object)[rng.choice(len(ITEMS), size, p=_zipf_weights(len(ITEMS), 0.9))],
+            ['9000000000'] * size, self._statuses(rng, created, STATUSES['lost_found']), created))
+
+    def medical_assistance_rows(self, batch, size):
+        from khoj.complaints import STATUSES
+        rng = self._rng('medical_assistance', batch)
+        created = self._created_at(rng, size)
+        return list(zip(
+            self._user_names(rng, size),
+            np.array(SYMPTOMS, dtype=object)[rng.choice(len(SYMPTOMS), size, p=_zipf_weights(len(SYMPTOMS), 1.0))],
+            self._stations(rng, size), self._stations(rng, size),
+            np.array(ASSISTANCE_TYPES, dtype=object)[rng.choice(3, size, p=[0.5, 0.35, 0.15])],
+            self._statuses(rng, created, STATUSES['medical_assistance']), created))
+
+    def womens_safety_rows(self, batch, size):
+        from khoj.complaints import STATUSES
+        rng = self._rng('womens_safety', batch)
+        created = self._created_at(rng, size)
+        # Journeys are planned up to a week ahead, mostly around the rush hours
+        travel_dates = [(moment + timedelta(days=int(ahead))).date()
+                        for moment, ahead in zip(created, rng.integers(0, 8, size))]
+        hours = rng.choice(24, size, p=self.hour_weights)
+        return list(zip(
+            self._user_names(rng, size), self._stations(rng, size), self._stations(rng, size),
+            [f'{hour:02d}:{minute:02d}' for hour, minute in zip(hours, rng.choice([0, 15, 30, 45], size))],
+            ['9000000000'] * size, travel_dates, (rng.random(size) < 0.4).tolist(),
+            self._statuses(rng, created, STATUSES['womens_safety']), created))
+
+    def travel_companions_rows(self, batch, size):
+        rng = self._rng('travel_companions', batch)
+        return list(zip(
+            (rng.integers(1, self.scale + 1, size)).tolist(), self._user_names(rng, size), ['9200000000'] * size,
+            np.array(['Pending', 'Accepted', 'Rejected'], dtype=object)[rng.choice(3, size, p=[0.3, 0.5, 0.2])]))
+
+    def volunteer_assignments_rows(self, batch, size):
+        rng = self._rng('volunteer_assignments', batch)
+        volunteers = (self.volunteers * rng.random(size) ** 2).astype(np.int64)
+        return list(zip(
+            np.array(['lost_found', 'medical_assistance', 'womens_safety'], dtype=object)[rng.integers(3, size=size)],
+            rng.integers(1, self.scale + 1, size).tolist(),
+            [f'volunteer_{volunteer}' for volunteer in volunteers], ['9100000000'] * size,
+            [f'volunteer_{volunteer}@khoj.in' for volunteer in volunteers]))
+
+    def status_events_rows(self, table, batch, size):
+        """History of the complaints in a batch of table: through the statuses in order up to the current one"""
+        from khoj.complaints import STATUSES
+        rng = self._rng(f'{table}_events', batch)
+        statuses = STATUSES[table]
+        rows = []
+        for offset, complaint in enumerate(getattr(self, f'{table}_rows')(batch, size)):
+            complaint_id, status, changed = batch * BATCH_ROWS + offset + 1, complaint[-2], complaint[-1]
+            rows.append((table, complaint_id, None, 'Pending', changed))
+            previous, last = 'Pending', statuses.index(status)
+            for index in range(1, last + 1):
+                # Intermediate statuses are often skipped
+                if index < last and rng.random() < 0.3:
+                    continue
+                hours = rng.exponential(STATE_HOURS[min(statuses.index(previous), len(STATE_HOURS) - 1)])
+                changed += timedelta(hours=float(hours))
+                rows.append((table, complaint_id, previous, statuses[index], changed))
+                previous = statuses[index]
+        return rows
+
+
+# Table -> (INSERT statement, rows for a scale)
+TABLES = {
+    'users': ("INSERT INTO users (name, email, password, phone, role) VALUES (%s, %s, %s, %s, %s)",
+              lambda generator: generator.users + generator.volunteers),
+    'lost_found': ("""
+        INSERT INTO lost_found (user_name, train_number, compartment_number, seat_number, item_description,
+                                phone_number, status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, lambda generator: generator.scale),
+    'medical_assistance': ("""
+        INSERT INTO medical_assistance (user_name, symptoms, station_left, arriving_station, assistance_type,
+                                        status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, lambda generator: generator.scale),
+    'womens_safety': ("""
+        INSERT INTO womens_safety (user_name, boarding_station, destination_station, time_of_boarding,
+                                   phone_number, travel_date, looking_for_companion, status, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, lambda generator: generator.scale),
+    'travel_companions': ("""
+        INSERT INTO travel_companions (request_id, companion_name, companion_phone, status)
+        VALUES (%s, %s, %s, %s)
+    """, lambda generator: generator.scale // 5),
+    'volunteer_assignments': ("""
+        INSERT INTO volunteer_assignments (complaint_type, complaint_id, volunteer_name, volunteer_phone,
+                                           volunteer_email)
+        VALUES (%s, %s, %s, %s, %s)
+    """, lambda generator: generator.scale // 3),
+}
+
+
+def generate(scale, seed_value=18, end=None, log=print):
+    """Write every table at `scale` rows per complaint table and rebuild the rollups"""
+    from khoj import db, matching, rollups, stations
+    from khoj.complaints import COMPLAINT_TABLES, backfill_assignees
+    generator = Generator(scale, seed_value, end)
+    for table, (sql, total) in TABLES.items():
+        started = time.perf_counter()
+        rows = total(generator)
+        for batch, offset in enumerate(range(0, rows, BATCH_ROWS)):
+            values = getattr(generator, f'{table}_rows')(batch, min(BATCH_ROWS, rows - offset))
+            with db.transaction() as cursor:
+                cursor.executemany(sql, values)
+        log(f"{table:<22} {rows:>10} rows in {time.perf_counter() - started:6.1f}s")
+    started = time.perf_counter()
+    events = 0
+    for table in COMPLAINT_TABLES:
+        for batch, offset in enumerate(range(0, scale, BATCH_ROWS)):
+            values = generator.status_events_rows(table, batch, min(BATCH_ROWS, scale - offset))
+            with db.transaction() as cursor:
+                cursor.executemany("""
+                    INSERT INTO complaint_status_events
+                    (complaint_type, complaint_id, from_status, to_status, changed_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, values)
+            events += len(values)
+        with db.transaction() as cursor:
+            backfill_assignees(cursor, (table,))
+    log(f"{'status history':<22} {events:>10} rows in {time.perf_counter() - started:6.1f}s")
+    started = time.perf_counter()
+    with db.transaction() as cursor:
+        updated = stations.backfill(cursor)
+    log(f"{'station ids':<22} {updated:>10} rows in {time.perf_counter() - started:6.1f}s")
+    started = time.perf_counter()
+    with db.transaction() as cursor:
+        updated = matching.backfill_keys(cursor)
+    log(f"{'train keys':<22} {updated:>10} rows in {time.perf_counter() - started:6.1f}s")
+    started = time.perf_counter()
+    month = generator.start.date().replace(day=1)
+    while month < (generator.start + timedelta(days=HISTORY_DAYS + 7)).date():
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        with db.transaction() as cursor:
+            rollups.rebuild(cursor, month, next_month - timedelta(days=1))
+        month = next_month
+    log(f"{'rollups':<22} {'':>10}      in {time.perf_counter() - started:6.1f}s")
+
+
+def configure(backend, path, scale, seed_value=18, end=None):
+    """Point khoj.db at the benchmark database, generating it first if it is new (SQLite) or empty"""
+    from khoj import db, migrations
+    new = backend == 'sqlite' and not os.path.exists(path)
+    db.configure(backend, path)
+    migrations.migrate()
+    if backend == 'mysql':
+        with db.transaction() as cursor:
+            cursor.execute("SELECT id FROM lost_found LIMIT 1")
+            new = not cursor.fetchall()
+    if new:
+        generate(scale, seed_value, end)
+    return new
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=100000, help="rows per complaint table")
+    parser.add_argument('--seed', type=int, default=18)
+    parser.add_argument('--end', type=date.fromisoformat, help="last day of history (default today)")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--db', help="SQLite path (default /tmp/khoj-bench-<scale>.sqlite3)")
+    args = parser.parse_args(argv)
+    path = args.db or f'/tmp/khoj-bench-{args.scale}.sqlite3'
+    if not configure(args.backend, path, args.scale, args.seed, args.end):
+        print(f"{path if args.backend == 'sqlite' else 'database'} already has data; nothing generated")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
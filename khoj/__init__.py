@@ -0,0 +1 @@
+"""Data layer for the KHOJ Streamlit app (see KHOJ1.py)"""
@@ -0,0 +1,461 @@
+"""Analytics behind the KHOJ dashboard"""
+import os
+
+import pandas as pd
+import numpy as np
+from datetime import date, timedelta
+import plotly.express as px
+import plotly.graph_objects as go
+from pandas.api.types import union_categoricals
+
+from khoj import archive, events, forecast, hotspots, rollups, snapshot, stations
+from khoj.cache import cached
+from khoj.complaints import STATUSES
+from khoj.text import normalize_item
+
+WEEKDAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']  # DAYOFWEEK order
+
+
+# Streamed frame loading
+LOAD_CHUNK_ROWS = 50000
+
+# Columns the analyze_* frames can load, as (SQL expression, dtype). Repeated
+# strings (stations, trains, statuses) load as categoricals, free text as objects.
+# Stations are read by id and load as their registered names (see khoj.stations).
+FRAME_COLUMNS = {
+    'lost_found': {
+        'train_number': ('train_number', 'category'),
+        'compartment_number': ('compartment_number', 'category'),
+        'item_description': ('item_description', object),
+        'created_at': ('created_at', 'datetime64[ns]'),
+        'status': ('status', pd.CategoricalDtype(STATUSES['lost_found'])),
+        'hour_of_day': ('HOUR(created_at)', 'int8'),
+        'day_of_week': ('DAYOFWEEK(created_at)', 'int8'),
+    },
+    'medical_assistance': {
+        'station_left': ('station_left_id', 'station'),
+        'arriving_station': ('arriving_station_id', 'station'),
+        'symptoms': ('symptoms', object),
+        'assistance_type': ('assistance_type', 'category'),
+        'created_at': ('created_at', 'datetime64[ns]'),
+        'status': ('status', pd.CategoricalDtype(STATUSES['medical_assistance'])),
+        'hour_of_day': ('HOUR(created_at)', 'int8'),
+        'day_of_week': ('DAYOFWEEK(created_at)', 'int8'),
+    },
+    'womens_safety': {
+        'boarding_station': ('boarding_station_id', 'station'),
+        'destination_station': ('destination_station_id', 'station'),
+        'time_of_boarding': ('time_of_boarding', 'category'),
+        'status': ('status', pd.CategoricalDtype(STATUSES['womens_safety'])),
+        'created_at': ('created_at', 'datetime64[ns]'),
+        'hour_of_day': ('HOUR(created_at)', 'int8'),
+        'day_of_week': ('DAYOFWEEK(created_at)', 'int8'),
+    },
+}
+
+
+def _chunk_column(values, dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical(values, dtype=dtype)
+    if dtype == 'category':
+        return pd.Categorical(values)
+    if dtype == 'station':
+        codes, station_ids = pd.factorize(pd.Series(values, dtype=object))
+        names = np.array([stations.registry.name(station_id) for station_id in station_ids] + [None], dtype=object)
+        return pd.Categorical(names[codes])
+    if dtype == 'datetime64[ns]':
+        return pd.to_datetime(list(values)).to_numpy(dtype=dtype)
+    return np.array(values, dtype=dtype)
+
+
+def _concat_column(chunks, dtype):
+    chunks = chunks or [_chunk_column((), dtype)]
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(np.concatenate([chunk.codes for chunk in chunks]), dtype=dtype)
+    if dtype in ('category', 'station'):
+        return union_categoricals(chunks, sort_categories=True)
+    return np.concatenate(chunks)
+
+
+def load_frame(table, columns=None, since=None, until=None, chunk_rows=LOAD_CHUNK_ROWS):
+    """Stream a complaint table into a DataFrame of just `columns` (a tuple; default all FRAME_COLUMNS)
+
+    Rows are fetched chunk_rows at a time from an unbuffered cursor and each
+    chunk is converted to its final dtypes straight away, so peak memory is
+    the frame plus one chunk. since and until (dates, inclusive) filter on
+    created_at. Archived complaints are read after the live ones.
+    """
+    spec = FRAME_COLUMNS[table]
+    columns = list(columns or spec)
+    clauses, params = [], []
+    if since:
+        clauses.append("created_at >= %s")
+        params.append(since)
+    if until:
+        clauses.append("created_at < %s")
+        params.append(until + timedelta(days=1))
+    chunks = {column: [] for column in columns}
+    if any(spec[column][1] == 'station' for column in columns):
+        # Station names come from the registry, which is not reloaded inside the read
+        stations.registry.refresh()
+    with snapshot.reader(buffered=False) as cursor:
+        # Live complaints, then the archived ones
+        for source in archive.sources(table):
+            cursor.execute(f"""
+                SELECT {', '.join(spec[column][0] for column in columns)}
+                FROM {source}
+                {'WHERE ' + ' AND '.join(clauses) if clauses else ''}
+            """, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                for column, values in zip(columns, zip(*rows)):
+                    chunks[column].append(_chunk_column(values, spec[column][1]))
+                del rows
+    return pd.DataFrame({column: _concat_column(chunks.pop(column), spec[column][1]) for column in columns},
+                        columns=columns)
+
+
+@cached
+def analyze_lost_found_patterns(columns=None, since=None, until=None):
+    """Analyze patterns in lost & found items"""
+    return load_frame('lost_found', columns, since, until)
+
+
+@cached
+def analyze_medical_emergencies(columns=None, since=None, until=None):
+    """Analyze medical emergency patterns"""
+    return load_frame('medical_assistance', columns, since, until)
+
+
+@cached
+def analyze_safety_hotspots(columns=None, since=None, until=None):
+    """Analyze women's safety request patterns"""
+    return load_frame('womens_safety', columns, since, until)
+
+
+def _top_counts(values, limit):
+    """{value: count} of the `limit` most frequent values, ties by value (as rollups.top_terms)"""
+    counts = values.fillna('').astype(str).str[:255].value_counts()
+    counts = counts.sort_index(kind='stable').sort_values(ascending=False, kind='stable')
+    return {value: int(count) for value, count in counts.head(limit).items()}
+
+
+def _frame_mode(values):
+    """Most frequent value, the smallest on ties; None for no rows"""
+    modes = values.mode()
+    return int(modes.iloc[0]) if len(modes) else None
+
+
+def insights_from_frames(lost_found_df, medical_df, safety_df):
+    """Compute the insights dict from full analyze_* frames (reference implementation)
+
+    generate_insights() must return exactly this for the same rows.
+    """
+    route_counts = safety_df.groupby(['boarding_station', 'destination_station'], observed=True).size()
+    routes = pd.Series(
+        [f"{boarding} to {destination}" for boarding, destination in route_counts.index]
+    ).repeat(route_counts.to_numpy())
+    insights = {
+        'lost_found': {
+            'total_cases': len(lost_found_df),
+            'resolution_rate': _rate(int((lost_found_df['status'] == 'Resolved').sum()), len(lost_found_df)),
+            'peak_hours': _frame_mode(lost_found_df['hour_of_day']),
+            'common_items': _top_counts(lost_found_df['item_description'].map(normalize_item), 5)
+        },
+        'medical': {
+            'total_cases': len(medical_df),
+            'emergency_rate': _rate(int((medical_df['assistance_type'] == 'Ambulance Assistance').sum()),
+                                    len(medical_df)),
+            'common_symptoms': _top_counts(medical_df['symptoms'], 5),
+            'high_risk_stations': _top_counts(medical_df['station_left'].astype(object), 3)
+        },
+        'safety': {
+            'total_requests': len(safety_df),
+            'risky_hours': _frame_mode(safety_df['hour_of_day']),
+            # Keyed by 1-tuples, as DataFrame.value_counts() produced them
+            'common_routes': {(route,): cases for route, cases in _top_counts(routes, 5).items()}
+        }
+    }
+
+    return insights
+
+
+def _mode(counts):
+    """Most frequent key, the smallest on ties (as Series.mode().iloc[0])"""
+    counts = {key: value for key, value in counts.items() if value > 0}
+    if not counts:
+        return None
+    best = max(counts.values())
+    return min(key for key, value in counts.items() if value == best)
+
+
+def _rate(part, whole):
+    return part / whole * 100 if whole else 0.0
+
+
+@cached
+def generate_insights(since=None, until=None):
+    """Generate comprehensive insights from the daily rollups"""
+    totals, resolved, hours = {}, {}, {}
+    for complaint_type, status, cases in rollups.status_totals(since, until):
+        totals[complaint_type] = totals.get(complaint_type, 0) + int(cases)
+        if status == 'Resolved':
+            resolved[complaint_type] = resolved.get(complaint_type, 0) + int(cases)
+    for complaint_type, hour, cases in rollups.hour_totals(since, until):
+        by_hour = hours.setdefault(complaint_type, {})
+        by_hour[int(hour)] = by_hour.get(int(hour), 0) + int(cases)
+
+    def top(complaint_type, dimension, limit):
+        return {value: int(cases) for value, cases in
+                rollups.top_terms(complaint_type, dimension, limit, since, until)}
+
+    ambulance = top('medical_assistance', 'assistance_type', None).get('Ambulance Assistance', 0)
+    insights = {
+        'lost_found': {
+            'total_cases': totals.get('lost_found', 0),
+            'resolution_rate': _rate(resolved.get('lost_found', 0), totals.get('lost_found', 0)),
+            'peak_hours': _mode(hours.get('lost_found', {})),
+            'common_items': top('lost_found', 'item', 5)
+        },
+        'medical': {
+            'total_cases': totals.get('medical_assistance', 0),
+            'emergency_rate': _rate(ambulance, totals.get('medical_assistance', 0)),
+            'common_symptoms': top('medical_assistance', 'symptom', 5),
+            'high_risk_stations': {station: int(cases) for station, cases in
+                                   rollups.top_stations('medical_assistance', 3, since, until)}
+        },
+        'safety': {
+            'total_requests': totals.get('womens_safety', 0),
+            'risky_hours': _mode(hours.get('womens_safety', {})),
+            # Keyed by 1-tuples, as DataFrame.value_counts() produced them
+            'common_routes': {(route,): cases for route, cases in top('womens_safety', 'route', 5).items()}
+        }
+    }
+
+    return insights
+
+
+# Chart data: figures are built from bucketed rollups, never from rows
+MAX_TIMELINE_POINTS = 400
+MAX_FIGURE_BYTES = int(os.environ.get('KHOJ_MAX_FIGURE_BYTES', str(256 * 1024)))
+
+# Timeline resolutions, finest first: (name, pandas frequency, days per bucket)
+RESOLUTIONS = [
+    ('hour', 'h', 1 / 24),
+    ('day', 'D', 1),
+    ('week', 'W-MON', 7),
+    ('month', 'MS', 30.4),
+    ('year', 'YS', 365.25),
+]
+
+
+def timeline_resolution(since, until):
+    """Finest resolution that keeps since..until within MAX_TIMELINE_POINTS buckets"""
+    days = (until - since).days + 1
+    for name, _, bucket_days in RESOLUTIONS:
+        if days / bucket_days <= MAX_TIMELINE_POINTS:
+            return name
+    return RESOLUTIONS[-1][0]
+
+
+def timeline_data(complaint_type, since=None, until=None, resolution=None):
+    """(DataFrame of period and cases, resolution) for complaint_type, empty buckets included"""
+    until = until or date.today()
+    since = since or rollups.first_day(complaint_type) or until
+    resolution = resolution or timeline_resolution(since, until)
+    if resolution == 'hour':
+        cases = pd.Series({pd.Timestamp(day) + pd.Timedelta(hours=int(hour)): int(total) for day, hour, total in
+                           rollups.day_hour_totals(complaint_type, since, until)}, dtype='int64')
+        periods = pd.date_range(since, pd.Timestamp(until) + pd.Timedelta(hours=23), freq='h')
+    else:
+        cases = pd.Series({pd.Timestamp(day): int(total) for day, total, _ in
+                           rollups.daily_totals(complaint_type, since, until)}, dtype='int64')
+        periods = pd.date_range(since, until, freq='D')
+    cases = cases.reindex(periods, fill_value=0)
+    if resolution not in ('hour', 'day'):
+        frequency = dict((name, freq) for name, freq, _ in RESOLUTIONS)[resolution]
+        cases = cases.resample(frequency, closed='left', label='left').sum()
+    return pd.DataFrame({'period': cases.index, 'cases': cases.to_numpy()}), resolution
+
+
+def weekday_hour_matrix(complaint_type, since=None, until=None):
+    """7x24 DataFrame of cases, WEEKDAYS by hour of day"""
+    matrix = np.zeros((7, 24), dtype=np.int64)
+    for day_of_week, hour, cases in rollups.weekday_hour_totals(complaint_type, since, until):
+        matrix[int(day_of_week) - 1, int(hour)] += int(cases)
+    return pd.DataFrame(matrix, index=WEEKDAYS, columns=range(24))
+
+
+def figure_bytes(figure):
+    """Size of a figure's JSON, as sent to the browser"""
+    return len(figure.to_json())
+
+
+@cached
+def create_visualizations(since=None, until=None):
+    """Create interactive visualizations for the dashboard"""
+    # Lost & Found Heatmap
+    matrix = weekday_hour_matrix('lost_found', since, until)
+    lost_found_heatmap = go.Figure(
+        go.Heatmap(z=matrix.to_numpy(), x=list(matrix.columns), y=list(matrix.index),
+                   colorbar={'title': 'cases'}),
+        layout={'title': 'Lost & Found Reports Distribution',
+                'xaxis': {'title': 'hour_of_day', 'dtick': 1}, 'yaxis': {'title': 'day_of_week'}}
+    )
+
+    # Medical Emergency Timeline, coarsened until it fits MAX_FIGURE_BYTES
+    until_day = until or date.today()
+    since_day = since or rollups.first_day('medical_assistance') or until_day
+    names = [name for name, _, _ in RESOLUTIONS]
+    for resolution in names[names.index(timeline_resolution(since_day, until_day)):]:
+        timeline_df, _ = timeline_data('medical_assistance', since_day, until_day, resolution)
+        medical_timeline = px.line(
+            timeline_df,
+            x='period',
+            y='cases',
+            title=f'Medical Emergencies Over Time (per {resolution})'
+        )
+        if figure_bytes(medical_timeline) <= MAX_FIGURE_BYTES:
+            break
+
+    # Safety Requests Map (if coordinates available)
+    safety_stations = pd.DataFrame(
+        [(station, int(cases)) for station, cases in
+         rollups.top_terms('womens_safety', 'station', None, since, until)],
+        columns=['station', 'count']
+    )
+
+    return {
+        'lost_found_heatmap': lost_found_heatmap,
+        'medical_timeline': medical_timeline,
+        'station_data': safety_stations
+    }
+
+
+# Status history (see khoj.events)
+def _time_in_state(spans, statuses):
+    hours = (spans['left_at'] - spans['entered_at']).dt.total_seconds() / 3600
+    grouped = hours.groupby(pd.Categorical(spans['status'], categories=statuses), observed=False)
+    df = pd.DataFrame({
+        'status': statuses,
+        'entered': grouped.size().to_numpy(),
+        'current': grouped.apply(lambda stays: int(stays.isna().sum())).to_numpy(),
+        'median_hours': grouped.median().round(1).to_numpy(),
+        'p90_hours': grouped.quantile(0.9).round(1).to_numpy(),
+    })
+    # Resolved is terminal: nobody leaves it
+    return df[(df['entered'] > 0) & (df['status'] != 'Resolved')]
+
+
+def _resolution(spans):
+    # Complaints filed before the status log began (first event already
+    # Resolved) have no measurable resolution time
+    filed = spans[spans['filed'] & (spans['status'] != 'Resolved')].set_index('complaint_id')['entered_at']
+    resolved = spans[spans['status'] == 'Resolved'].groupby('complaint_id')['entered_at'].min()
+    hours = ((resolved.reindex(filed.index) - filed).dt.total_seconds() / 3600).dropna()
+    return {
+        'filed': len(filed),
+        'resolved': len(hours),
+        'median_hours': round(hours.median(), 1) if len(hours) else None,
+        'p90_hours': round(hours.quantile(0.9), 1) if len(hours) else None,
+    }
+
+
+@cached
+def status_durations(since=None, until=None):
+    """Time to resolution and hours spent per status, from the status event log
+
+    Counts the complaints filed, and the stays in a status entered, between
+    since and until; one scan of the log per complaint type. Stays still in
+    progress count under `current` but not in the hours.
+    """
+    resolution, states = [], []
+    for complaint_type, statuses in STATUSES.items():
+        spans = events.state_spans(complaint_type, since)
+        if until:
+            spans = spans[spans['entered_at'] < pd.Timestamp(until + timedelta(days=1))]
+        resolution.append({'complaint_type': complaint_type, **_resolution(spans)})
+        states.append(_time_in_state(spans, statuses).assign(complaint_type=complaint_type))
+    time_in_state = pd.concat(states, ignore_index=True)
+    return {
+        'resolution': pd.DataFrame(resolution),
+        'time_in_state': time_in_state[['complaint_type'] + list(time_in_state.columns[:-1])],
+    }
+
+
+@cached
+def hotspot_table(complaint_type):
+    """Stored station/time hotspots for a complaint table (see khoj.hotspots), busiest first"""
+    df = pd.DataFrame(hotspots.stored_clusters(complaint_type), columns=hotspots.HotspotCluster._fields)
+    df = df[df['incidents'] > 0].assign(
+        weekday=lambda frame: frame['weekday'].map(dict(enumerate(WEEKDAYS, start=1))),
+        hour=lambda frame: frame['hour'].map(lambda hour: f"{hour:02d}:00"),
+    )
+    return df.drop(columns='cluster')
+
+
+@cached
+def _forecast_model():
+    """The stored forecast model brought up to yesterday (and saved)
+
+    Loaded once per cache generation and shared by every dashboard period;
+    a period only picks which of its series are shown (_period_series).
+    """
+    return forecast.current_model()
+
+
+def _period_series(model, since, until):
+    """Indexes of the model's series with complaints from since to until"""
+    if not (since or until):
+        return np.arange(len(model))
+    active = {(complaint_type, station) for complaint_type, station, _ in rollups.station_totals(since, until)}
+    return np.array([series for series, key in enumerate(model.keys) if key in active], dtype=np.int64)
+
+
+@cached
+def predict_resource_needs(days_ahead=7, since=None, until=None):
+    """Predict resource requirements for upcoming days from the per-station forecasts"""
+    model = _forecast_model()
+    series = _period_series(model, since, until)
+    keys = [model.keys[index] for index in series]
+    today = date.today()
+    daily = model.forecast(today, days_ahead)[series]
+    totals, resolved = {}, {}
+    for complaint_type, status, cases in rollups.status_totals(since, until):
+        totals[complaint_type] = totals.get(complaint_type, 0) + int(cases)
+        if status == 'Resolved':
+            resolved[complaint_type] = resolved.get(complaint_type, 0) + int(cases)
+    # Each series resolves at its complaint type's historical rate
+    resolution_rate = np.array([resolved.get(complaint_type, 0) / totals[complaint_type]
+                                if totals.get(complaint_type) else 0.0
+                                for complaint_type, _ in keys])
+
+    predictions = pd.DataFrame({
+        'date': [today + timedelta(days=i) for i in range(days_ahead)],
+        'predicted_cases': np.round(daily.sum(axis=0)).astype(int),
+        'predicted_resolutions': np.round(resolution_rate @ daily).astype(int)
+    })
+
+    return predictions
+
+
+@cached
+def station_forecast(days_ahead=7, since=None, until=None):
+    """Expected complaints per complaint type and station for upcoming days, busiest first"""
+    model = _forecast_model()
+    series = _period_series(model, since, until)
+    today = date.today()
+    dates = [(today + timedelta(days=i)).strftime('%a %d %b') for i in range(days_ahead)]
+    if not len(series):
+        return pd.DataFrame(columns=['complaint_type', 'station', *dates, 'total', 'peak_hour'])
+    keys = [model.keys[index] for index in series]
+    df = pd.DataFrame(model.forecast(today, days_ahead)[series].round(1), columns=dates)
+    df.insert(0, 'complaint_type', [complaint_type for complaint_type, _ in keys])
+    df.insert(1, 'station', [station or '-' for _, station in keys])
+    df['total'] = df[dates].sum(axis=1).round(1)
+    df['peak_hour'] = [f"{hour:02d}:00" for hour in model.hours[series].argmax(axis=1)]
+    df = df[df['total'] > 0]
+    return df.sort_values(['total', 'complaint_type', 'station'], ascending=[False, True, True],
+                          ignore_index=True)
@@ -0,0 +1,276 @@
+"""Archive of long-resolved complaints
+
+Complaints resolved more than KHOJ_ARCHIVE_AFTER_DAYS (default 180) ago move,
+with their volunteer_assignments and travel_companions rows, from the live
+tables to {table}_archive copies. The volunteer queues, claims, search and
+the change feed only read the live tables, so they scan only recent
+complaints. History reads (get_user_complaints and Track Applications,
+the analyze_* frames, hotspot refits, rollup rebuilds) read both, through
+history() or sources().
+
+On MySQL the archive tables are partitioned by month of created_at
+(assigned_at for assignments); each run first splits off partitions up to
+the cutoff month, so date-bounded reads only open the months they need.
+Complaints move in batches of KHOJ_ARCHIVE_BATCH_ROWS, each copied and
+deleted in one transaction, so a run can be stopped at any point and simply
+run again. A complaint counts as resolved since its last write (updated_at,
+or created_at for rows not written since migration 14).
+
+    python -m khoj.archive run [--days 180] [--batch 1000] [--pause 0.1]
+    python -m khoj.archive status
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from khoj.db import dialect, transaction
+from khoj.stations import STATION_FIELDS, id_columns
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('KHOJ_ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_BATCH_ROWS = int(os.environ.get('KHOJ_ARCHIVE_BATCH_ROWS', '1000'))
+ARCHIVE_PAUSE_SECONDS = float(os.environ.get('KHOJ_ARCHIVE_PAUSE_SECONDS', '0'))
+
+COMPLAINT_TABLES = ('lost_found', 'medical_assistance', 'womens_safety')
+
+# Columns of each archived table: the live table's, without the claim columns
+# (a resolved complaint holds no claim), statuses as plain strings
+_COMPLAINT_STATE = ['status VARCHAR(50)', 'created_at DATETIME NOT NULL',
+                    'assigned_volunteer_name VARCHAR(100)', 'assigned_volunteer_phone VARCHAR(15)',
+                    'assigned_volunteer_email VARCHAR(100)', 'assigned_at DATETIME NULL',
+                    'updated_at DATETIME NULL']
+
+ARCHIVE_COLUMNS = {
+    'lost_found': ['id INT NOT NULL', 'user_name VARCHAR(100)', 'train_number VARCHAR(50)',
+                   'compartment_number VARCHAR(50)', 'seat_number VARCHAR(50)', 'item_description TEXT',
+                   'phone_number VARCHAR(15)', *_COMPLAINT_STATE],
+    'medical_assistance': ['id INT NOT NULL', 'user_name VARCHAR(100)', 'symptoms TEXT',
+                           'station_left VARCHAR(100)', 'arriving_station VARCHAR(100)',
+                           'assistance_type VARCHAR(50)', *_COMPLAINT_STATE],
+    'womens_safety': ['id INT NOT NULL', 'user_name VARCHAR(100)', 'boarding_station VARCHAR(100)',
+                      'destination_station VARCHAR(100)', 'time_of_boarding VARCHAR(50)',
+                      'phone_number VARCHAR(15)', 'travel_date DATE', 'looking_for_companion BOOLEAN',
+                      *_COMPLAINT_STATE],
+    'travel_companions': ['id INT NOT NULL', 'request_id INT', 'companion_name VARCHAR(100)',
+                          'companion_phone VARCHAR(15)', 'status VARCHAR(20)', 'created_at DATETIME NOT NULL'],
+    'volunteer_assignments': ['id INT NOT NULL', 'complaint_type VARCHAR(50)', 'complaint_id INT',
+                              'volunteer_name VARCHAR(100)', 'volunteer_phone VARCHAR(15)',
+                              'volunteer_email VARCHAR(100)', 'assigned_at DATETIME NOT NULL'],
+}
+
+COLUMN_NAMES = {table: [column.split()[0] for column in columns] for table, columns in ARCHIVE_COLUMNS.items()}
+# Station ids, added to the live and archive tables alike by migration 16
+for _table in STATION_FIELDS:
+    COLUMN_NAMES[_table] += id_columns(_table)
+
+# Month partitioning column of each archive table
+PARTITION_COLUMNS = {table: 'created_at' for table in ARCHIVE_COLUMNS}
+PARTITION_COLUMNS['volunteer_assignments'] = 'assigned_at'
+
+INDEXES = [
+    # Track Applications: WHERE user_name = %s ORDER BY created_at DESC
+    *[f"CREATE INDEX idx_{table}_archive_user_created ON {table}_archive (user_name, created_at)"
+      for table in COMPLAINT_TABLES],
+    # Date-bounded analytics on SQLite (MySQL prunes partitions)
+    *[f"CREATE INDEX idx_{table}_archive_created ON {table}_archive (created_at)" for table in COMPLAINT_TABLES],
+    "CREATE INDEX idx_travel_companions_archive_request ON travel_companions_archive (request_id)",
+    "CREATE INDEX idx_travel_companions_archive_companion ON travel_companions_archive (companion_name)",
+    "CREATE INDEX idx_volunteer_assignments_archive_complaint ON volunteer_assignments_archive "
+    "(complaint_type, complaint_id, volunteer_email)",
+]
+
+
+def archive_table_sql(table):
+    columns = ',\n    '.join(ARCHIVE_COLUMNS[table] + ['archived_at DATETIME NOT NULL'])
+    partitioning = ''
+    if dialect() == 'mysql':
+        # One catch-all partition to start with; runs split months off it
+        partitioning = (f"\nPARTITION BY RANGE COLUMNS ({PARTITION_COLUMNS[table]}) "
+                        f"(PARTITION p_future VALUES LESS THAN (MAXVALUE))")
+    return f'''CREATE TABLE IF NOT EXISTS {table}_archive (
+    {columns},
+    PRIMARY KEY (id, {PARTITION_COLUMNS[table]})
+){partitioning}'''
+
+
+def create_tables(cursor):
+    for table in ARCHIVE_COLUMNS:
+        cursor.execute(archive_table_sql(table))
+
+
+def installed(cursor):
+    """Whether the archive tables exist yet (rollup rebuilds run in migrations before they do)"""
+    if dialect() == 'mysql':
+        cursor.execute("""
+            SELECT 1 FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'lost_found_archive'
+        """)
+    else:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lost_found_archive'")
+    return bool(cursor.fetchall())
+
+
+# History reads
+def sources(table):
+    """The tables holding table's full history, live first"""
+    return (table, f'{table}_archive') if table in ARCHIVE_COLUMNS else (table,)
+
+
+def history(table, where='1 = 1', limit=None, archived=True):
+    """FROM-clause source of table's live and archived rows matching where, aliased as table
+
+    where (and so its parameters, which callers pass twice) applies to each
+    side; with limit each side gives only its first `limit` rows by id, for
+    keyset reads that ORDER BY id LIMIT the same. archived=False reads the
+    live table alone.
+    """
+    if not archived:
+        return f"(SELECT * FROM {table} WHERE {where}) {table}"
+    columns = ', '.join(COLUMN_NAMES[table])
+    if not limit:
+        return (f"(SELECT {columns} FROM {table} WHERE {where} "
+                f"UNION ALL SELECT {columns} FROM {table}_archive WHERE {where}) {table}")
+    sides = [f"SELECT {columns} FROM (SELECT {columns} FROM {source} WHERE {where} "
+             f"ORDER BY id LIMIT {int(limit)}) {side}"
+             for source, side in ((table, 'live'), (f'{table}_archive', 'archived'))]
+    return f"({' UNION ALL '.join(sides)}) {table}"
+
+
+# Archiving
+def _month(day):
+    return date(day.year, day.month, 1)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def ensure_partitions(table, through):
+    """Split month partitions up to through's month off the catch-all of table's archives (MySQL)
+
+    The first run starts at the month of the oldest resolved complaint;
+    later runs add the months since the newest partition. Returns the
+    months added per archive table.
+    """
+    if dialect() != 'mysql':
+        return {}
+    related = ('travel_companions',) if table == 'womens_safety' else ()
+    added = {}
+    with transaction() as cursor:
+        cursor.execute(f"SELECT MIN(created_at) FROM {table} WHERE status = 'Resolved'")
+        oldest = cursor.fetchone()[0]
+        if oldest is None or oldest >= through:
+            return added
+        for archived in (table, 'volunteer_assignments') + related:
+            cursor.execute("""
+                SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME <> 'p_future'
+            """, (f'{archived}_archive',))
+            months = sorted(date(int(name[1:5]), int(name[5:7]), 1) for (name,) in cursor.fetchall())
+            month = _next_month(months[-1]) if months else _month(oldest)
+            added[archived] = []
+            while month <= _month(through):
+                added[archived].append(month)
+                month = _next_month(month)
+            if added[archived]:
+                # DDL commits on its own, so this runs outside any batch
+                partitions = ', '.join(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{_next_month(month)}')"
+                                       for month in added[archived])
+                cursor.execute(f"""
+                    ALTER TABLE {archived}_archive REORGANIZE PARTITION p_future INTO
+                    ({partitions}, PARTITION p_future VALUES LESS THAN (MAXVALUE))
+                """)
+    return added
+
+
+def _move(cursor, table, where, params):
+    columns = COLUMN_NAMES[table]
+    partition = PARTITION_COLUMNS[table]
+    select = ', '.join(f'COALESCE({column}, CURRENT_TIMESTAMP)' if column == partition else column
+                       for column in columns)
+    cursor.execute(f"""
+        INSERT INTO {table}_archive ({', '.join(columns)}, archived_at)
+        SELECT {select}, CURRENT_TIMESTAMP FROM {table} WHERE {where}
+    """, params)
+    cursor.execute(f"DELETE FROM {table} WHERE {where}", params)
+
+
+def archive_batch(table, cutoff, limit=ARCHIVE_BATCH_ROWS):
+    """Move up to limit complaints of table resolved before cutoff (a datetime); returns how many moved"""
+    if table not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {table}")
+    with transaction() as cursor:
+        # Oldest first along (status, created_at); rows being edited are skipped
+        cursor.execute(f"""
+            SELECT id FROM {table}
+            WHERE status = 'Resolved' AND created_at < %s AND COALESCE(updated_at, created_at) < %s
+            ORDER BY created_at LIMIT {int(limit)}
+            FOR UPDATE SKIP LOCKED
+        """, (cutoff, cutoff))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        marks = ', '.join(['%s'] * len(ids))
+        if table == 'womens_safety':
+            # Before their requests: travel_companions references womens_safety
+            _move(cursor, 'travel_companions', f"request_id IN ({marks})", ids)
+        _move(cursor, 'volunteer_assignments', f"complaint_type = %s AND complaint_id IN ({marks})", [table, *ids])
+        _move(cursor, table, f"id IN ({marks})", ids)
+    return len(ids)
+
+
+def run(days=ARCHIVE_AFTER_DAYS, batch_rows=ARCHIVE_BATCH_ROWS, pause=ARCHIVE_PAUSE_SECONDS,
+        tables=COMPLAINT_TABLES, before=None, log=print):
+    """Archive every complaint resolved more than `days` ago (or before the datetime `before`)
+
+    Returns {table: complaints moved}. pause sleeps between batches to leave
+    room for live writes.
+    """
+    from khoj.complaints import feed_cursor
+    cutoff = before or feed_cursor() - timedelta(days=days)
+    moved = {}
+    for table in tables:
+        started = time.perf_counter()
+        ensure_partitions(table, cutoff)
+        moved[table] = 0
+        while True:
+            count = archive_batch(table, cutoff, batch_rows)
+            moved[table] += count
+            if count < batch_rows:
+                break
+            if pause:
+                time.sleep(pause)
+        log(f"{table:<20} {moved[table]:>9} complaints archived in {time.perf_counter() - started:.1f}s")
+    return moved
+
+
+def status():
+    """{table: (live rows, archived rows)} for the complaint tables and their related tables"""
+    counts = {}
+    with transaction() as cursor:
+        for table in ARCHIVE_COLUMNS:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            live = cursor.fetchone()[0]
+            cursor.execute(f"SELECT COUNT(*) FROM {table}_archive")
+            counts[table] = (live, cursor.fetchone()[0])
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['run', 'status'])
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help="archive complaints resolved "
+                                                                             "more than this many days ago")
+    parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH_ROWS, help="complaints per transaction")
+    parser.add_argument('--pause', type=float, default=ARCHIVE_PAUSE_SECONDS, help="seconds between batches")
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args.days, args.batch, args.pause)
+    for table, (live, archived) in status().items():
+        print(f"{table:<22} {live:>10} live {archived:>10} archived")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
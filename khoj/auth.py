@@ -0,0 +1,207 @@
+"""Password hashing, session tokens and login throttling
+
+bcrypt is deliberately slow, so hashing runs in a small process pool instead
+of on the Streamlit script thread; a burst of logins then queues for a worker
+instead of stalling every session in the server. Set KHOJ_HASH_WORKERS=0 to
+hash inline.
+
+Session tokens are signed with KHOJ_SESSION_SECRET, shared by every server
+process, and carry a session id so khoj.users can revoke them on logout. The
+secret is optional: without it no token can be issued or checked, so logins
+still work but last only as long as the browser session.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('KHOJ_BCRYPT_ROUNDS', '12'))
+HASH_WORKERS = int(os.environ.get('KHOJ_HASH_WORKERS', str(min(os.cpu_count() or 1, 4))))
+# Hash jobs allowed to wait for a worker before new logins are turned away
+HASH_QUEUE_LIMIT = int(os.environ.get('KHOJ_HASH_QUEUE_LIMIT', str(max(HASH_WORKERS, 1) * 8)))
+HASH_TIMEOUT = float(os.environ.get('KHOJ_HASH_TIMEOUT', '10'))
+
+# No random fallback: tokens would stop working on a restart and on every other replica
+SESSION_SECRET = os.environ.get('KHOJ_SESSION_SECRET', '').encode()
+if not SESSION_SECRET:
+    logging.getLogger(__name__).warning(
+        "KHOJ_SESSION_SECRET is not set; logins will not survive a browser refresh")
+SESSION_TTL = int(os.environ.get('KHOJ_SESSION_TTL', str(12 * 3600)))
+
+# Login attempts allowed per window (seconds), per account and per client IP
+LOGIN_WINDOW = float(os.environ.get('KHOJ_LOGIN_WINDOW', '60'))
+LOGIN_ATTEMPTS_PER_ACCOUNT = int(os.environ.get('KHOJ_LOGIN_ATTEMPTS_PER_ACCOUNT', '5'))
+LOGIN_ATTEMPTS_PER_IP = int(os.environ.get('KHOJ_LOGIN_ATTEMPTS_PER_IP', '30'))
+
+
+class AuthBusy(Exception):
+    """Too many password hashes are already queued"""
+
+
+class LoginThrottled(Exception):
+    """Too many login (or, per address, registration) attempts for this account or address"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many attempts; try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# Hashing
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+
+def _run(func, *args):
+    global _executor
+    if HASH_WORKERS <= 0:
+        return func(*args)
+    if not _slots.acquire(timeout=HASH_TIMEOUT):
+        raise AuthBusy("Password hashing is overloaded; try again shortly")
+    try:
+        if _executor is None:
+            with _executor_lock:
+                if _executor is None:
+                    # spawn: forking a multi-threaded Streamlit server is unsafe
+                    _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+        executor = _executor
+        return executor.submit(func, *args).result(timeout=HASH_TIMEOUT)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool on the next call
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        raise AuthBusy("Password hashing is restarting; try again shortly")
+    finally:
+        _slots.release()
+
+
+def hash_password(password, rounds=None):
+    return _run(_hashpw, password.encode(), rounds or BCRYPT_ROUNDS).decode()
+
+
+def check_password(password, hashed):
+    if isinstance(hashed, str):
+        hashed = hashed.encode()
+    return _run(_checkpw, password.encode(), hashed)
+
+
+# Session tokens
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _session_secret():
+    if not SESSION_SECRET:
+        raise RuntimeError("KHOJ_SESSION_SECRET is not set; session tokens need a secret shared by every server")
+    return SESSION_SECRET
+
+
+def issue_session_token(user_id, ttl=None):
+    """Signed token carrying the user id and a new session id, valid for `ttl` seconds
+
+    The role and profile are not in the token: khoj.users.restore_session reads
+    them from the users table, so a role change applies at the next restore and
+    the cookie holds no personal details.
+    """
+    payload = json.dumps({
+        'id': user_id, 'sid': secrets.token_urlsafe(16), 'exp': int(time.time()) + (ttl or SESSION_TTL),
+    }, separators=(',', ':')).encode()
+    signature = hmac.new(_session_secret(), payload, hashlib.sha256).digest()
+    return f"{_b64(payload)}.{_b64(signature)}"
+
+
+def verify_session_token(token):
+    """The claims of a well-signed, unexpired token, or None; revocation is checked by khoj.users"""
+    secret = _session_secret()
+    try:
+        payload_b64, signature_b64 = token.split('.')
+        payload = _unb64(payload_b64)
+        expected = hmac.new(secret, payload, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _unb64(signature_b64)):
+            return None
+        claims = json.loads(payload)
+    except (ValueError, AttributeError):
+        return None
+    if claims.get('exp', 0) < time.time() or 'sid' not in claims or 'id' not in claims:
+        return None
+    return claims
+
+
+# Throttling
+class LoginThrottle:
+    """Sliding-window limit on login attempts per key"""
+
+    def __init__(self, window=LOGIN_WINDOW):
+        self.window = window
+        self._attempts = {}  # key -> deque of attempt times
+        self._lock = threading.Lock()
+
+    def check(self, key, limit):
+        """Record an attempt for key; raise LoginThrottled if over the limit"""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.setdefault(key, deque())
+            while attempts and now - attempts[0] > self.window:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                raise LoginThrottled(self.window - (now - attempts[0]))
+            attempts.append(now)
+            if len(self._attempts) > 100000:
+                self._prune(now)
+
+    def _prune(self, now):
+        for key in [key for key, attempts in self._attempts.items()
+                    if not attempts or now - attempts[-1] > self.window]:
+            del self._attempts[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+
+login_throttle = LoginThrottle()
+
+
+def _account_key(email):
+    return f"account:{(email or '').strip().lower()}"
+
+
+def throttle_login(email, client_ip=None):
+    login_throttle.check(_account_key(email), LOGIN_ATTEMPTS_PER_ACCOUNT)
+    throttle_client(client_ip)
+
+
+def throttle_client(client_ip):
+    """Count a password hash against the client's per-IP limit (logins and registrations share it)"""
+    if client_ip:
+        login_throttle.check(f"ip:{client_ip}", LOGIN_ATTEMPTS_PER_IP)
+
+
+def clear_login_attempts(email):
+    """Forget an account's attempts after it logs in successfully"""
+    login_throttle.reset(_account_key(email))
@@ -0,0 +1,141 @@
+"""In-process result cache for the analytics dashboard
+
+Entries are keyed by function, arguments and the current cache generation.
+The complaint write functions bump the generation, so a write makes every
+older entry unreachable at once; the TTL bounds staleness for writes made by
+other server processes. Entries are evicted least-recently-used once the
+cache grows past its byte budget.
+
+Cached values are shared between sessions: treat them as read-only.
+"""
+import functools
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_TTL = float(os.environ.get('KHOJ_CACHE_TTL', '300'))
+CACHE_MAX_BYTES = int(os.environ.get('KHOJ_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+def _sizeof(value):
+    if hasattr(value, 'memory_usage'):  # pandas DataFrame / Series
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class ResultCache:
+    """LRU cache with a TTL, a byte budget and generation-based invalidation"""
+
+    def __init__(self, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> Lock, so concurrent misses compute once
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def invalidate(self):
+        """Start a new generation; everything cached so far becomes stale"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key, compute):
+        key = (self._generation,) + key
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        try:
+            with loading:
+                # Another caller may have filled the entry while we waited
+                value = self._lookup(key, count=False)
+                if value is _MISSING:
+                    value = compute()
+                    self._store(key, value)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return value
+
+    def _lookup(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                if count:
+                    self._hits += 1
+                return entry[0]
+            if entry is not None:
+                self._drop(key)
+            if count:
+                self._misses += 1
+            return _MISSING
+
+    def _store(self, key, value):
+        size = _sizeof(value)
+        with self._lock:
+            if key[0] != self._generation or size > self.max_bytes:
+                return  # invalidated mid-computation, or too big to keep
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'generation': self._generation,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+
+_MISSING = object()
+dashboard_cache = ResultCache()
+
+
+def cached(func):
+    """Cache a function's result in dashboard_cache (arguments must be hashable)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+        return dashboard_cache.get_or_compute(key, lambda: func(*args, **kwargs))
+    wrapper.uncached = func
+    return wrapper
+
+
+def invalidate():
+    dashboard_cache.invalidate()
+
+
+def cache_stats():
+    return dashboard_cache.stats()
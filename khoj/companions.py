@@ -0,0 +1,297 @@
+"""In-memory index of open travel-companion requests
+
+Requests are bucketed by (line, direction, travel date). Within a bucket they
+are kept sorted by the time their train would have left the start of the line
+(boarding time minus the running time to the boarding station), so two
+travellers on the same train share a key wherever they board. A match is a
+bisect over the boarding-time window followed by an overlap check on the
+stations covered. The window reaches into the buckets of the day before and
+after, so a 23:50 journey matches one at 00:05 the next day. Journeys between
+stations that are not on a common line fall back to matching the same
+boarding and destination stations. Stations are compared by their
+khoj.stations id, so any spelling of a station matches.
+
+The index is loaded lazily from the database, kept current by the complaint
+write functions in this process, and reloaded every KHOJ_COMPANION_INDEX_TTL
+seconds to pick up writes from other server processes.
+"""
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+from khoj.stations import LINES, registry, station_key
+
+COMPANION_WINDOW = int(os.environ.get('KHOJ_COMPANION_WINDOW', '60'))  # minutes either side
+COMPANION_INDEX_TTL = float(os.environ.get('KHOJ_COMPANION_INDEX_TTL', '300'))
+MINUTES_PER_STOP = 3
+MINUTES_PER_DAY = 24 * 60
+
+# station id -> {line: position}, built on first use (see khoj.stations)
+_positions = None
+
+
+def _line_positions():
+    global _positions
+    if _positions is None:
+        positions = {}
+        for line, stations in LINES.items():
+            for position, station in enumerate(stations):
+                positions.setdefault(registry.lookup(station), {})[line] = position
+        positions.pop(None, None)
+        if positions:
+            _positions = positions
+        return positions
+    return _positions
+
+
+def _station(name, station_id=None):
+    """A journey end as its station id, or as its key if no station matches"""
+    if station_id is not None:
+        return station_id
+    found = registry.lookup(name)
+    return station_key(name) if found is None else found
+
+
+def parse_minutes(time_of_boarding):
+    """Minutes after midnight for an 'HH:MM' (or 'HH:MM:SS') string, None if unreadable"""
+    try:
+        hours, minutes = str(time_of_boarding).strip().split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except (ValueError, AttributeError):
+        return None
+    if 0 <= hours < 24 and 0 <= minutes < 60:
+        return hours * 60 + minutes
+    return None
+
+
+class OpenJourney(NamedTuple):
+    id: int
+    user_name: str
+    boarding_station: str
+    destination_station: str
+    time_of_boarding: str
+    phone_number: str
+    travel_date: object
+    boarding_station_id: Optional[int] = None  # looked up from the names when missing
+    destination_station_id: Optional[int] = None
+
+
+class CompanionMatch(NamedTuple):
+    id: int
+    user_name: str
+    time_of_boarding: str
+    phone_number: str
+    boarding_station: str
+    destination_station: str
+    minutes_apart: Optional[int]  # at the first shared station; None without a boarding time
+    shared_stops: int  # stations travelled together
+    same_route: bool
+
+
+def _placements(start_station, end_station, travel_date, minutes):
+    """(bucket, sort key, start, end) for every line the journey between two _station()s runs along"""
+    if start_station == end_station:
+        return []
+    positions = _line_positions()
+    boarding, destination = positions.get(start_station, {}), positions.get(end_station, {})
+    placements = []
+    for line in boarding.keys() & destination.keys():
+        start, end = boarding[line], destination[line]
+        # Time the same train would have left the line's origin in this direction
+        origin = start if end > start else len(LINES[line]) - 1 - start
+        key = None if minutes is None else minutes - origin * MINUTES_PER_STOP
+        placements.append(((line, end > start, travel_date), key, start, end))
+    if not placements:
+        placements.append((('route', start_station, end_station, travel_date), minutes, 0, 1))
+    return placements
+
+
+class _Bucket:
+    __slots__ = ('keys', 'ids')
+
+    def __init__(self):
+        self.keys = []  # sorted (key, id)
+        self.ids = {}  # id -> (start, end); includes requests without a readable time
+
+
+class CompanionIndex:
+    """Open companion requests by line, direction and date, sorted by departure time"""
+
+    def __init__(self, loader=None, ttl=COMPANION_INDEX_TTL):
+        self.loader = loader  # callable returning OpenJourney rows, or None
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._replay = None  # changes made while a reload is running
+        self._clear()
+
+    def _clear(self):
+        self._buckets = {}
+        self._requests = {}  # id -> (OpenJourney, placements)
+
+    def __len__(self):
+        return len(self._requests)
+
+    # Updates
+    def add(self, request):
+        with self._lock:
+            self._add(request)
+            if self._replay is not None:
+                self._replay.append((True, request))
+
+    def _add(self, request):
+        self._discard(request.id)
+        minutes = parse_minutes(request.time_of_boarding)
+        placements = _placements(_station(request.boarding_station, request.boarding_station_id),
+                                 _station(request.destination_station, request.destination_station_id),
+                                 request.travel_date, minutes)
+        for bucket_key, key, start, end in placements:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = _Bucket()
+            bucket.ids[request.id] = (start, end)
+            if key is not None:
+                insort(bucket.keys, (key, request.id))
+        self._requests[request.id] = (request, placements)
+
+    def discard(self, request_id):
+        with self._lock:
+            self._discard(request_id)
+            if self._replay is not None:
+                self._replay.append((False, request_id))
+
+    def _discard(self, request_id):
+        entry = self._requests.pop(request_id, None)
+        if entry is None:
+            return
+        for bucket_key, key, _, _ in entry[1]:
+            bucket = self._buckets[bucket_key]
+            del bucket.ids[request_id]
+            if key is not None:
+                del bucket.keys[bisect_left(bucket.keys, (key, request_id))]
+            if not bucket.ids:
+                del self._buckets[bucket_key]
+
+    # Loading
+    def load(self, requests):
+        """Replace the whole index with `requests`"""
+        with self._lock:
+            self._clear()
+            for request in requests:
+                self._add(request)
+            self._loaded_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """Reload from the loader when the index is missing or older than the TTL"""
+        if self.loader is None:
+            return
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl:
+            return
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return  # another session is reloading; keep serving the current index
+        try:
+            if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl:
+                return
+            with self._lock:
+                self._replay = []
+            try:
+                requests = self.loader()
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                raise
+            with self._lock:
+                replay, self._replay = self._replay, None
+                self._clear()
+                for request in requests:
+                    self._add(request)
+                # Apply adds and removals that raced with the load query
+                for added, change in replay:
+                    if added:
+                        self._add(change)
+                    else:
+                        self._discard(change)
+                self._loaded_at = time.monotonic()
+        finally:
+            self._load_lock.release()
+
+    # Matching
+    def match(self, boarding_station, destination_station, travel_date, time_of_boarding=None,
+              window=None, exclude_user=None, limit=20):
+        """Companions whose journey overlaps this one, closest boarding time first"""
+        self.refresh()
+        window = COMPANION_WINDOW if window is None else window
+        minutes = parse_minutes(time_of_boarding)
+        placements = _placements(_station(boarding_station), _station(destination_station), travel_date, minutes)
+        best = {}  # id -> rank; a station pair on two lines (e.g. CSMT-Kurla) is seen once per line
+        searches = []
+        for bucket_key, key, start, end in placements:
+            searches.append((bucket_key, key, start, end))
+            if key is not None and hasattr(travel_date, 'toordinal'):
+                # The same departure times on the neighbouring days, minutes counted from this day
+                for days in (-1, 1):
+                    searches.append((bucket_key[:-1] + (travel_date + timedelta(days=days),),
+                                     key - days * MINUTES_PER_DAY, start, end))
+        with self._lock:
+            for bucket_key, key, start, end in searches:
+                bucket = self._buckets.get(bucket_key)
+                if bucket is None:
+                    continue
+                if key is None:
+                    candidates = ((None, request_id) for request_id in bucket.ids)
+                else:
+                    candidates = _nearest_first(bucket.keys, key, window)
+                low, high = min(start, end), max(start, end)
+                kept, cutoff = 0, None
+                for other_key, request_id in candidates:
+                    apart = None if other_key is None or key is None else abs(other_key - key)
+                    if cutoff is not None and apart > cutoff:
+                        break  # nearest first: the rest of this bucket ranks lower
+                    other_start, other_end = bucket.ids[request_id]
+                    shared = min(high, max(other_start, other_end)) - max(low, min(other_start, other_end))
+                    if shared <= 0:
+                        continue
+                    if exclude_user is not None and self._requests[request_id][0].user_name == exclude_user:
+                        continue
+                    rank = (apart is None, apart or 0, (other_start, other_end) != (start, end),
+                            -shared, request_id)
+                    if request_id not in best or rank < best[request_id]:
+                        best[request_id] = rank
+                    kept += 1
+                    if kept == limit and apart is not None:
+                        cutoff = apart
+            matches = []
+            for rank in heapq.nsmallest(limit, best.values()):
+                _, apart, other_route, shared, request_id = rank
+                request = self._requests[request_id][0]
+                matches.append(CompanionMatch(
+                    request.id, request.user_name, request.time_of_boarding, request.phone_number,
+                    request.boarding_station, request.destination_station,
+                    None if rank[0] else apart, -shared, not other_route))
+        return matches
+
+
+def _nearest_first(keys, key, window):
+    """(key, id) entries within `window` of key, in order of distance from it"""
+    left = bisect_left(keys, (key, -1)) - 1
+    right = left + 1
+    while True:
+        left_gap = key - keys[left][0] if left >= 0 else None
+        right_gap = keys[right][0] - key if right < len(keys) else None
+        if left_gap is not None and left_gap > window:
+            left_gap, left = None, -1
+        if right_gap is not None and right_gap > window:
+            right_gap, right = None, len(keys)
+        if left_gap is None and right_gap is None:
+            return
+        if right_gap is None or (left_gap is not None and left_gap <= right_gap):
+            yield keys[left]
+            left -= 1
+        else:
+            yield keys[right]
+            right += 1
@@ -0,0 +1,726 @@
+"""Complaint, travel companion and volunteer functions"""
+import os
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import NamedTuple, Optional
+
+from khoj import events, rollups, stations
+from khoj.companions import CompanionIndex, OpenJourney
+from khoj.matching import ItemRecord, blocking_keys, key_columns, match_reports
+from khoj.search import ItemSearchIndex
+from khoj.cache import invalidate as invalidate_dashboard_cache
+from khoj.db import run_concurrently, seconds_ago, seconds_from_now, transaction
+
+COMPLAINT_TABLES = ('lost_found', 'medical_assistance', 'womens_safety')
+
+# Status values in ENUM order (see khoj.schema)
+STATUSES = {
+    'lost_found': ['Pending', 'Received', 'Assigned to Volunteer', 'Searching',
+                   'Found', 'Out for Delivery', 'Resolved'],
+    'medical_assistance': ['Pending', 'Received', 'Assigned to Volunteer', 'In Progress',
+                           'Out for Assistance', 'Resolved'],
+    'womens_safety': ['Pending', 'Received', 'Assigned to Volunteer', 'In Progress',
+                      'Assistance Dispatched', 'Resolved'],
+}
+OPEN_STATUSES = ('Pending', 'Received')
+
+# Volunteer claims: open complaints held for one volunteer for a lease
+CLAIM_BATCH = int(os.environ.get('KHOJ_CLAIM_BATCH', '5'))
+CLAIM_LEASE_SECONDS = float(os.environ.get('KHOJ_CLAIM_LEASE_SECONDS', '900'))
+# Change feed reads reach this far back past their cursor (see application_changes)
+FEED_OVERLAP_SECONDS = float(os.environ.get('KHOJ_FEED_OVERLAP_SECONDS', '5'))
+
+
+class ComplaintClaimed(Exception):
+    """Raised when another volunteer holds a live claim on the complaint"""
+
+
+# Complaint Management Functions
+# Columns a user submission fills in, per complaint table
+SUBMISSION_COLUMNS = {
+    'lost_found': ('user_name', 'train_number', 'compartment_number', 'seat_number',
+                   'item_description', 'phone_number'),
+    'medical_assistance': ('user_name', 'symptoms', 'station_left', 'arriving_station', 'assistance_type'),
+    'womens_safety': ('user_name', 'boarding_station', 'destination_station', 'time_of_boarding',
+                      'phone_number', 'travel_date', 'looking_for_companion'),
+}
+
+
+def insert_complaint(cursor, table_name, values, waited=None):
+    """Insert one submission (values by column, optionally created_at) and count it; returns its id
+
+    waited is how many seconds a queued submission (khoj.writebehind) waited;
+    without a created_at it is stamped that long before the database's time.
+    """
+    values = dict(values, **stations.station_ids(cursor, table_name, values), **blocking_keys(table_name, values))
+    columns = SUBMISSION_COLUMNS[table_name] + tuple(stations.id_columns(table_name) + key_columns(table_name))
+    placeholders = ['%s'] * len(columns)
+    params = [values[column] for column in columns]
+    if values.get('created_at'):
+        columns += ('created_at',)
+        placeholders.append('%s')
+        params.append(values['created_at'])
+    elif waited is not None:
+        columns += ('created_at',)
+        placeholders.append(seconds_ago())
+        params.append(int(waited))
+    cursor.execute(f"""
+        INSERT INTO {table_name}
+        ({', '.join(columns)}, updated_at)
+        VALUES ({', '.join(placeholders)}, CURRENT_TIMESTAMP)
+    """, params)
+    complaint_id = cursor.lastrowid
+    rollups.record_complaint(cursor, table_name, complaint_id)
+    events.record_created(cursor, table_name, complaint_id)
+    return complaint_id
+
+
+def complaints_written(written):
+    """Refresh in-process state after [(table_name, complaint_id, values)] commit"""
+    invalidate_dashboard_cache()
+    reports = []
+    for table_name, complaint_id, values in written:
+        if table_name == 'lost_found':
+            item_index.add(complaint_id, values['item_description'], values['train_number'],
+                           values['compartment_number'])
+            reports.append(ItemRecord(complaint_id, values['train_number'], values['compartment_number'],
+                                      values['item_description'], values.get('created_at') or datetime.now()))
+        if table_name == 'womens_safety' and values['looking_for_companion']:
+            companion_index.add(OpenJourney(
+                complaint_id, values['user_name'], values['boarding_station'], values['destination_station'],
+                values['time_of_boarding'], values['phone_number'], values['travel_date']))
+    if reports:
+        # Pair new reports with items staff have already found
+        match_reports(reports)
+
+
+def add_complaint(table_name, values):
+    with transaction() as cursor:
+        complaint_id = insert_complaint(cursor, table_name, values)
+    complaints_written([(table_name, complaint_id, values)])
+    return complaint_id
+
+
+def add_lost_found(user_name, train_number, compartment_number, seat_number, item_description, phone_number):
+    return add_complaint('lost_found', {
+        'user_name': user_name, 'train_number': train_number, 'compartment_number': compartment_number,
+        'seat_number': seat_number, 'item_description': item_description, 'phone_number': phone_number,
+    })
+
+
+def add_medical_assistance(user_name, symptoms, station_left, arriving_station, assistance_type):
+    return add_complaint('medical_assistance', {
+        'user_name': user_name, 'symptoms': symptoms, 'station_left': station_left,
+        'arriving_station': arriving_station, 'assistance_type': assistance_type,
+    })
+
+
+def add_womens_safety(user_name, boarding_station, destination_station, time_of_boarding, phone_number, travel_date, looking_for_companion):
+    return add_complaint('womens_safety', {
+        'user_name': user_name, 'boarding_station': boarding_station,
+        'destination_station': destination_station, 'time_of_boarding': time_of_boarding,
+        'phone_number': phone_number, 'travel_date': travel_date,
+        'looking_for_companion': looking_for_companion,
+    })
+
+
+# Lost & Found Search
+def _lost_found_reports(after_id, limit):
+    with transaction() as cursor:
+        cursor.execute(f"""
+            SELECT id, item_description, train_number, compartment_number
+            FROM lost_found WHERE id > %s ORDER BY id LIMIT {int(limit)}
+        """, (after_id,))
+        return cursor.fetchall()
+
+
+item_index = ItemSearchIndex(_lost_found_reports)
+
+
+def search_lost_found(query, limit=20):
+    """Best matching lost & found reports for query, as queue rows in rank order
+
+    Hits archived since the index read them are dropped from it, and the
+    search asks for twice as many until it has `limit` live reports or runs
+    out of hits.
+    """
+    fetch = limit
+    while True:
+        hits = item_index.search(query, fetch)
+        if not hits:
+            return []
+        with transaction() as cursor:
+            cursor.execute(f"""
+                SELECT {QUEUE_COLUMNS['lost_found']}
+                FROM lost_found t WHERE t.id IN ({', '.join(['%s'] * len(hits))})
+            """, tuple(hit.id for hit in hits))
+            rows = {row[0]: row for row in cursor.fetchall()}
+        live = [rows[hit.id] for hit in hits if hit.id in rows]
+        if len(live) < len(hits):
+            item_index.remove([hit.id for hit in hits if hit.id not in rows])
+        if len(live) >= limit or len(hits) < fetch:
+            return live[:limit]
+        fetch *= 2
+
+
+# Travel Companion Functions
+def _open_journeys():
+    """Open, upcoming women's safety requests that asked for a companion"""
+    open_statuses = [status for status in STATUSES['womens_safety'] if status != 'Resolved']
+    with transaction() as cursor:
+        cursor.execute(f"""
+            SELECT id, user_name, boarding_station, destination_station, time_of_boarding,
+                   phone_number, travel_date, boarding_station_id, destination_station_id
+            FROM womens_safety
+            WHERE status IN ({', '.join(['%s'] * len(open_statuses))})
+            AND looking_for_companion = TRUE
+            AND travel_date >= %s
+        """, (*open_statuses, date.today()))
+        return [OpenJourney(*row) for row in cursor.fetchall()]
+
+
+companion_index = CompanionIndex(_open_journeys)
+
+
+def find_travel_companions(boarding_station, destination_station, travel_date, time_of_boarding=None,
+                           window=None, exclude_user=None):
+    """Ranked CompanionMatch rows from the in-memory index (see khoj.companions)"""
+    return companion_index.match(boarding_station, destination_station, travel_date,
+                                 time_of_boarding, window, exclude_user)
+
+
+def request_companion(request_id, companion_name, companion_phone):
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO travel_companions
+            (request_id, companion_name, companion_phone)
+            VALUES (%s, %s, %s)
+        """, (request_id, companion_name, companion_phone))
+
+
+def respond_to_companion_request(companion_request_id, accepted, companion_phone=None):
+    with transaction() as cursor:
+        if accepted:
+            cursor.execute("""
+                UPDATE travel_companions
+                SET status='Accepted', companion_phone=%s
+                WHERE id=%s
+            """, (companion_phone, companion_request_id))
+        else:
+            cursor.execute("""
+                UPDATE travel_companions
+                SET status='Rejected'
+                WHERE id=%s
+            """, (companion_request_id,))
+
+
+def get_companion_requests(user_name):
+    return _user_section('travel_companions', user_name)
+
+
+# Volunteer Functions
+# Columns holding a complaint's current volunteer; volunteer_assignments keeps
+# every assignment, the complaint row only the latest one
+ASSIGNEE_COLUMNS = {
+    'volunteer_name': 'assigned_volunteer_name',
+    'volunteer_phone': 'assigned_volunteer_phone',
+    'volunteer_email': 'assigned_volunteer_email',
+    'assigned_at': 'assigned_at',
+}
+
+
+def _insert_assignment(cursor, complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email):
+    cursor.execute("""
+        INSERT INTO volunteer_assignments
+        (complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email))
+    cursor.execute(f"""
+        UPDATE {complaint_type}
+        SET assigned_volunteer_name=%s, assigned_volunteer_phone=%s, assigned_volunteer_email=%s,
+            assigned_at=CURRENT_TIMESTAMP, updated_at=CURRENT_TIMESTAMP
+        WHERE id=%s
+    """, (volunteer_name, volunteer_phone, volunteer_email, complaint_id))
+
+
+def assign_volunteer(complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email):
+    if complaint_type not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {complaint_type}")
+    with transaction() as cursor:
+        _insert_assignment(cursor, complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email)
+
+
+def backfill_assignees(cursor, tables=COMPLAINT_TABLES):
+    """Copy each complaint's latest volunteer_assignments row into its assignee columns"""
+    for table in tables:
+        latest = f"""(
+            SELECT va.{{column}} FROM volunteer_assignments va
+            WHERE va.complaint_type = '{table}' AND va.complaint_id = {table}.id
+            ORDER BY va.id DESC LIMIT 1
+        )"""
+        assignments = ', '.join(f"{column} = {latest.format(column=source)}"
+                                for source, column in ASSIGNEE_COLUMNS.items())
+        cursor.execute(f"""
+            UPDATE {table} SET {assignments}
+            WHERE id IN (SELECT complaint_id FROM volunteer_assignments WHERE complaint_type = '{table}')
+        """)
+
+
+# Volunteer work queues: open complaints plus everything assigned to the
+# volunteer, ordered by status (in ENUM order), then newest first. Pages are
+# keyset-paginated on (status, created_at, id), one index range scan per status.
+QUEUE_PAGE_SIZE = 25
+
+QUEUE_COLUMNS = {
+    'lost_found': "t.id, t.user_name, t.train_number, t.compartment_number, t.seat_number, "
+                  "t.item_description, t.phone_number, t.status, t.created_at",
+    'medical_assistance': "t.id, t.user_name, t.symptoms, t.station_left, t.arriving_station, "
+                          "t.assistance_type, t.status, t.created_at",
+    'womens_safety': "t.id, t.user_name, t.boarding_station, t.destination_station, "
+                     "t.time_of_boarding, t.phone_number, t.status, t.created_at",
+}
+
+
+def _queue_filters(table_name, train_number=None, station=None, assistance_type=None, since=None, until=None,
+                   claimed_by=None):
+    clauses, params = [], []
+    if claimed_by:
+        clauses.append("t.claimed_by = %s AND t.claim_expires_at >= CURRENT_TIMESTAMP")
+        params.append(claimed_by)
+    if train_number:
+        if table_name != 'lost_found':
+            raise ValueError("train_number only filters lost_found")
+        clauses.append("t.train_number = %s")
+        params.append(train_number)
+    if station:
+        if table_name == 'medical_assistance':
+            clauses.append("(t.station_left_id = %s OR t.arriving_station_id = %s)")
+        elif table_name == 'womens_safety':
+            clauses.append("(t.boarding_station_id = %s OR t.destination_station_id = %s)")
+        else:
+            raise ValueError("station does not filter lost_found")
+        # Any spelling of the station; one that matches no station matches no rows (= NULL)
+        station_id = stations.registry.lookup(station)
+        params += [station_id, station_id]
+    if assistance_type:
+        if table_name != 'medical_assistance':
+            raise ValueError("assistance_type only filters medical_assistance")
+        clauses.append("t.assistance_type = %s")
+        params.append(assistance_type)
+    if since:
+        clauses.append("t.created_at >= %s")
+        params.append(since)
+    if until:
+        clauses.append("t.created_at < %s")
+        params.append(until + timedelta(days=1))
+    return clauses, params
+
+
+def get_queue_page(table_name, volunteer_email=None, after=None, limit=QUEUE_PAGE_SIZE, **filters):
+    """One page of a volunteer work queue
+
+    Returns (rows, next_cursor); pass next_cursor back as `after` for the
+    following page. next_cursor is None on the last page. Filters:
+    train_number, station, assistance_type, since and until (dates), and
+    claimed_by (a volunteer's live claims only).
+    """
+    if table_name not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {table_name}")
+    filter_clauses, filter_params = _queue_filters(table_name, **filters)
+    statuses = STATUSES[table_name]
+    first = statuses.index(after[0]) if after else 0
+    rows = []
+    with transaction() as cursor:
+        for status in statuses[first:]:
+            if status not in OPEN_STATUSES and not volunteer_email:
+                continue
+            clauses, params = ["t.status = %s"], [status]
+            if status in OPEN_STATUSES and volunteer_email:
+                # Open complaints another volunteer has claimed are theirs until the lease runs out
+                clauses.append("(t.claimed_by IS NULL OR t.claimed_by = %s OR t.claim_expires_at < CURRENT_TIMESTAMP)")
+                params.append(volunteer_email)
+            if status not in OPEN_STATUSES:
+                # Closed statuses only show complaints currently assigned to this volunteer
+                clauses.append("t.assigned_volunteer_email = %s")
+                params.append(volunteer_email)
+            if after and status == after[0]:
+                clauses.append("(t.created_at < %s OR (t.created_at = %s AND t.id < %s))")
+                params += [after[1], after[1], after[2]]
+            cursor.execute(f"""
+                SELECT {QUEUE_COLUMNS[table_name]}
+                FROM {table_name} t
+                WHERE {' AND '.join(clauses + filter_clauses)}
+                ORDER BY t.created_at DESC, t.id DESC
+                LIMIT {int(limit) + 1 - len(rows)}
+            """, params + filter_params)
+            rows += cursor.fetchall()
+            if len(rows) > limit:
+                break
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, (last[-2], last[-1], last[0])
+
+
+def _whole_queue(table_name, volunteer_email):
+    rows, after = [], None
+    while True:
+        page, after = get_queue_page(table_name, volunteer_email, after, limit=500)
+        rows += page
+        if after is None:
+            return rows
+
+
+def get_lost_found_complaints(volunteer_email=None):
+    return _whole_queue('lost_found', volunteer_email)
+
+
+def get_medical_assistance_complaints(volunteer_email=None):
+    return _whole_queue('medical_assistance', volunteer_email)
+
+
+def get_womens_safety_complaints(volunteer_email=None):
+    return _whole_queue('womens_safety', volunteer_email)
+
+
+def update_complaint_status(table_name, complaint_id, new_status, acting_email, volunteer_details=None):
+    """Move a complaint to new_status on behalf of the volunteer acting_email (None for scripts)
+
+    Raises ComplaintClaimed when someone other than acting_email holds a live
+    claim on the complaint, whatever the new status.
+    """
+    if table_name not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {table_name}")
+    with transaction() as cursor:
+        # Lock the row first so concurrent updates retract the right status bucket
+        cursor.execute(f"""
+            SELECT status, assigned_volunteer_email,
+                   CASE WHEN claim_expires_at >= CURRENT_TIMESTAMP THEN claimed_by END
+            FROM {table_name} WHERE id=%s FOR UPDATE
+        """, (complaint_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        old_status, volunteer_email, claimed_by = row
+        if claimed_by and claimed_by != acting_email:
+            raise ComplaintClaimed(f"{table_name} #{complaint_id} is claimed by {claimed_by}")
+        reassigned = new_status == 'Assigned to Volunteer' and volunteer_details
+        rollups.retract_status(cursor, table_name, complaint_id)
+        if new_status in OPEN_STATUSES:
+            cursor.execute(f"UPDATE {table_name} SET status=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s",
+                           (new_status, complaint_id))
+        else:
+            # A claim only holds open complaints
+            cursor.execute(f"""
+                UPDATE {table_name}
+                SET status=%s, claimed_by=NULL, claim_expires_at=NULL, updated_at=CURRENT_TIMESTAMP
+                WHERE id=%s
+            """, (new_status, complaint_id))
+        rollups.record_status(cursor, table_name, complaint_id)
+        if reassigned:
+            _insert_assignment(
+                cursor,
+                table_name,
+                complaint_id,
+                volunteer_details['name'],
+                volunteer_details['phone'],
+                volunteer_details['email']
+            )
+            volunteer_email = volunteer_details['email']
+        if new_status != old_status or reassigned:
+            events.record(cursor, table_name, complaint_id, old_status, new_status, volunteer_email)
+    invalidate_dashboard_cache()
+    if table_name == 'womens_safety' and new_status == 'Resolved':
+        companion_index.discard(complaint_id)
+
+
+# Claims: each volunteer takes the oldest open complaints nobody else holds.
+# A claim lasts CLAIM_LEASE_SECONDS of database time, the clock the change
+# feed uses, so every server sees the same expiry; an expired claim is free
+# for the next volunteer without any cleanup job. On MySQL concurrent claimers
+# skip each other's locked rows (SKIP LOCKED); the guarded UPDATE keeps a
+# complaint from being claimed twice on any backend.
+def claim_complaints(table_name, volunteer_email, limit=CLAIM_BATCH, lease=CLAIM_LEASE_SECONDS):
+    """Claim open complaints until the volunteer holds `limit`; returns the held ones as queue rows
+
+    Claims the volunteer already holds are renewed for another lease and
+    count towards the limit, so calling this on every page load is safe.
+    """
+    if table_name not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {table_name}")
+    open_list = ', '.join(['%s'] * len(OPEN_STATUSES))
+    with transaction() as cursor:
+        cursor.execute(f"""
+            UPDATE {table_name} SET claim_expires_at={seconds_from_now()}
+            WHERE claimed_by=%s AND claim_expires_at >= CURRENT_TIMESTAMP AND status IN ({open_list})
+        """, (lease, volunteer_email, *OPEN_STATUSES))
+        wanted = limit - cursor.rowcount
+        for status in OPEN_STATUSES:
+            if wanted <= 0:
+                break
+            cursor.execute(f"""
+                SELECT id FROM {table_name} t
+                WHERE t.status = %s AND (t.claimed_by IS NULL OR t.claim_expires_at < CURRENT_TIMESTAMP)
+                ORDER BY t.created_at, t.id
+                LIMIT {int(wanted)}
+                FOR UPDATE SKIP LOCKED
+            """, (status,))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                continue
+            cursor.execute(f"""
+                UPDATE {table_name}
+                SET claimed_by=%s, claim_expires_at={seconds_from_now()}, updated_at=CURRENT_TIMESTAMP
+                WHERE id IN ({', '.join(['%s'] * len(ids))}) AND status=%s
+                AND (claimed_by IS NULL OR claim_expires_at < CURRENT_TIMESTAMP)
+            """, (volunteer_email, lease, *ids, status))
+            wanted -= cursor.rowcount
+        cursor.execute(f"""
+            SELECT {QUEUE_COLUMNS[table_name]}
+            FROM {table_name} t
+            WHERE t.claimed_by = %s AND t.claim_expires_at >= CURRENT_TIMESTAMP AND t.status IN ({open_list})
+            ORDER BY t.created_at, t.id
+        """, (volunteer_email, *OPEN_STATUSES))
+        return cursor.fetchall()
+
+
+def release_claims(table_name, volunteer_email, complaint_ids=None):
+    """Give up the volunteer's claims (all of them, or complaint_ids); returns how many were released"""
+    if table_name not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {table_name}")
+    clauses, params = ["claimed_by = %s"], [volunteer_email]
+    if complaint_ids is not None:
+        if not complaint_ids:
+            return 0
+        clauses.append(f"id IN ({', '.join(['%s'] * len(complaint_ids))})")
+        params += list(complaint_ids)
+    with transaction() as cursor:
+        cursor.execute(f"""
+            UPDATE {table_name} SET claimed_by=NULL, claim_expires_at=NULL, updated_at=CURRENT_TIMESTAMP
+            WHERE {' AND '.join(clauses)}
+        """, params)
+        return cursor.rowcount
+
+
+# Track Applications
+class LostFoundApplication(NamedTuple):
+    id: int
+    train_number: str
+    compartment_number: str
+    seat_number: str
+    item_description: str
+    phone_number: str
+    status: str
+    created_at: datetime
+    volunteer_name: Optional[str]
+    volunteer_phone: Optional[str]
+    volunteer_email: Optional[str]
+    assigned_at: Optional[datetime]
+
+
+class MedicalApplication(NamedTuple):
+    id: int
+    symptoms: str
+    station_left: str
+    arriving_station: str
+    assistance_type: str
+    status: str
+    created_at: datetime
+    volunteer_name: Optional[str]
+    volunteer_phone: Optional[str]
+    volunteer_email: Optional[str]
+    assigned_at: Optional[datetime]
+
+
+class SafetyApplication(NamedTuple):
+    id: int
+    boarding_station: str
+    destination_station: str
+    time_of_boarding: str
+    phone_number: str
+    status: str
+    created_at: datetime
+    volunteer_name: Optional[str]
+    volunteer_phone: Optional[str]
+    volunteer_email: Optional[str]
+    assigned_at: Optional[datetime]
+
+
+class CompanionRequest(NamedTuple):
+    id: int
+    requester_name: str
+    companion_name: str
+    boarding_station: str
+    destination_station: str
+    travel_date: date
+    time_of_boarding: str
+    status: str
+    created_at: datetime
+    requester_phone: str
+    companion_phone: str
+
+
+def _companion_select(archived=False):
+    # Companions are archived with their request, so each side joins its own tables
+    suffix = '_archive' if archived else ''
+    return f"""
+    SELECT tc.id, ws.user_name AS requester_name, tc.companion_name,
+           ws.boarding_station, ws.destination_station, ws.travel_date,
+           ws.time_of_boarding, tc.status, tc.created_at AS created_at,
+           ws.phone_number AS requester_phone,
+           tc.companion_phone
+    FROM travel_companions{suffix} tc
+    JOIN womens_safety{suffix} ws ON tc.request_id = ws.id
+"""
+
+
+_COMPANION_SELECT = _companion_select()
+
+# Complaint table -> (record type, columns before the assignee columns)
+APPLICATION_COLUMNS = {
+    'lost_found': (LostFoundApplication, "t.id, t.train_number, t.compartment_number, t.seat_number, "
+                                         "t.item_description, t.phone_number, t.status, t.created_at"),
+    'medical_assistance': (MedicalApplication, "t.id, t.symptoms, t.station_left, t.arriving_station, "
+                                               "t.assistance_type, t.status, t.created_at"),
+    'womens_safety': (SafetyApplication, "t.id, t.boarding_station, t.destination_station, "
+                                         "t.time_of_boarding, t.phone_number, t.status, t.created_at"),
+}
+
+
+def _applications_sql(table, changed=False):
+    """A user's complaints in table, newest first; changed=True adds an updated_at >= %s condition
+
+    Full loads include the user's archived complaints; archived rows never
+    change, so deltas only read the live table.
+    """
+    select = f"""
+        SELECT {APPLICATION_COLUMNS[table][1]},
+               t.assigned_volunteer_name, t.assigned_volunteer_phone,
+               t.assigned_volunteer_email, t.assigned_at
+    """
+    if changed:
+        return select + f"""
+        FROM {table} t
+        WHERE t.user_name = %s AND t.updated_at >= %s
+        ORDER BY t.created_at DESC
+    """
+    return select + f"""
+        FROM {table} t
+        WHERE t.user_name = %s
+        UNION ALL
+    """ + select + f"""
+        FROM {table}_archive t
+        WHERE t.user_name = %s
+        ORDER BY created_at DESC
+    """
+
+
+# section -> (record type, query taking the user name as every parameter)
+APPLICATION_SECTIONS = {
+    **{table: (record, _applications_sql(table)) for table, (record, _) in APPLICATION_COLUMNS.items()},
+    # Requests the user made or received; a UNION keeps both sides on an index
+    'travel_companions': (CompanionRequest, _COMPANION_SELECT + """
+        WHERE ws.user_name = %s
+        UNION
+    """ + _COMPANION_SELECT + """
+        WHERE tc.companion_name = %s
+        UNION
+    """ + _companion_select(archived=True) + """
+        WHERE ws.user_name = %s
+        UNION
+    """ + _companion_select(archived=True) + """
+        WHERE tc.companion_name = %s
+        ORDER BY created_at DESC
+    """),
+}
+
+
+def _user_section(section, user_name):
+    record, sql = APPLICATION_SECTIONS[section]
+    with transaction() as cursor:
+        cursor.execute(sql, (user_name,) * sql.count('%s'))
+        return [record(*row) for row in cursor.fetchall()]
+
+
+def fetch_user_applications(user_name, sections=tuple(APPLICATION_SECTIONS)):
+    """A user's applications by section, one concurrent query per section
+
+    Page latency tracks the slowest section rather than the sum of all of them.
+    """
+    sections = list(sections)
+    results = run_concurrently(*[partial(_user_section, section, user_name) for section in sections])
+    return dict(zip(sections, results))
+
+
+# Change feed: complaint writes stamp updated_at with the database clock, and
+# a feed cursor is the database time a read started. Reads go back
+# FEED_OVERLAP_SECONDS before the cursor so a transaction that committed late
+# is not missed; callers merge rows by id, so seeing a row twice is harmless.
+# Rows not written since the column was added have no updated_at and only
+# appear in full loads.
+def _database_now(cursor):
+    cursor.execute("SELECT CURRENT_TIMESTAMP")
+    now = cursor.fetchone()[0]
+    return now if isinstance(now, datetime) else datetime.fromisoformat(now)
+
+
+def _feed_since(since):
+    return since - timedelta(seconds=FEED_OVERLAP_SECONDS)
+
+
+def application_changes(section, user_name, since=None):
+    """(records, cursor): a user's applications in section changed since the cursor `since`
+
+    since=None loads every application. Pass the returned cursor back for
+    the next delta. Travel companion requests have no watermark, so that
+    section is always loaded in full and its cursor is None.
+    """
+    if section not in APPLICATION_COLUMNS:
+        return _user_section(section, user_name), None
+    record = APPLICATION_COLUMNS[section][0]
+    with transaction() as cursor:
+        now = _database_now(cursor)
+        if since is None:
+            sql = _applications_sql(section)
+            cursor.execute(sql, (user_name,) * sql.count('%s'))
+        else:
+            cursor.execute(_applications_sql(section, changed=True), (user_name, _feed_since(since)))
+        return [record(*row) for row in cursor.fetchall()], now
+
+
+def changed_since(table_name, since, user_name=None, claims_since=None):
+    """Whether any complaint in table_name (of user_name, if given) changed since the cursor `since`
+
+    A claim lease running out writes nothing, yet puts the complaint back in
+    other volunteers' queues. With claims_since (a feed cursor: leases are
+    database time too) a lease that ran out after it counts as a change too.
+    """
+    if table_name not in COMPLAINT_TABLES:
+        raise ValueError(f"Unknown complaint table: {table_name}")
+    clauses, params = ["updated_at >= %s"], [_feed_since(since)]
+    if user_name is not None:
+        clauses.insert(0, "user_name = %s")
+        params.insert(0, user_name)
+    with transaction() as cursor:
+        cursor.execute(f"SELECT 1 FROM {table_name} WHERE {' AND '.join(clauses)} LIMIT 1", params)
+        if cursor.fetchall():
+            return True
+        if claims_since is None:
+            return False
+        cursor.execute(f"""
+            SELECT 1 FROM {table_name}
+            WHERE claim_expires_at >= %s AND claim_expires_at < CURRENT_TIMESTAMP LIMIT 1
+        """, (claims_since,))
+        return bool(cursor.fetchall())
+
+
+def feed_cursor():
+    """A cursor for changed_since/application_changes: the database's current time"""
+    with transaction() as cursor:
+        return _database_now(cursor)
+
+
+def get_user_complaints(user_name):
+    return fetch_user_applications(user_name, COMPLAINT_TABLES)
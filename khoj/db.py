@@ -0,0 +1,514 @@
+"""Database connection layer for KHOJ
+
+Streamlit re-executes KHOJ1.py on every widget interaction, but imported
+modules stay cached in the process. The pool below therefore lives for the
+lifetime of the server and is shared by every session; each data function
+checks a connection out for one operation and hands it straight back.
+
+Set KHOJ_DB_BACKEND=sqlite to run against a local SQLite file instead of
+MySQL (useful for tests and benchmarks without a MySQL server).
+"""
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+from khoj import metrics
+
+try:
+    import mysql.connector
+except ImportError:  # only the SQLite stand-in is available
+    mysql = None
+
+
+# Configuration
+DB_CONFIG = {
+    'host': os.environ.get('KHOJ_DB_HOST', 'localhost'),
+    'user': os.environ.get('KHOJ_DB_USER', 'root'),
+    'password': os.environ.get('KHOJ_DB_PASSWORD', 'root'),
+    'database': os.environ.get('KHOJ_DB_NAME', 'khoj_db1'),
+}
+BACKEND = os.environ.get('KHOJ_DB_BACKEND', 'mysql')
+SQLITE_PATH = os.environ.get('KHOJ_SQLITE_PATH', 'khoj.sqlite3')
+POOL_SIZE = int(os.environ.get('KHOJ_DB_POOL_SIZE', '8'))
+CHECKOUT_TIMEOUT = float(os.environ.get('KHOJ_DB_CHECKOUT_TIMEOUT', '10'))
+# Connections idle for longer than this are pinged before being handed out
+HEALTH_CHECK_INTERVAL = float(os.environ.get('KHOJ_DB_HEALTH_CHECK_INTERVAL', '30'))
+# Worker threads for run_concurrently(); keep below the pool size
+PARALLEL_QUERIES = int(os.environ.get('KHOJ_DB_PARALLEL_QUERIES', '4'))
+
+IntegrityError = (sqlite3.IntegrityError,)
+DataError = (sqlite3.DataError,)  # a value the column cannot hold (MySQL strict mode)
+OperationalError = (sqlite3.OperationalError,)  # lost connections, lock timeouts, some bad values
+if mysql is not None:
+    IntegrityError += (mysql.connector.IntegrityError,)
+    DataError += (mysql.connector.DataError,)
+    OperationalError += (mysql.connector.OperationalError,)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout"""
+
+
+# SQLite stand-in
+def _mysql_hour(value):
+    if value is None:
+        return None
+    return int(str(value)[11:13] or 0)
+
+
+def _mysql_dayofweek(value):
+    """MySQL DAYOFWEEK(): 1 = Sunday ... 7 = Saturday"""
+    if value is None:
+        return None
+    return (date.fromisoformat(str(value)[:10]).weekday() + 1) % 7 + 1
+
+
+def _mysql_concat(*values):
+    if any(value is None for value in values):
+        return None
+    return ''.join(str(value) for value in values)
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('TIMESTAMP', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATE', lambda raw: date.fromisoformat(raw.decode()[:10]))
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql):
+    """Rewrite the MySQL dialect used across KHOJ into SQLite"""
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\bINT AUTO_INCREMENT PRIMARY KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+    sql = re.sub(r"\bENUM\s*\([^)]*\)", 'TEXT', sql)
+    sql = re.sub(r'\s+FOR UPDATE(\s+SKIP LOCKED)?', '', sql)
+    return sql
+
+
+def on_duplicate_key(key_columns, assignments):
+    """Upsert clause for the active dialect; assignments use the stored row's columns"""
+    if dialect() == 'mysql':
+        return f"ON DUPLICATE KEY UPDATE {assignments}"
+    return f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {assignments}"
+
+
+def inserted_value(column):
+    """The value the conflicting INSERT carried for column, inside an upsert clause"""
+    return f"VALUES({column})" if dialect() == 'mysql' else f"excluded.{column}"
+
+
+def inserted_ids(cursor, rows):
+    """(first, last) ids of the `rows` rows a multi-row INSERT just wrote
+
+    MySQL reports the statement's first id and SQLite its last; both number
+    the rows of one statement consecutively.
+    """
+    if dialect() == 'mysql':
+        return cursor.lastrowid, cursor.lastrowid + rows - 1
+    return cursor.lastrowid - rows + 1, cursor.lastrowid
+
+
+def seconds_ago(param='%s'):
+    """The database's current time less param seconds, as a SQL expression"""
+    if dialect() == 'mysql':
+        return f"CURRENT_TIMESTAMP - INTERVAL {param} SECOND"
+    return f"DATETIME(CURRENT_TIMESTAMP, '-' || {param} || ' seconds')"
+
+
+def seconds_from_now(param='%s'):
+    """The database's current time plus param seconds, as a SQL expression"""
+    if dialect() == 'mysql':
+        return f"CURRENT_TIMESTAMP + INTERVAL {param} SECOND"
+    return f"DATETIME(CURRENT_TIMESTAMP, '+' || {param} || ' seconds')"
+
+
+class SQLiteCursor:
+    """DB-API cursor that accepts the MySQL paramstyle and dialect"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class SQLiteConnection:
+    """Minimal mysql.connector look-alike backed by sqlite3"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            timeout=CHECKOUT_TIMEOUT,
+        )
+        self._conn.create_function('HOUR', 1, _mysql_hour, deterministic=True)
+        self._conn.create_function('DAYOFWEEK', 1, _mysql_dayofweek, deterministic=True)
+        self._conn.create_function('CONCAT', -1, _mysql_concat, deterministic=True)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode = WAL')
+
+    def cursor(self, **kwargs):
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def ping(self):
+        self._conn.execute('SELECT 1').fetchone()
+
+
+def mysql_connector(**overrides):
+    if mysql is None:
+        raise RuntimeError("mysql-connector-python is not installed; set KHOJ_DB_BACKEND=sqlite")
+    config = dict(DB_CONFIG, **overrides)
+    return lambda: mysql.connector.connect(**config)
+
+
+def sqlite_connector(path=None):
+    path = path or SQLITE_PATH
+    return lambda: SQLiteConnection(path)
+
+
+# Connection Pool
+class ConnectionPool:
+    """Bounded, thread-safe pool of database connections"""
+
+    def __init__(self, connect, dialect, size=POOL_SIZE, timeout=CHECKOUT_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.dialect = dialect
+        self._connect = connect
+        self._size = size
+        self._timeout = timeout
+        self._health_check_interval = health_check_interval
+        self._idle = []  # (connection, last_released_at)
+        self._cond = threading.Condition()
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._checkout_seconds = 0.0
+        self._checkout_seconds_max = 0.0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._closed = False
+
+    def acquire(self):
+        started = time.perf_counter()
+        deadline = time.monotonic() + self._timeout
+        conn = None
+        last_used = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._created < self._size:
+                        self._created += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection free after {self._timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - last_used > self._health_check_interval and not self._is_alive(conn):
+                self._close_quietly(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            self._checkouts += 1
+            self._checkout_seconds += elapsed
+            self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._created -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard or self._closed:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            # A connection that cannot even roll back is broken; don't reuse it
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'checkout_avg_ms': (self._checkout_seconds / self._checkouts * 1000) if self._checkouts else 0.0,
+                'checkout_max_ms': self._checkout_seconds_max * 1000,
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _build_pool(backend=None, sqlite_path=None, size=None, **mysql_overrides):
+    backend = backend or BACKEND
+    if backend == 'sqlite':
+        connect = sqlite_connector(sqlite_path)
+    elif backend == 'mysql':
+        connect = mysql_connector(**mysql_overrides)
+    else:
+        raise ValueError(f"Unknown database backend: {backend}")
+    return ConnectionPool(connect, backend, size=size or POOL_SIZE)
+
+
+def configure(backend=None, sqlite_path=None, size=None, **mysql_overrides):
+    """Replace the process-wide pool, e.g. to point tests at SQLite"""
+    global _pool
+    pool = _build_pool(backend, sqlite_path, size, **mysql_overrides)
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    if previous is not None:
+        previous.close()
+    return pool
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _build_pool()
+    return _pool
+
+
+def dialect():
+    return get_pool().dialect
+
+
+def pool_metrics():
+    return get_pool().metrics()
+
+
+class _RecordingCursor:
+    """Cursor proxy that logs every statement it executes"""
+
+    def __init__(self, cursor, log):
+        self._cursor = cursor
+        self._log = log
+
+    def execute(self, sql, params=()):
+        self._log.append((sql, params))
+        return self._cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+# A context variable rather than a thread-local, so run_concurrently() can
+# carry an active capture into its worker threads
+_capture_log = contextvars.ContextVar('khoj_capture_log', default=None)
+
+
+@contextmanager
+def capture_statements():
+    """Record (sql, params) for every statement run in this context"""
+    log = []
+    token = _capture_log.set(log)
+    try:
+        yield log
+    finally:
+        _capture_log.reset(token)
+
+
+def new_cursor(conn, buffered=True):
+    # Buffered so a cursor can be reused before every row has been read;
+    # unbuffered cursors stream rows from the server as they are fetched
+    if dialect() == 'mysql':
+        cursor = conn.cursor(buffered=buffered)
+    else:
+        cursor = conn.cursor()
+    cursor = metrics.instrument(cursor)
+    log = _capture_log.get()
+    return cursor if log is None else _RecordingCursor(cursor, log)
+
+
+@contextmanager
+def connection():
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def transaction(buffered=True):
+    """Check out a connection for one operation and commit when it succeeds
+
+    Read-only callers go through here too: committing ends the snapshot so a
+    pooled connection never serves stale REPEATABLE READ data. Pass
+    buffered=False to stream a large result with fetchmany(); read it to the
+    end before running another statement. Callbacks given to after_commit()
+    run once it has committed and the connection is back in the pool.
+    """
+    state = {'after_commit': []}
+    with connection() as conn:
+        cursor = new_cursor(conn, buffered)
+        token = _transaction_state.set(state)
+        try:
+            yield cursor
+            conn.commit()
+        finally:
+            _transaction_state.reset(token)
+            cursor.close()
+    for callback in state['after_commit']:
+        callback()
+
+
+_transaction_state = contextvars.ContextVar('khoj_transaction_state', default=None)
+
+
+def transaction_state():
+    """A dict kept for the innermost transaction() open in this context; None outside one"""
+    return _transaction_state.get()
+
+
+def after_commit(callback):
+    """Call callback once the innermost open transaction() commits (never if it rolls back)
+
+    Outside a transaction it is called straight away. Use it to publish to
+    in-process caches what the transaction wrote.
+    """
+    state = _transaction_state.get()
+    if state is None:
+        callback()
+    else:
+        state['after_commit'].append(callback)
+
+
+_executor = None
+
+
+def run_concurrently(*calls):
+    """Run zero-argument callables in parallel, each on its own pooled connection
+
+    Returns their results in order; the first exception is re-raised.
+    """
+    global _executor
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PARALLEL_QUERIES, thread_name_prefix='khoj-db')
+    futures = [_executor.submit(contextvars.copy_context().run, call) for call in calls]
+    return [future.result() for future in futures]
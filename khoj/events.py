@@ -0,0 +1,115 @@
+"""Append-only status history of complaints
+
+Every status change writes one complaint_status_events row in the same
+transaction as the change itself (see khoj.complaints and khoj.matching); a
+complaint's first row has no from_status and records its status when it was
+filed. Timelines and time-in-state figures are read from this table alone,
+one index range per complaint type.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+from khoj import snapshot
+from khoj.db import transaction
+
+EVENTS_TABLE = '''CREATE TABLE IF NOT EXISTS complaint_status_events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    complaint_type VARCHAR(50) NOT NULL,
+    complaint_id INT NOT NULL,
+    from_status VARCHAR(50),
+    to_status VARCHAR(50) NOT NULL,
+    volunteer_email VARCHAR(100),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+
+class StatusEvent(NamedTuple):
+    from_status: Optional[str]
+    to_status: str
+    volunteer_email: Optional[str]
+    changed_at: datetime
+
+
+# Writes
+def record(cursor, table, complaint_id, from_status, to_status, volunteer_email=None):
+    """Log a status change (changed_at is the database's clock, like created_at)"""
+    cursor.execute("""
+        INSERT INTO complaint_status_events
+        (complaint_type, complaint_id, from_status, to_status, volunteer_email)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (table, complaint_id, from_status, to_status, volunteer_email))
+
+
+def record_created(cursor, table, complaint_id, last_id=None):
+    """Log a newly inserted complaint's initial status at its created_at
+
+    With last_id, logs every complaint from complaint_id to last_id, the ids
+    one multi-row INSERT gave its rows.
+    """
+    cursor.execute(f"""
+        INSERT INTO complaint_status_events
+        (complaint_type, complaint_id, from_status, to_status, volunteer_email, changed_at)
+        SELECT %s, id, NULL, status, assigned_volunteer_email, created_at FROM {table}
+        WHERE id BETWEEN %s AND %s ORDER BY id
+    """, (table, complaint_id, complaint_id if last_id is None else last_id))
+
+
+def backfill(cursor, tables=('lost_found', 'medical_assistance', 'womens_safety'), after_id=0):
+    """Log the current status of every complaint (id > after_id) that has no events yet
+
+    Complaints filed before the log existed get their current status at
+    their created_at, so their earlier transitions are unknown.
+    """
+    for table in tables:
+        cursor.execute(f"""
+            INSERT INTO complaint_status_events
+            (complaint_type, complaint_id, from_status, to_status, volunteer_email, changed_at)
+            SELECT %s, t.id, NULL, t.status, t.assigned_volunteer_email, t.created_at
+            FROM {table} t
+            WHERE t.id > %s AND NOT EXISTS (
+                SELECT 1 FROM complaint_status_events e
+                WHERE e.complaint_type = %s AND e.complaint_id = t.id
+            )
+            ORDER BY t.id
+        """, (table, after_id, table))
+
+
+# Reads
+def timeline(complaint_type, complaint_id):
+    """A complaint's StatusEvents, oldest first"""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT from_status, to_status, volunteer_email, changed_at
+            FROM complaint_status_events
+            WHERE complaint_type = %s AND complaint_id = %s
+            ORDER BY id
+        """, (complaint_type, complaint_id))
+        return [StatusEvent(*row) for row in cursor.fetchall()]
+
+
+def state_spans(complaint_type, since=None):
+    """Every stay of a complaint in a status, from events changed since `since` (a date)
+
+    One row per event: complaint_id, status, filed (the complaint's first
+    event), entered_at and left_at (NaT while the complaint is still in it).
+    """
+    where, params = "complaint_type = %s", [complaint_type]
+    if since:
+        where += " AND changed_at >= %s"
+        params.append(since)
+    with snapshot.reader() as cursor:
+        cursor.execute(f"""
+            SELECT complaint_id, to_status, from_status IS NULL, changed_at
+            FROM complaint_status_events
+            WHERE {where}
+            ORDER BY complaint_id, id
+        """, params)
+        rows = cursor.fetchall()
+    df = pd.DataFrame(rows, columns=['complaint_id', 'status', 'filed', 'entered_at'])
+    df['filed'] = df['filed'].astype(bool)
+    df['entered_at'] = pd.to_datetime(df['entered_at'])
+    same_complaint = df['complaint_id'].shift(-1) == df['complaint_id']
+    df['left_at'] = df['entered_at'].shift(-1).where(same_complaint)
+    return df
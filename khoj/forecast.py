@@ -0,0 +1,323 @@
+"""Per-station, per-complaint-type demand forecasts with weekly and daily seasonality
+
+One series per (complaint type, station) in complaint_rollup_daily; lost &
+found reports have no station, so they form a single series. Each series
+keeps a level (expected complaints on an average day), seven day-of-week
+factors and a 24-hour profile of how a day's complaints spread over the
+hours. A closed day updates them by exponential smoothing (Holt-Winters
+without trend):
+
+    level    <- LEVEL_ALPHA * total / weekday factor + (1 - LEVEL_ALPHA) * level
+    factor   <- WEEKDAY_GAMMA * total / level + (1 - WEEKDAY_GAMMA) * factor
+    profile  <- HOUR_BETA * hourly share + (1 - HOUR_BETA) * profile
+
+All series are held in numpy arrays and updated together, so folding in a
+day or forecasting a week costs a few array operations whatever the number
+of stations. The state arrays are stored in forecast_models as .npz bytes
+(never pickled) with the last day they have seen; an update only reads the
+rollups for days closed since then. The dashboard saves the days it folds in
+too, so a missed cron run is caught up once, not on every page load.
+
+    python -m khoj.forecast update       # fold in closed days (run from cron after midnight)
+    python -m khoj.forecast rebuild      # refit on the full history
+    python -m khoj.forecast backtest     # rolling-origin error against the flat 7-day mean
+"""
+import argparse
+import io
+import sys
+import time
+from datetime import date, timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from khoj import rollups
+from khoj.cache import invalidate as invalidate_dashboard_cache
+from khoj.db import on_duplicate_key, transaction
+
+LEVEL_ALPHA = 0.1
+WEEKDAY_GAMMA = 0.05
+HOUR_BETA = 0.02
+CHUNK_DAYS = 28  # days of rollups read and folded at a time
+MODEL_NAME = 'daily'
+
+MODELS_TABLE = '''CREATE TABLE IF NOT EXISTS forecast_models (
+    name VARCHAR(50) PRIMARY KEY,
+    model LONGBLOB NOT NULL,
+    through_day DATE NOT NULL,
+    series INT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+
+class BacktestResult(NamedTuple):
+    series: int
+    days: int  # days forecast and scored
+    mae: float  # mean absolute error per series-day
+    wape: float  # absolute error / actual complaints, in %
+    naive_mae: float  # the same for the flat mean of the last 7 days
+    naive_wape: float
+    fold_seconds: float  # total time spent folding in days
+    forecast_seconds: float  # mean time per forecast of every series
+
+
+class SeasonalForecaster:
+    """Day-of-week and hour-of-day seasonal forecasts for many series at once"""
+
+    def __init__(self, alpha=LEVEL_ALPHA, gamma=WEEKDAY_GAMMA, beta=HOUR_BETA):
+        self.alpha, self.gamma, self.beta = alpha, gamma, beta
+        self.keys = []  # (complaint_type, station) per series
+        self._ids = {}
+        self.level = np.zeros(0)
+        self.weekday = np.ones((0, 7))  # factor per date.weekday(), mean 1
+        self.hours = np.full((0, 24), 1 / 24)  # share of a day's complaints per hour
+        self.days_seen = np.zeros(0, dtype=np.int32)  # days folded since the series' first complaint
+        self.through = None  # last day folded in
+
+    def __len__(self):
+        return len(self.keys)
+
+    def series_ids(self, keys):
+        """Series index per (complaint_type, station) key, adding series for new keys"""
+        new = [key for key in dict.fromkeys(keys) if key not in self._ids]
+        if new:
+            for key in new:
+                self._ids[key] = len(self.keys)
+                self.keys.append(key)
+            self.level = np.concatenate([self.level, np.zeros(len(new))])
+            self.weekday = np.vstack([self.weekday, np.ones((len(new), 7))])
+            self.hours = np.vstack([self.hours, np.full((len(new), 24), 1 / 24)])
+            self.days_seen = np.concatenate([self.days_seen, np.zeros(len(new), dtype=np.int32)])
+        return np.array([self._ids[key] for key in keys], dtype=np.int64)
+
+    def fold(self, first_day, counts):
+        """Update every series with closed days: counts[day, series, hour] from first_day on"""
+        counts = np.asarray(counts, dtype=np.float64)
+        if counts.shape[1] < len(self):
+            counts = np.pad(counts, ((0, 0), (0, len(self) - counts.shape[1]), (0, 0)))
+        if self.through is not None:
+            if first_day <= self.through:
+                raise ValueError(f"{first_day} is already folded in (through {self.through})")
+            gap = (first_day - self.through).days - 1
+            if gap:
+                # Days without any rollup rows had no complaints
+                self.fold(self.through + timedelta(days=1), np.zeros((gap, len(self), 24)))
+        for offset, hourly in enumerate(counts):
+            self._fold_day((first_day + timedelta(days=offset)).weekday(), hourly)
+        if len(counts):
+            self.through = first_day + timedelta(days=len(counts) - 1)
+
+    def _fold_day(self, weekday, hourly):
+        totals = hourly.sum(axis=1)
+        started = self.days_seen > 0
+        # A series starts at its first complaint, at that day's count
+        active = started | (totals > 0)
+        season = self.weekday[:, weekday]
+        level = np.where(started, self.alpha * totals / season + (1 - self.alpha) * self.level, totals)
+        level = np.where(active, level, self.level)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(level > 0, totals / level, season)
+            share = hourly / totals[:, None]
+        self.weekday[:, weekday] = np.where(started, self.gamma * ratio + (1 - self.gamma) * season, season)
+        self.weekday /= self.weekday.mean(axis=1, keepdims=True)
+        self.hours = np.where((totals > 0)[:, None], self.beta * share + (1 - self.beta) * self.hours, self.hours)
+        self.level = level
+        self.days_seen += active
+
+    # Storage
+    def to_bytes(self):
+        """The smoothing parameters and state arrays as .npz bytes"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer, smoothing=np.array([self.alpha, self.gamma, self.beta]),
+            complaint_types=np.array([complaint_type for complaint_type, _ in self.keys], dtype=str),
+            stations=np.array([station or '' for _, station in self.keys], dtype=str),
+            has_station=np.array([station is not None for _, station in self.keys], dtype=bool),
+            level=self.level, weekday=self.weekday, hours=self.hours, days_seen=self.days_seen,
+            through=np.array(self.through.isoformat() if self.through else ''))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        with np.load(io.BytesIO(blob), allow_pickle=False) as state:
+            model = cls(*(float(value) for value in state['smoothing']))
+            model.series_ids([(str(complaint_type), str(station) if has_station else None)
+                              for complaint_type, station, has_station
+                              in zip(state['complaint_types'], state['stations'], state['has_station'])])
+            model.level, model.weekday, model.hours = state['level'], state['weekday'], state['hours']
+            model.days_seen = state['days_seen']
+            through = str(state['through'])
+            model.through = date.fromisoformat(through) if through else None
+        return model
+
+    def forecast(self, first_day, days):
+        """Expected complaints per [series, day] for `days` days from first_day"""
+        weekdays = [(first_day + timedelta(days=offset)).weekday() for offset in range(days)]
+        return self.level[:, None] * self.weekday[:, weekdays]
+
+    def forecast_hourly(self, first_day, days):
+        """Expected complaints per [series, day, hour]"""
+        return self.forecast(first_day, days)[:, :, None] * self.hours[:, None, :]
+
+
+def _blocks(model, since, until):
+    """(first day, counts[day, series, hour]) for the rollups from since to until, CHUNK_DAYS at a time"""
+    first = since
+    while first <= until:
+        last = min(first + timedelta(days=CHUNK_DAYS - 1), until)
+        counts = np.zeros(((last - first).days + 1, len(model), 24))
+        rows = rollups.station_hour_totals(first, last)
+        if rows:
+            frame = pd.DataFrame(rows, columns=['day', 'complaint_type', 'station', 'hour', 'cases'])
+            codes, keys = pd.factorize(pd.MultiIndex.from_arrays([frame['complaint_type'], frame['station']]))
+            series = model.series_ids(list(keys))[codes]
+            counts = np.pad(counts, ((0, 0), (0, len(model) - counts.shape[1]), (0, 0)))
+            offsets = (pd.to_datetime(frame['day']) - pd.Timestamp(first)).dt.days.to_numpy()
+            np.add.at(counts, (offsets, series, frame['hour'].to_numpy(dtype=np.int64)),
+                      frame['cases'].to_numpy(dtype=np.float64))
+        yield first, counts
+        first = last + timedelta(days=1)
+
+
+def fit(model=None, since=None, until=None):
+    """Fold the rollups from since (or the day after model.through) to until (default yesterday)"""
+    model = SeasonalForecaster() if model is None else model
+    until = until or date.today() - timedelta(days=1)
+    if model.through is not None:
+        since = max(since or model.through, model.through + timedelta(days=1))
+    since = since or rollups.first_day()
+    if since is None or since > until:
+        return model
+    for first_day, counts in _blocks(model, since, until):
+        model.fold(first_day, counts)
+    return model
+
+
+def load_model():
+    with transaction() as cursor:
+        cursor.execute("SELECT model FROM forecast_models WHERE name = %s", (MODEL_NAME,))
+        row = cursor.fetchone()
+    return SeasonalForecaster.from_bytes(row[0]) if row else None
+
+
+def current_model():
+    """The stored model brought up to yesterday (fitted from scratch if none is stored)
+
+    Days folded in here are saved, so later cache generations and other
+    processes load them instead of refitting. The dashboard cache is left
+    alone: it is being filled from this model.
+    """
+    return _update(invalidate=False)[0]
+
+
+def update(rebuild=False):
+    """Fold closed days into the stored model (or refit it); returns the days added"""
+    return _update(rebuild)[1]
+
+
+def _update(rebuild=False, invalidate=True):
+    model = None if rebuild else load_model()
+    started_from = model.through if model else None
+    first = started_from + timedelta(days=1) if started_from else rollups.first_day()
+    model = fit(model)
+    if model.through is None or model.through == started_from:
+        return model, 0
+    _save(model, started_from, rebuild, invalidate)
+    return model, (model.through - first).days + 1
+
+
+def _save(model, started_from, rebuild, invalidate=True):
+    with transaction() as cursor:
+        cursor.execute("SELECT through_day FROM forecast_models WHERE name = %s FOR UPDATE", (MODEL_NAME,))
+        row = cursor.fetchone()
+        if row and not rebuild and row[0] != started_from:
+            return  # a concurrent update saved first; its model already holds these days
+        blob = model.to_bytes()
+        cursor.execute(f"""
+            INSERT INTO forecast_models (name, model, through_day, series, updated_at)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            {on_duplicate_key(('name',), 'model = %s, through_day = %s, series = %s, '
+                                         'updated_at = CURRENT_TIMESTAMP')}
+        """, (MODEL_NAME, blob, model.through, len(model), blob, model.through, len(model)))
+    if invalidate:
+        invalidate_dashboard_cache()
+
+
+# Backtesting
+def backtest(blocks, horizon=7, warmup=28, model=None):
+    """Rolling-origin backtest over (first day, counts[day, series, hour]) blocks of consecutive days
+
+    After `warmup` days, every `horizon` days the model forecasts the next
+    `horizon` days of every series; each day is scored against its forecast
+    and then folded in. The naive baseline is each series' mean over the
+    last 7 days, repeated.
+    """
+    model = SeasonalForecaster() if model is None else model
+    recent = np.zeros((0, 7))  # daily totals of the last 7 days per series
+    pending = {}  # day -> (forecast, naive) per series at the time of the forecast
+    error = naive_error = actual_total = 0.0
+    scored = series_days = days = 0
+    fold_seconds = forecast_seconds = 0.0
+    forecasts = 0
+    for first_day, counts in blocks:
+        for offset, hourly in enumerate(counts):
+            day = first_day + timedelta(days=offset)
+            totals = hourly.sum(axis=1)
+            if len(totals) < len(model):
+                totals = np.pad(totals, (0, len(model) - len(totals)))
+            if days >= warmup and (days - warmup) % horizon == 0:
+                started = time.perf_counter()
+                predicted = model.forecast(day, horizon)
+                forecast_seconds += time.perf_counter() - started
+                forecasts += 1
+                naive = recent.mean(axis=1)
+                for ahead in range(horizon):
+                    pending[day + timedelta(days=ahead)] = (predicted[:, ahead], naive)
+            if day in pending:
+                predicted, naive = pending.pop(day)
+                # Series first seen after the forecast were predicted as zero
+                error += np.abs(totals[:len(predicted)] - predicted).sum() + totals[len(predicted):].sum()
+                naive_error += np.abs(totals[:len(naive)] - naive).sum() + totals[len(naive):].sum()
+                actual_total += totals.sum()
+                series_days += len(totals)
+                scored += 1
+            started = time.perf_counter()
+            model.fold(day, hourly[None])
+            fold_seconds += time.perf_counter() - started
+            recent = np.pad(recent, ((0, len(totals) - len(recent)), (0, 0)))
+            recent = np.column_stack([recent[:, 1:], totals])
+            days += 1
+    series_days = max(series_days, 1)
+    return BacktestResult(
+        len(model), scored, error / series_days, error / actual_total * 100 if actual_total else 0.0,
+        naive_error / series_days, naive_error / actual_total * 100 if actual_total else 0.0,
+        fold_seconds, forecast_seconds / forecasts if forecasts else 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the per-station complaint forecasts")
+    parser.add_argument('action', choices=['update', 'rebuild', 'backtest'])
+    parser.add_argument('--horizon', type=int, default=7, help="backtest: days forecast at a time")
+    parser.add_argument('--warmup', type=int, default=28, help="backtest: days folded before the first forecast")
+    args = parser.parse_args(argv)
+    if args.action == 'backtest':
+        first = rollups.first_day()
+        if first is None:
+            print("No rollups to backtest on")
+            return 1
+        model = SeasonalForecaster()
+        result = backtest(_blocks(model, first, date.today() - timedelta(days=1)),
+                          args.horizon, args.warmup, model)
+        print(f"{result.series} series, {result.days} days scored: MAE {result.mae:.3f} "
+              f"(flat 7-day mean {result.naive_mae:.3f}), WAPE {result.wape:.1f}% ({result.naive_wape:.1f}%)")
+        print(f"folding took {result.fold_seconds:.2f}s, a forecast of every series "
+              f"{result.forecast_seconds * 1e3:.2f} ms")
+        return 0
+    days = update(rebuild=args.action == 'rebuild')
+    print(f"{days} days {'fitted' if args.action == 'rebuild' else 'added'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
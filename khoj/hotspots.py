@@ -0,0 +1,309 @@
+"""Station and time-of-week hotspots for medical emergencies and safety requests
+
+Each incident becomes a feature vector: its station one-hot over the
+suburban stations (khoj.stations.LINES, matched by station id, so "Mumbai
+CST" counts as CSMT; anything else is 'Other'), then its
+hour of day and day of week as points on a circle, so 23:00 sits next to
+00:00. The time features go through a StandardScaler and the station columns
+carry STATION_WEIGHT, so clusters split by station first and by time within a
+station. A MiniBatchKMeans model clusters them.
+
+The model is updated, not refitted: an update reads only incidents with ids
+above the model's watermark (less CATCH_UP_OVERLAP, skipping ids already
+folded in) and feeds them to partial_fit in chunks of CHUNK_ROWS. Its arrays
+are stored in hotspot_models as .npz bytes, never pickled, so the table holds
+no code to run. Each cluster's station, typical hour and weekday, and
+incident count go to hotspot_clusters, which the dashboard reads. Counts are kept as incidents arrive (each incident
+counts for the cluster it joined); a rebuild refits on the full history.
+
+    python -m khoj.hotspots update      # incidents since the last update (run from cron)
+    python -m khoj.hotspots rebuild     # refit from scratch
+"""
+import argparse
+import io
+import math
+import os
+import sys
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+from sklearn.utils._openmp_helpers import _openmp_effective_n_threads
+
+from khoj import archive
+from khoj.cache import invalidate as invalidate_dashboard_cache
+from khoj.stations import LINES, registry
+from khoj.db import on_duplicate_key, transaction
+
+HOTSPOT_CLUSTERS = int(os.environ.get('KHOJ_HOTSPOT_CLUSTERS', '12'))
+CHUNK_ROWS = 100000  # incidents per partial_fit
+# Incidents are read back this many ids below the watermark, because ids
+# from concurrent transactions can commit out of order
+CATCH_UP_OVERLAP = 1000
+STATION_WEIGHT = 3.0
+
+MODELS_TABLE = '''CREATE TABLE IF NOT EXISTS hotspot_models (
+    complaint_type VARCHAR(50) PRIMARY KEY,
+    model LONGBLOB NOT NULL,
+    watermark INT NOT NULL,
+    incidents BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+CLUSTERS_TABLE = '''CREATE TABLE IF NOT EXISTS hotspot_clusters (
+    complaint_type VARCHAR(50) NOT NULL,
+    cluster SMALLINT NOT NULL,
+    station VARCHAR(100) NOT NULL,
+    hour TINYINT NOT NULL,
+    weekday TINYINT NOT NULL,
+    station_share FLOAT NOT NULL,
+    incidents INT NOT NULL,
+    PRIMARY KEY (complaint_type, cluster)
+)'''
+
+# Incidents per complaint table: (id, station id, hour 0-23, weekday 1 = Sunday as DAYOFWEEK),
+# read from live and archived complaints ({source}, see khoj.archive.history)
+SOURCES = {
+    'medical_assistance': """
+        SELECT id, station_left_id, HOUR(created_at), DAYOFWEEK(created_at)
+        FROM {source} ORDER BY id LIMIT {limit}
+    """,
+    # Safety requests count when and where the journey starts; the submission
+    # time stands in for an unreadable boarding time
+    'womens_safety': """
+        SELECT id, boarding_station_id, time_of_boarding, HOUR(created_at),
+               DAYOFWEEK(COALESCE(travel_date, created_at))
+        FROM {source} ORDER BY id LIMIT {limit}
+    """,
+}
+
+STATIONS = sorted({station for stations in LINES.values() for station in stations})
+OTHER = len(STATIONS)  # code for stations off the suburban lines
+
+
+class HotspotCluster(NamedTuple):
+    cluster: int
+    station: str
+    hour: int
+    weekday: int  # 1 = Sunday ... 7 = Saturday
+    station_share: float  # share of the cluster at that station
+    incidents: int
+
+
+def encode_stations(station_ids):
+    """Station codes (index into STATIONS, OTHER for the rest) for an array of station ids"""
+    station_codes = {registry.lookup(station): code for code, station in enumerate(STATIONS)}
+    codes, uniques = pd.factorize(pd.Series(station_ids, dtype=object), use_na_sentinel=False)
+    lookup = np.array([station_codes.get(station_id, OTHER) if pd.notna(station_id) else OTHER
+                       for station_id in uniques], dtype=np.int16)
+    return lookup[codes]
+
+
+def time_features(hours, weekdays):
+    """(n, 4) sin/cos of hour of day and day of week"""
+    hour_angle = np.asarray(hours, dtype=np.float32) * np.float32(2 * math.pi / 24)
+    day_angle = (np.asarray(weekdays, dtype=np.float32) - 1) * np.float32(2 * math.pi / 7)
+    return np.column_stack([np.sin(hour_angle), np.cos(hour_angle), np.sin(day_angle), np.cos(day_angle)])
+
+
+class HotspotModel:
+    """Incrementally fitted clusters of (station, hour, weekday)"""
+
+    def __init__(self, clusters=HOTSPOT_CLUSTERS):
+        self.kmeans = MiniBatchKMeans(n_clusters=clusters, random_state=0, n_init=3, batch_size=4096)
+        self.scaler = StandardScaler()
+        self.counts = np.zeros(clusters, dtype=np.int64)
+        self.watermark = 0  # highest incident id seen
+        self.recent_ids = np.zeros(0, dtype=np.int64)  # ids seen within CATCH_UP_OVERLAP of the watermark
+        self.incidents = 0
+
+    @property
+    def fitted(self):
+        return hasattr(self.kmeans, 'cluster_centers_')
+
+    # Storage
+    def state(self):
+        """Arrays of a fitted model: its clusters, the scaler and the mini-batch state partial_fit continues"""
+        kmeans, scaler = self.kmeans, self.scaler
+        rng_name, rng_key, rng_pos, rng_has_gauss, rng_gauss = kmeans._random_state.get_state()
+        return {
+            'centers': kmeans.cluster_centers_, 'weight_sums': kmeans._counts,
+            'steps': kmeans.n_steps_, 'batch_size': kmeans._batch_size,
+            'since_reassign': kmeans._n_since_last_reassign,
+            'rng_key': rng_key, 'rng_state': np.array([rng_pos, rng_has_gauss]), 'rng_gauss': rng_gauss,
+            'scaler_mean': scaler.mean_, 'scaler_var': scaler.var_, 'scaler_scale': scaler.scale_,
+            'scaler_samples': scaler.n_samples_seen_,
+            'counts': self.counts, 'watermark': self.watermark, 'recent_ids': self.recent_ids,
+            'incidents': self.incidents,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """The model state() was taken from, ready for further partial_fit calls"""
+        model = cls(len(state['counts']))
+        kmeans, scaler = model.kmeans, model.scaler
+        # What MiniBatchKMeans.partial_fit sets up on its first call and reads on later ones
+        kmeans.cluster_centers_ = state['centers']
+        kmeans._counts = state['weight_sums']
+        kmeans.n_features_in_ = kmeans._n_features_out = state['centers'].shape[1]
+        kmeans.n_steps_ = int(state['steps'])
+        kmeans._batch_size = int(state['batch_size'])
+        kmeans._n_since_last_reassign = int(state['since_reassign'])
+        kmeans._n_threads = _openmp_effective_n_threads()
+        kmeans._random_state = np.random.RandomState()
+        kmeans._random_state.set_state(('MT19937', state['rng_key'], int(state['rng_state'][0]),
+                                        int(state['rng_state'][1]), float(state['rng_gauss'])))
+        scaler.mean_, scaler.var_, scaler.scale_ = state['scaler_mean'], state['scaler_var'], state['scaler_scale']
+        scaler.n_samples_seen_ = np.int64(state['scaler_samples'])
+        scaler.n_features_in_ = len(scaler.mean_)
+        model.counts = state['counts']
+        model.watermark = int(state['watermark'])
+        model.recent_ids = state['recent_ids']
+        model.incidents = int(state['incidents'])
+        return model
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, **self.state())
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        with np.load(io.BytesIO(blob), allow_pickle=False) as state:
+            return cls.from_state(dict(state))
+
+    def _design(self, station_codes, times):
+        matrix = np.zeros((len(station_codes), OTHER + 1 + times.shape[1]), dtype=np.float32)
+        matrix[np.arange(len(station_codes)), station_codes] = STATION_WEIGHT
+        matrix[:, OTHER + 1:] = self.scaler.transform(times)
+        return matrix
+
+    def partial_fit(self, station_codes, hours, weekdays):
+        """Fold a chunk of incidents into the model; the first chunk needs at least `clusters` rows"""
+        times = time_features(hours, weekdays)
+        self.scaler.partial_fit(times)
+        matrix = self._design(np.asarray(station_codes), times)
+        self.kmeans.partial_fit(matrix)
+        self.counts += np.bincount(self.kmeans.predict(matrix), minlength=len(self.counts))
+        self.incidents += len(matrix)
+
+    def clusters(self):
+        """HotspotCluster per centroid, read back into station, hour and weekday"""
+        centres = self.kmeans.cluster_centers_
+        stations = centres[:, :OTHER + 1]
+        times = self.scaler.inverse_transform(centres[:, OTHER + 1:])
+        hours = np.round(np.arctan2(times[:, 0], times[:, 1]) * 24 / (2 * math.pi)).astype(int) % 24
+        weekdays = np.round(np.arctan2(times[:, 2], times[:, 3]) * 7 / (2 * math.pi)).astype(int) % 7 + 1
+        result = []
+        for cluster in range(len(centres)):
+            code = int(stations[cluster].argmax())
+            result.append(HotspotCluster(
+                cluster, STATIONS[code] if code < OTHER else 'Other', int(hours[cluster]),
+                int(weekdays[cluster]), float(stations[cluster, code] / STATION_WEIGHT),
+                int(self.counts[cluster])))
+        return result
+
+
+def _incidents(complaint_type, after_id, limit):
+    """(ids, station codes, hours, weekdays) for the next chunk of incidents"""
+    with transaction() as cursor:
+        source = archive.history(complaint_type, 'id > %s', limit)
+        cursor.execute(SOURCES[complaint_type].format(source=source, limit=int(limit)), (after_id, after_id))
+        rows = cursor.fetchall()
+    if complaint_type == 'womens_safety':
+        frame = pd.DataFrame(rows, columns=['id', 'station', 'time_of_boarding', 'created_hour', 'weekday'])
+        boarding = frame['time_of_boarding'].astype(str).str.extract(r'^\s*(\d{1,2}):')[0]
+        hours = pd.to_numeric(boarding, errors='coerce')
+        frame['hour'] = hours.where(hours.between(0, 23), frame['created_hour'])
+    else:
+        frame = pd.DataFrame(rows, columns=['id', 'station', 'hour', 'weekday'])
+    return (frame['id'].to_numpy(), encode_stations(frame['station'].to_numpy()),
+            frame['hour'].to_numpy(dtype=np.float32), frame['weekday'].to_numpy(dtype=np.float32))
+
+
+def load_model(complaint_type):
+    with transaction() as cursor:
+        cursor.execute("SELECT model FROM hotspot_models WHERE complaint_type = %s", (complaint_type,))
+        row = cursor.fetchone()
+    return HotspotModel.from_bytes(row[0]) if row else None
+
+
+def update(complaint_type, rebuild=False, clusters=HOTSPOT_CLUSTERS):
+    """Fold new incidents into the stored model (or refit it); returns the incidents added"""
+    if complaint_type not in SOURCES:
+        raise ValueError(f"No hotspots for {complaint_type}")
+    model = None if rebuild else load_model(complaint_type)
+    model = model or HotspotModel(clusters)
+    started_from = model.watermark
+    after = max(model.watermark - CATCH_UP_OVERLAP, 0)
+    added = 0
+    while True:
+        ids, stations, hours, weekdays = _incidents(complaint_type, after, CHUNK_ROWS)
+        new = ~np.isin(ids, model.recent_ids)  # late commits in the overlap, and everything above it
+        if not model.fitted and new.sum() < len(model.counts):
+            break  # too few incidents for a first fit
+        if new.any():
+            model.partial_fit(stations[new], hours[new], weekdays[new])
+            model.watermark = max(model.watermark, int(ids[-1]))
+            recent = np.union1d(model.recent_ids, ids[new])
+            model.recent_ids = recent[recent > model.watermark - CATCH_UP_OVERLAP]
+            added += int(new.sum())
+        if len(ids) < CHUNK_ROWS:
+            break
+        after = int(ids[-1])
+    if added:
+        _save(complaint_type, model, started_from, rebuild)
+    return added
+
+
+def _save(complaint_type, model, started_from, rebuild):
+    with transaction() as cursor:
+        cursor.execute("SELECT watermark FROM hotspot_models WHERE complaint_type = %s FOR UPDATE",
+                       (complaint_type,))
+        row = cursor.fetchone()
+        if row and not rebuild and row[0] != started_from:
+            return  # a concurrent update saved first; its model already holds these incidents
+        blob = model.to_bytes()
+        cursor.execute(f"""
+            INSERT INTO hotspot_models (complaint_type, model, watermark, incidents, updated_at)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            {on_duplicate_key(('complaint_type',), 'model = %s, watermark = %s, incidents = %s, '
+                                                   'updated_at = CURRENT_TIMESTAMP')}
+        """, (complaint_type, blob, model.watermark, model.incidents, blob, model.watermark, model.incidents))
+        cursor.execute("DELETE FROM hotspot_clusters WHERE complaint_type = %s", (complaint_type,))
+        cursor.executemany("""
+            INSERT INTO hotspot_clusters
+            (complaint_type, cluster, station, hour, weekday, station_share, incidents)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [(complaint_type, *cluster) for cluster in model.clusters()])
+    invalidate_dashboard_cache()
+
+
+def stored_clusters(complaint_type):
+    """HotspotClusters last saved for complaint_type, busiest first"""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT cluster, station, hour, weekday, station_share, incidents
+            FROM hotspot_clusters WHERE complaint_type = %s
+            ORDER BY incidents DESC, cluster
+        """, (complaint_type,))
+        return [HotspotCluster(*row) for row in cursor.fetchall()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the station/time hotspot clusters")
+    parser.add_argument('action', choices=['update', 'rebuild'])
+    parser.add_argument('--type', choices=sorted(SOURCES), action='append',
+                        help="complaint table (default: all)")
+    parser.add_argument('--clusters', type=int, default=HOTSPOT_CLUSTERS, help="clusters for a rebuild")
+    args = parser.parse_args(argv)
+    for complaint_type in args.type or sorted(SOURCES):
+        added = update(complaint_type, rebuild=args.action == 'rebuild', clusters=args.clusters)
+        print(f"{complaint_type}: {added} incidents {'fitted' if args.action == 'rebuild' else 'added'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""Bulk loading of complaints from CSV and JSONL feeds
+
+Rows are streamed from the input, validated against the target table's
+column lengths and enums, and written with multi-row INSERTs, one
+transaction per batch. The number of input rows consumed is checkpointed in
+the same transaction, so a load that fails part-way resumes after the last
+committed batch when it is run again. Rejected rows are written, with their
+errors, to a JSONL report next to the input.
+
+    python -m khoj.ingest lost_found helpline.csv [--batch-size 1000] [--rejects rejects.jsonl]
+    python -m khoj.ingest womens_safety kiosk.jsonl --restart
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+from typing import NamedTuple
+
+from khoj import events, rollups, stations
+from khoj.cache import invalidate as invalidate_dashboard_cache
+from khoj.companions import parse_minutes
+from khoj.complaints import STATUSES, companion_index
+from khoj.matching import blocking_keys, key_columns
+from khoj.db import inserted_ids, on_duplicate_key, transaction
+
+BATCH_SIZE = int(os.environ.get('KHOJ_INGEST_BATCH_SIZE', '1000'))  # input rows per transaction
+INSERT_ROWS = 500  # rows per INSERT statement
+
+CHECKPOINT_TABLE = '''CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source VARCHAR(255) NOT NULL,
+    table_name VARCHAR(50) NOT NULL,
+    rows_done INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, table_name)
+)'''
+
+# Column -> (type, limit, required). limit is the VARCHAR length, the TEXT
+# byte limit, or the allowed values; see khoj.schema.
+COLUMNS = {
+    'lost_found': {
+        'user_name': ('str', 100, True),
+        'train_number': ('str', 50, True),
+        'compartment_number': ('str', 50, True),
+        'seat_number': ('str', 50, True),
+        'item_description': ('text', 65535, True),
+        'phone_number': ('str', 15, True),
+        'status': ('enum', STATUSES['lost_found'], False),
+        'created_at': ('datetime', None, False),
+    },
+    'medical_assistance': {
+        'user_name': ('str', 100, True),
+        'symptoms': ('text', 65535, True),
+        'station_left': ('str', 100, True),
+        'arriving_station': ('str', 100, True),
+        'assistance_type': ('str', 50, True),
+        'status': ('enum', STATUSES['medical_assistance'], False),
+        'created_at': ('datetime', None, False),
+    },
+    'womens_safety': {
+        'user_name': ('str', 100, True),
+        'boarding_station': ('str', 100, True),
+        'destination_station': ('str', 100, True),
+        'time_of_boarding': ('time', 50, True),
+        'phone_number': ('str', 15, True),
+        'travel_date': ('date', None, True),
+        'looking_for_companion': ('bool', None, False),
+        'status': ('enum', STATUSES['womens_safety'], False),
+        'created_at': ('datetime', None, False),
+    },
+}
+
+_TRUE = {'1', 'true', 't', 'yes', 'y'}
+_FALSE = {'0', 'false', 'f', 'no', 'n'}
+
+
+class IngestReport(NamedTuple):
+    table: str
+    source: str
+    read: int  # input rows consumed by this run (after any resumed prefix)
+    inserted: int
+    rejected: int
+    skipped: int  # rows already loaded by an earlier run
+    seconds: float
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+
+# Validation
+def _convert(kind, limit, value):
+    if kind in ('str', 'text', 'time', 'enum'):
+        value = str(value).strip()
+        if kind == 'str' and len(value) > limit:
+            raise ValueError(f"longer than {limit} characters")
+        if kind == 'text' and len(value.encode('utf-8')) > limit:
+            raise ValueError(f"longer than {limit} bytes")
+        if kind == 'time':
+            if parse_minutes(value) is None:
+                raise ValueError("not a HH:MM time")
+            hours, minutes = value.split(':')[:2]
+            value = f"{int(hours):02d}:{int(minutes):02d}"
+        if kind == 'enum' and value not in limit:
+            raise ValueError(f"not one of {', '.join(limit)}")
+        return value
+    if kind == 'bool':
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE or text in _FALSE:
+            return text in _TRUE
+        raise ValueError("not a boolean")
+    if kind == 'date':
+        return value if isinstance(value, date) else date.fromisoformat(str(value).strip())
+    if kind == 'datetime':
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip())
+    raise AssertionError(kind)
+
+
+def validate(table, raw):
+    """(row dict, []) for a valid input row, or (None, [errors])"""
+    if not isinstance(raw, dict):
+        return None, ["row is not an object"]
+    row, errors = {}, []
+    for column, (kind, limit, required) in COLUMNS[table].items():
+        value = raw.get(column)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            if required:
+                errors.append(f"{column}: required")
+            continue
+        try:
+            row[column] = _convert(kind, limit, value)
+        except ValueError as error:
+            errors.append(f"{column}: {error}")
+    if errors:
+        return None, errors
+    row.setdefault('status', 'Pending')
+    row.setdefault('created_at', datetime.now().replace(microsecond=0))
+    if table == 'womens_safety':
+        row.setdefault('looking_for_companion', False)
+    return row, []
+
+
+# Input
+def read_rows(stream, fmt):
+    """Yield raw input rows (dicts; a string for an unreadable JSONL line)"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line.rstrip('\n')
+
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+# Checkpoints
+def _rows_done(cursor, source, table):
+    cursor.execute("SELECT rows_done FROM ingest_checkpoints WHERE source = %s AND table_name = %s",
+                   (source, table))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _save_checkpoint(cursor, source, table, rows_done):
+    cursor.execute(f"""
+        INSERT INTO ingest_checkpoints (source, table_name, rows_done, updated_at)
+        VALUES (%s, %s, %s, %s)
+        {on_duplicate_key(('source', 'table_name'), 'rows_done = %s, updated_at = %s')}
+    """, (source, table, rows_done, datetime.now(), rows_done, datetime.now()))
+
+
+# Writes
+def _insert_batch(cursor, table, rows):
+    columns = list(COLUMNS[table]) + stations.id_columns(table) + key_columns(table)
+    for row in rows:
+        row.update(stations.station_ids(cursor, table, row), **blocking_keys(table, row))
+    placeholders = f"({', '.join(['%s'] * len(columns))}, CURRENT_TIMESTAMP)"
+    for start in range(0, len(rows), INSERT_ROWS):
+        chunk = rows[start:start + INSERT_ROWS]
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}, updated_at) "
+            f"VALUES {', '.join([placeholders] * len(chunk))}",
+            [row.get(column) for row in chunk for column in columns]
+        )
+        # Imported complaints start their history at their own status and created_at
+        events.record_created(cursor, table, *inserted_ids(cursor, len(chunk)))
+    rollups.record_rows(cursor, table, rows)
+
+
+def ingest(table, path=None, stream=None, fmt=None, batch_size=None, rejects=None, source=None,
+           resume=True):
+    """Load complaints into table from a CSV/JSONL file (path) or an open text stream
+
+    source names the checkpoint (default: the absolute path); resume=False
+    starts again from the first row. Rejects go to `rejects` (a path),
+    by default <path>.rejects.jsonl; pass rejects=False to skip the report.
+    """
+    if table not in COLUMNS:
+        raise ValueError(f"Unknown complaint table: {table}")
+    if path is None and stream is None:
+        raise ValueError("Pass a path or a stream")
+    batch_size = batch_size or BATCH_SIZE
+    source = source or (os.path.abspath(path) if path else '<stream>')
+    if rejects is None and path:
+        rejects = f"{path}.rejects.jsonl"
+    fmt = _format(path, fmt)
+
+    with transaction() as cursor:
+        skip = _rows_done(cursor, source, table) if resume else 0
+
+    started = time.perf_counter()
+    read = inserted = rejected = 0
+    companions = False
+    opened = open(path, newline='', encoding='utf-8-sig') if stream is None else None
+    # A restarted load starts a fresh report; a resumed one appends to it
+    report = open(rejects, 'a' if skip else 'w', encoding='utf-8') if rejects else None
+    try:
+        rows, errors = [], []
+        for number, raw in enumerate(read_rows(opened or stream, fmt), start=1):
+            if number <= skip:
+                continue
+            row, problems = validate(table, raw)
+            if row is None:
+                errors.append({'row': number, 'errors': problems, 'data': raw})
+            else:
+                rows.append(row)
+            if len(rows) + len(errors) >= batch_size:
+                companions |= _flush(table, source, rows, errors, number, report)
+                read, inserted, rejected = read + batch_size, inserted + len(rows), rejected + len(errors)
+                rows, errors = [], []
+        if rows or errors:
+            pending = len(rows) + len(errors)
+            companions |= _flush(table, source, rows, errors, skip + read + pending, report)
+            read, inserted, rejected = read + pending, inserted + len(rows), rejected + len(errors)
+    finally:
+        if opened:
+            opened.close()
+        if report:
+            report.close()
+        if read:
+            invalidate_dashboard_cache()
+        if companions:
+            companion_index.refresh(force=True)
+    return IngestReport(table, source, read, inserted, rejected, skip, time.perf_counter() - started)
+
+
+def _flush(table, source, rows, errors, rows_done, report):
+    """Commit one batch and its checkpoint; True if it added companion requests"""
+    with transaction() as cursor:
+        if rows:
+            _insert_batch(cursor, table, rows)
+        _save_checkpoint(cursor, source, table, rows_done)
+    # Written after the commit so a retried batch is not reported twice
+    if report:
+        for error in errors:
+            report.write(json.dumps(error, default=str) + '\n')
+        report.flush()
+    return any(row.get('looking_for_companion') for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load complaints from a CSV or JSONL file")
+    parser.add_argument('table', choices=sorted(COLUMNS))
+    parser.add_argument('path', help="input file, or - for stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'])
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="input rows per transaction")
+    parser.add_argument('--rejects', help="rejected rows report (default: <path>.rejects.jsonl)")
+    parser.add_argument('--source', help="checkpoint name (default: the input's absolute path)")
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and load from the first row")
+    args = parser.parse_args(argv)
+
+    if args.path == '-':
+        if not args.source:
+            parser.error("--source is required when reading stdin")
+        result = ingest(args.table, stream=sys.stdin, fmt=args.format or 'csv', batch_size=args.batch_size,
+                        rejects=args.rejects, source=args.source, resume=not args.restart)
+    else:
+        result = ingest(args.table, args.path, fmt=args.format, batch_size=args.batch_size,
+                        rejects=args.rejects, source=args.source, resume=not args.restart)
+    if result.skipped:
+        print(f"Resumed after {result.skipped} rows already loaded")
+    print(f"{result.read} rows read, {result.inserted} inserted, {result.rejected} rejected "
+          f"in {result.seconds:.1f}s ({result.rows_per_second:.0f} rows/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""Matching found items to open lost & found reports
+
+Staff record what they find in the found_items register. A found item is
+only compared with reports that share its blocking keys: the train (its
+number when one is given, otherwise the name) and a report date within
+KHOJ_MATCH_WINDOW_DAYS days of the find. Reports store their train key
+(lost_found.train_key, written with the report) so a block is read with an
+index lookup. Matching therefore costs items x block size rather than
+items x reports. Candidates are scored on their
+descriptions: normalized item words count double, colours and materials
+count once, and clashing colours halve the score. Reports from the same
+compartment get a bonus on top.
+
+Each found item is paired with at most one report, and each report with at
+most one item, best scores first. A paired report above KHOJ_MATCH_THRESHOLD
+moves to Found. New found items and new reports are matched as they are
+written; found items already in the register are matched in batch with
+
+    python -m khoj.matching [--window 3] [--threshold 0.6]
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+from khoj import events, rollups
+from khoj.cache import invalidate as invalidate_dashboard_cache
+from khoj.db import transaction
+from khoj.text import ATTRIBUTES, COLOURS, tokenize
+
+MATCH_WINDOW_DAYS = int(os.environ.get('KHOJ_MATCH_WINDOW_DAYS', '3'))  # days either side of the find
+MATCH_THRESHOLD = float(os.environ.get('KHOJ_MATCH_THRESHOLD', '0.6'))
+ATTRIBUTE_WEIGHT = 0.5  # a colour or material counts half as much as an item word
+COMPARTMENT_WEIGHT = 0.15
+CHUNK_DAYS = 30  # days of found items matched per batch pass
+APPLY_BATCH = 500  # matches per transaction
+BACKFILL_ROWS = 5000  # reports per train_key backfill query
+
+# lost_found statuses a match may move on to Found (earlier in ENUM order; see khoj.schema)
+MATCHABLE_STATUSES = ('Pending', 'Received', 'Assigned to Volunteer', 'Searching')
+
+FOUND_ITEMS_TABLE = '''CREATE TABLE IF NOT EXISTS found_items (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    train_number VARCHAR(50),
+    train_key VARCHAR(50),
+    compartment_number VARCHAR(50),
+    item_description TEXT,
+    found_by VARCHAR(100),
+    found_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status ENUM('Unclaimed', 'Matched', 'Returned') DEFAULT 'Unclaimed',
+    complaint_id INT,
+    match_score FLOAT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+
+class ItemRecord(NamedTuple):
+    """A found item or a lost report, as the matcher sees it"""
+    id: int
+    train_number: str
+    compartment_number: str
+    item_description: str
+    seen_at: datetime  # found_at for a found item, created_at for a report
+
+
+class MatchPair(NamedTuple):
+    found_item_id: int
+    complaint_id: int
+    score: float
+
+
+# Blocking keys
+_TRAIN_NUMBER = re.compile(r'(?<!\d)\d{4,5}(?!\d)')
+
+
+@lru_cache(maxsize=4096)
+def train_key(train_number):
+    """'12951', '12951 Rajdhani' and 'rajdhani exp 12951' all block as 12951"""
+    text = ' '.join(str(train_number or '').split()).lower()
+    number = _TRAIN_NUMBER.search(text)
+    return number.group() if number else text[:50]
+
+
+def compartment_key(compartment_number):
+    return re.sub(r'[^a-z0-9]', '', str(compartment_number or '').lower())
+
+
+def key_columns(table):
+    """The blocking key columns a complaint table stores"""
+    return ['train_key'] if table == 'lost_found' else []
+
+
+def blocking_keys(table, values):
+    """Blocking key column -> value for a complaint's values"""
+    return {'train_key': train_key(values.get('train_number'))} if table == 'lost_found' else {}
+
+
+# Scoring
+class _Features(NamedTuple):
+    items: frozenset
+    attributes: frozenset
+    colours: frozenset
+    weight: float
+
+
+@lru_cache(maxsize=65536)
+def _features(description):
+    tokens = set(tokenize(description))
+    attributes = frozenset(tokens & ATTRIBUTES)
+    items = frozenset(tokens - ATTRIBUTES)
+    return _Features(items, attributes, attributes & COLOURS, len(items) + ATTRIBUTE_WEIGHT * len(attributes))
+
+
+def description_similarity(a, b):
+    """0..1 overlap of two item descriptions; 0 unless they share an item word"""
+    a, b = _features(a or ''), _features(b or '')
+    shared = len(a.items & b.items)
+    if not shared:
+        return 0.0
+    score = 2 * (shared + ATTRIBUTE_WEIGHT * len(a.attributes & b.attributes)) / (a.weight + b.weight)
+    if a.colours and b.colours and not a.colours & b.colours:
+        score *= 0.5  # a black bag is not the blue bag
+    return score
+
+
+def match_score(a, b):
+    score = (1 - COMPARTMENT_WEIGHT) * description_similarity(a.item_description, b.item_description)
+    compartment = compartment_key(a.compartment_number)
+    if score and compartment and compartment == compartment_key(b.compartment_number):
+        score += COMPARTMENT_WEIGHT
+    return score
+
+
+def _gap(a, b):
+    return abs((a.seen_at - b.seen_at).total_seconds())
+
+
+def rank(record, candidates, threshold=None):
+    """[(score, candidate)] at or above threshold, best first, then nearest in time"""
+    threshold = MATCH_THRESHOLD if threshold is None else threshold
+    scored = []
+    for candidate in candidates:
+        score = match_score(record, candidate)
+        if score >= threshold:
+            scored.append((score, candidate))
+    scored.sort(key=lambda pair: (-pair[0], _gap(record, pair[1]), pair[1].id))
+    return scored
+
+
+class ReportBlocks:
+    """Reports by blocking key (train, day reported)"""
+
+    def __init__(self, reports=()):
+        self._blocks = {}
+        for report in reports:
+            self.add(report)
+
+    def add(self, report):
+        key = (train_key(report.train_number), report.seen_at.toordinal())
+        self._blocks.setdefault(key, []).append(report)
+
+    def candidates(self, found, window):
+        train, day = train_key(found.train_number), found.seen_at.toordinal()
+        for other_day in range(day - window, day + window + 1):
+            yield from self._blocks.get((train, other_day), ())
+
+
+def pair(found_items, reports, window=None, threshold=None):
+    """One-to-one MatchPairs between found items and reports (a list or ReportBlocks), best first"""
+    window = MATCH_WINDOW_DAYS if window is None else window
+    blocks = reports if isinstance(reports, ReportBlocks) else ReportBlocks(reports)
+    scored = []
+    for found in found_items:
+        for score, report in rank(found, blocks.candidates(found, window), threshold):
+            scored.append((-score, _gap(found, report), report.id, found.id))
+    scored.sort()
+    matched_items, matched_reports, pairs = set(), set(), []
+    for negative_score, _, report_id, found_id in scored:
+        if found_id in matched_items or report_id in matched_reports:
+            continue
+        matched_items.add(found_id)
+        matched_reports.add(report_id)
+        pairs.append(MatchPair(found_id, report_id, -negative_score))
+    return pairs
+
+
+# Database
+def _window(day, window):
+    """[since, until) dates covering `window` days either side of a day number"""
+    window = MATCH_WINDOW_DAYS if window is None else window
+    return date.fromordinal(day - window), date.fromordinal(day + window + 1)
+
+
+def _open_reports(cursor, since, until, key=None):
+    """Open reports from [since, until), only those with train key `key` if one is given"""
+    key_clause, params = ("train_key = %s AND ", (key,)) if key is not None else ("", ())
+    cursor.execute(f"""
+        SELECT id, train_number, compartment_number, item_description, created_at
+        FROM lost_found
+        WHERE {key_clause}status IN ({', '.join(['%s'] * len(MATCHABLE_STATUSES))})
+        AND created_at >= %s AND created_at < %s
+    """, (*params, *MATCHABLE_STATUSES, since, until))
+    return [ItemRecord(*row) for row in cursor.fetchall()]
+
+
+def _unclaimed_items(cursor, key, since, until):
+    cursor.execute("""
+        SELECT id, train_number, compartment_number, item_description, found_at
+        FROM found_items
+        WHERE status = 'Unclaimed' AND train_key = %s AND found_at >= %s AND found_at < %s
+    """, (key, since, until))
+    return [ItemRecord(*row) for row in cursor.fetchall()]
+
+
+def _apply(cursor, match):
+    """Record a match and move the report to Found; False if either side was taken meanwhile"""
+    # Always lock the found item first, then the report
+    cursor.execute("SELECT status FROM found_items WHERE id=%s FOR UPDATE", (match.found_item_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] != 'Unclaimed':
+        return False
+    cursor.execute("SELECT status, assigned_volunteer_email FROM lost_found WHERE id=%s FOR UPDATE",
+                   (match.complaint_id,))
+    row = cursor.fetchone()
+    if row is None or row[0] not in MATCHABLE_STATUSES:
+        return False
+    rollups.retract_status(cursor, 'lost_found', match.complaint_id)
+    # Found is closed: like update_complaint_status, drop the claim but keep the assignee
+    cursor.execute("""
+        UPDATE lost_found
+        SET status='Found', claimed_by=NULL, claim_expires_at=NULL, updated_at=CURRENT_TIMESTAMP
+        WHERE id=%s
+    """, (match.complaint_id,))
+    rollups.record_status(cursor, 'lost_found', match.complaint_id)
+    events.record(cursor, 'lost_found', match.complaint_id, row[0], 'Found', row[1])
+    cursor.execute("""
+        UPDATE found_items SET status='Matched', complaint_id=%s, match_score=%s WHERE id=%s
+    """, (match.complaint_id, match.score, match.found_item_id))
+    return True
+
+
+def _apply_best(ranked, make_pair):
+    """Apply the best ranked candidate that is still free; returns its MatchPair or None"""
+    for score, candidate in ranked:
+        match = make_pair(candidate, score)
+        with transaction() as cursor:
+            applied = _apply(cursor, match)
+        if applied:
+            invalidate_dashboard_cache()
+            return match
+    return None
+
+
+def match_found_item(found, window=None, threshold=None):
+    """Pair a registered found item (ItemRecord) with the best open report; MatchPair or None"""
+    since, until = _window(found.seen_at.toordinal(), window)
+    with transaction() as cursor:
+        candidates = _open_reports(cursor, since, until, train_key(found.train_number))
+    return _apply_best(rank(found, candidates, threshold),
+                       lambda report, score: MatchPair(found.id, report.id, score))
+
+
+def match_reports(reports, window=None, threshold=None):
+    """Pair newly written reports (ItemRecords) with unclaimed found items; returns the MatchPairs made"""
+    matches = []
+    for report in reports:
+        since, until = _window(report.seen_at.toordinal(), window)
+        with transaction() as cursor:
+            candidates = _unclaimed_items(cursor, train_key(report.train_number), since, until)
+        if not candidates:
+            continue
+        match = _apply_best(rank(report, candidates, threshold),
+                            lambda found, score: MatchPair(found.id, report.id, score))
+        if match:
+            matches.append(match)
+    return matches
+
+
+def register_found_item(train_number, compartment_number, item_description, found_by, found_at=None):
+    """Add a found item to the register and match it; returns (found item id, MatchPair or None)"""
+    found_at = (found_at or datetime.now()).replace(microsecond=0)
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO found_items
+            (train_number, train_key, compartment_number, item_description, found_by, found_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (train_number, train_key(train_number), compartment_number, item_description, found_by, found_at))
+        found_item_id = cursor.lastrowid
+    found = ItemRecord(found_item_id, train_number, compartment_number, item_description, found_at)
+    return found_item_id, match_found_item(found)
+
+
+def match_backlog(window=None, threshold=None, chunk_days=CHUNK_DAYS):
+    """Match every unclaimed found item, oldest first; returns the MatchPairs made
+
+    Items are taken CHUNK_DAYS at a time, with the open reports around them
+    loaded once per chunk. A chunk's matches are committed before the next
+    chunk loads, so a report claimed earlier is no longer open.
+    """
+    window = MATCH_WINDOW_DAYS if window is None else window
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT id, train_number, compartment_number, item_description, found_at
+            FROM found_items WHERE status = 'Unclaimed'
+            ORDER BY found_at, id
+        """)
+        items = [ItemRecord(*row) for row in cursor.fetchall()]
+    matches = []
+    start = 0
+    while start < len(items):
+        first_day = items[start].seen_at.toordinal()
+        end = start
+        while end < len(items) and items[end].seen_at.toordinal() < first_day + chunk_days:
+            end += 1
+        since, until = _window(first_day, window)[0], _window(items[end - 1].seen_at.toordinal(), window)[1]
+        with transaction() as cursor:
+            reports = _open_reports(cursor, since, until)
+        pairs = pair(items[start:end], reports, window, threshold)
+        for offset in range(0, len(pairs), APPLY_BATCH):
+            with transaction() as cursor:
+                matches += [match for match in pairs[offset:offset + APPLY_BATCH] if _apply(cursor, match)]
+        start = end
+    if matches:
+        invalidate_dashboard_cache()
+    return matches
+
+
+def backfill_keys(cursor):
+    """Fill in train_key on reports written without it; returns rows updated
+
+    Only live reports have the column: archived ones are never matched.
+    """
+    updated = last_id = 0
+    while True:
+        cursor.execute(f"""
+            SELECT id, train_number FROM lost_found
+            WHERE id > %s AND train_key IS NULL ORDER BY id LIMIT {BACKFILL_ROWS}
+        """, (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany("UPDATE lost_found SET train_key = %s WHERE id = %s",
+                           [(train_key(train_number), report_id) for report_id, train_number in rows])
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Match unclaimed found items to open lost & found reports")
+    parser.add_argument('--window', type=int, default=MATCH_WINDOW_DAYS, help="days either side of the find")
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD)
+    args = parser.parse_args(argv)
+    matches = match_backlog(args.window, args.threshold)
+    print(f"Matched {len(matches)} found items to reports")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
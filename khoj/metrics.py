@@ -0,0 +1,363 @@
+"""Query and page-render instrumentation with a slow-query log and Prometheus export
+
+Every cursor from khoj.db is wrapped while KHOJ_METRICS is on (the
+default). Each statement is timed from execute() through its last fetch and
+its rows are counted (rows fetched for reads, rowcount for writes). It is
+tagged with the function that ran it: the nearest public function on the
+stack outside khoj.db, so helpers like rollups._fetch report under their
+caller. Statements taking at least KHOJ_SLOW_QUERY_MS (default 200) are
+logged to the 'khoj.slow_queries' logger, without parameters, and to
+KHOJ_SLOW_QUERY_LOG if set. KHOJ1.py times each page render.
+
+Metrics are exported in the Prometheus text format, to KHOJ_METRICS_FILE
+(rewritten every KHOJ_METRICS_INTERVAL seconds, e.g. for node_exporter's
+textfile collector) and/or over HTTP on 127.0.0.1:KHOJ_METRICS_PORT/metrics.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get('KHOJ_METRICS', '1') != '0'
+SLOW_QUERY_SECONDS = float(os.environ.get('KHOJ_SLOW_QUERY_MS', '200')) / 1000
+SLOW_QUERY_LOG = os.environ.get('KHOJ_SLOW_QUERY_LOG')
+METRICS_FILE = os.environ.get('KHOJ_METRICS_FILE')
+METRICS_INTERVAL = float(os.environ.get('KHOJ_METRICS_INTERVAL', '15'))
+METRICS_PORT = int(os.environ.get('KHOJ_METRICS_PORT', '0'))
+
+# Histogram bucket upper bounds, seconds
+QUERY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+PAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_log = logging.getLogger('khoj.slow_queries')
+if SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG)
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_log.addHandler(_handler)
+    slow_log.setLevel(logging.INFO)
+
+
+class Histogram:
+    """Prometheus-style histogram: cumulative bucket counts, sum and count"""
+    __slots__ = ('bounds', 'buckets', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, hits in zip(self.bounds + ('+Inf',), self.buckets):
+            cumulative += hits
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class Registry:
+    """Per-process query and page metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = {}  # (function, statement) -> Histogram
+        self.rows = {}  # (function, statement) -> rows
+        self.slow = {}  # (function, statement) -> slow statements
+        self.pages = {}  # (page, role) -> Histogram
+
+    def record_query(self, function, statement, seconds, rows):
+        key = (function, statement)
+        with self._lock:
+            histogram = self.queries.get(key)
+            if histogram is None:
+                histogram = self.queries[key] = Histogram(QUERY_BUCKETS)
+            histogram.observe(seconds)
+            self.rows[key] = self.rows.get(key, 0) + rows
+            if seconds >= SLOW_QUERY_SECONDS:
+                self.slow[key] = self.slow.get(key, 0) + 1
+
+    def record_page(self, page, role, seconds):
+        key = (page, role or '')
+        with self._lock:
+            histogram = self.pages.get(key)
+            if histogram is None:
+                histogram = self.pages[key] = Histogram(PAGE_BUCKETS)
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.queries, self.rows, self.slow, self.pages = {}, {}, {}, {}
+
+    def render(self, extra=()):
+        """Prometheus text exposition of everything recorded, plus (name, help, type, samples) extras"""
+        with self._lock:
+            queries = {key: _copy(histogram) for key, histogram in self.queries.items()}
+            rows, slow = dict(self.rows), dict(self.slow)
+            pages = {key: _copy(histogram) for key, histogram in self.pages.items()}
+        out = ['# HELP khoj_query_duration_seconds Statement time from execute to last fetch',
+               '# TYPE khoj_query_duration_seconds histogram']
+        for (function, statement), histogram in sorted(queries.items()):
+            out.extend(histogram.lines('khoj_query_duration_seconds',
+                                       _labels(function=function, statement=statement)))
+        out += ['# HELP khoj_query_rows_total Rows fetched (reads) or affected (writes)',
+                '# TYPE khoj_query_rows_total counter']
+        out += [f'khoj_query_rows_total{{{_labels(function=function, statement=statement)}}} {count}'
+                for (function, statement), count in sorted(rows.items())]
+        out += [f'# HELP khoj_slow_queries_total Statements slower than {SLOW_QUERY_SECONDS * 1000:g} ms',
+                '# TYPE khoj_slow_queries_total counter']
+        out += [f'khoj_slow_queries_total{{{_labels(function=function, statement=statement)}}} {count}'
+                for (function, statement), count in sorted(slow.items())]
+        out += ['# HELP khoj_page_render_seconds KHOJ1.py script run time per page',
+                '# TYPE khoj_page_render_seconds histogram']
+        for (page, role), histogram in sorted(pages.items()):
+            out.extend(histogram.lines('khoj_page_render_seconds', _labels(page=page, role=role)))
+        for name, help_text, kind, samples in extra:
+            out += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            out += [f'{name}{{{_labels(**labels)}}} {value}' if labels else f'{name} {value}'
+                    for labels, value in samples]
+        return '\n'.join(out) + '\n'
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.bounds)
+    copy.buckets, copy.sum, copy.count = list(histogram.buckets), histogram.sum, histogram.count
+    return copy
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+
+# Query instrumentation
+# Frames in these files are never the caller
+_INTERNAL_FILES = {__file__, os.path.join(os.path.dirname(__file__), 'db.py')}
+
+
+# Frames in these modules only pass calls along (thread pools, context managers)
+_PLUMBING = ('concurrent.', 'threading', 'contextlib')
+
+
+def _caller():
+    """'module.function' of the nearest public function calling into khoj.db"""
+    frame = sys._getframe(2)
+    fallback = None
+    for _ in range(12):
+        if frame is None:
+            break
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        if code.co_filename not in _INTERNAL_FILES and not module.startswith(_PLUMBING):
+            if code.co_name[0] not in '_<':
+                return f"{module}.{code.co_name}"
+            fallback = fallback or f"{module}.{code.co_name}"
+        frame = frame.f_back
+    return fallback or '?'
+
+
+def _statement(sql):
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else ''
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing each statement from execute() through its last fetch"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._open = None  # [function, statement, sql, seconds, rows, count fetched rows]
+
+    def _finish(self):
+        current, self._open = self._open, None
+        if current is None:
+            return
+        function, statement, sql, seconds, rows, _ = current
+        registry.record_query(function, statement, seconds, rows)
+        if seconds >= SLOW_QUERY_SECONDS:
+            slow_log.warning("slow query %.1f ms, %d rows, in %s: %s", seconds * 1000, rows, function,
+                             ' '.join(sql.split())[:500])
+
+    def _run(self, method, sql, params):
+        self._finish()
+        function = _caller()
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            seconds = time.perf_counter() - started
+            rowcount = getattr(self._cursor, 'rowcount', -1)
+            statement = _statement(sql)
+            # Reads are counted as they are fetched; writes report rowcount
+            fetched = statement in ('SELECT', 'WITH', 'SHOW', 'EXPLAIN')
+            self._open = [function, statement, sql, seconds, 0 if fetched else max(rowcount or 0, 0), fetched]
+
+    def execute(self, sql, params=()):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self._run(self._cursor.executemany, sql, params)
+
+    def _fetch(self, method, *args, single=False):
+        started = time.perf_counter()
+        result = method(*args)
+        current = self._open
+        if current is not None:
+            current[3] += time.perf_counter() - started
+            if current[5]:
+                current[4] += (result is not None) if single else len(result)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone, single=True)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, *(() if size is None else (size,)))
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(1000)
+            if not rows:
+                return
+            yield from rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def instrument(cursor):
+    return InstrumentedCursor(cursor) if ENABLED else cursor
+
+
+# Page renders
+class PageTimer:
+    """Times one script run of a page; call done() in a finally around the page body
+
+    Streamlit ends a run early by raising (st.rerun(), st.stop()), so only a
+    finally records those runs too.
+    """
+
+    def __init__(self, page, role=None):
+        self.page, self.role = page, role
+        self.started = time.perf_counter()
+
+    def done(self):
+        if ENABLED:
+            registry.record_page(self.page, self.role, time.perf_counter() - self.started)
+
+
+def page_timer(page, role=None):
+    return PageTimer(page, role)
+
+
+# Export
+def _extras():
+    from khoj import cache, db, snapshot, writebehind
+    pool = db.pool_metrics()
+    extras = [
+        ('khoj_pool_connections', 'Pooled connections by state', 'gauge',
+         [({'state': state}, pool[state]) for state in ('open', 'in_use', 'idle', 'waiting')]),
+        ('khoj_pool_checkouts_total', 'Connection checkouts', 'counter', [({}, pool['checkouts'])]),
+        ('khoj_pool_timeouts_total', 'Checkouts that timed out', 'counter', [({}, pool['timeouts'])]),
+    ]
+    cache_stats = cache.cache_stats()
+    extras.append(('khoj_cache_lookups_total', 'Dashboard cache lookups', 'counter',
+                   [({'result': 'hit'}, cache_stats['hits']), ({'result': 'miss'}, cache_stats['misses'])]))
+    queue = writebehind.queue_metrics()
+    if queue:
+        extras.append(('khoj_write_behind_depth', 'Submissions waiting in the journal', 'gauge',
+                       [({}, queue['depth'])]))
+        extras.append(('khoj_write_behind_failed_total', 'Queued submissions the database refused', 'counter',
+                       [({}, queue['failed'])]))
+    if snapshot.BACKEND == 'snapshot':
+        now = datetime.now()
+        extras.append(('khoj_snapshot_age_seconds', 'Seconds since each snapshot table was exported', 'gauge',
+                       [({'table': table.table}, round((now - table.exported_at).total_seconds(), 1))
+                        for table in snapshot.freshness()]))
+    return extras
+
+
+def render():
+    """Prometheus text for this process: queries, pages, pool, cache, write-behind queue and snapshot age"""
+    return registry.render(_extras())
+
+
+def write_file(path=None):
+    """Atomically replace path (default KHOJ_METRICS_FILE) with the current metrics"""
+    path = path or METRICS_FILE
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as output:
+        output.write(render())
+    os.replace(temporary, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def _write_periodically():
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            write_file()
+        except OSError as error:
+            logging.getLogger(__name__).warning("Could not write %s: %s", METRICS_FILE, error)
+
+
+def start():
+    """Start the configured exporters (file writer, HTTP endpoint) once per process"""
+    global _exporters_started
+    if _exporters_started or not ENABLED:
+        return
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+        if METRICS_FILE:
+            threading.Thread(target=_write_periodically, name='khoj-metrics-file', daemon=True).start()
+        if METRICS_PORT:
+            try:
+                server = ThreadingHTTPServer(('127.0.0.1', METRICS_PORT), _MetricsHandler)
+            except OSError as error:
+                # Another server process on this host already serves the port
+                logging.getLogger(__name__).warning("Metrics port %s unavailable: %s", METRICS_PORT, error)
+            else:
+                threading.Thread(target=server.serve_forever, name='khoj-metrics-http', daemon=True).start()
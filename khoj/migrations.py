@@ -0,0 +1,232 @@
+"""Versioned schema migrations
+
+Migrations run once per server process (the first script run applies them,
+later reruns are a no-op) and are recorded in the schema_migrations table.
+Append new migrations to MIGRATIONS; never edit one that has shipped. A
+step is either a SQL statement or a callable taking the cursor (backfills).
+
+    python -m khoj.migrations            # apply pending migrations
+    python -m khoj.migrations status     # show applied/pending versions
+"""
+import sys
+import threading
+
+from khoj import archive, events, forecast, hotspots, ingest, matching, rollups, stations, users, writebehind
+from khoj.complaints import COMPLAINT_TABLES, backfill_assignees
+from khoj.db import dialect, transaction
+from khoj.schema import TABLES
+
+
+def _drop_index(table, index):
+    """Step dropping an index (the syntax differs between MySQL and SQLite)"""
+    def drop(cursor):
+        cursor.execute(f"DROP INDEX {index} ON {table}" if dialect() == 'mysql' else f"DROP INDEX {index}")
+    return drop
+
+
+MIGRATIONS = [
+    (1, 'create base tables', TABLES),
+    (2, 'indexes for volunteer queues, user history, companion search and assignment joins', [
+        # Volunteer queues: status IN (...) ORDER BY status, created_at
+        "CREATE INDEX idx_lost_found_status_created ON lost_found (status, created_at)",
+        "CREATE INDEX idx_medical_assistance_status_created ON medical_assistance (status, created_at)",
+        "CREATE INDEX idx_womens_safety_status_created ON womens_safety (status, created_at)",
+        # Track Applications: WHERE user_name = %s ORDER BY created_at DESC
+        "CREATE INDEX idx_lost_found_user_created ON lost_found (user_name, created_at)",
+        "CREATE INDEX idx_medical_assistance_user_created ON medical_assistance (user_name, created_at)",
+        "CREATE INDEX idx_womens_safety_user_created ON womens_safety (user_name, created_at)",
+        # find_travel_companions: four-column equality, status filtered from the index
+        "CREATE INDEX idx_womens_safety_route ON womens_safety "
+        "(boarding_station, destination_station, travel_date, looking_for_companion, status)",
+        # Every join on (complaint_type, complaint_id), covering the volunteer_email filter
+        "CREATE INDEX idx_volunteer_assignments_complaint ON volunteer_assignments "
+        "(complaint_type, complaint_id, volunteer_email)",
+        "CREATE INDEX idx_volunteer_assignments_volunteer ON volunteer_assignments "
+        "(volunteer_email, complaint_type, complaint_id)",
+        "CREATE INDEX idx_travel_companions_companion ON travel_companions (companion_name)",
+    ]),
+    (3, 'daily analytics rollups', [
+        rollups.DAILY_TABLE,
+        rollups.TERMS_TABLE,
+        rollups.rebuild,
+    ]),
+    (4, 'indexes for filtered volunteer queues', [
+        "CREATE INDEX idx_lost_found_status_train_created ON lost_found (status, train_number, created_at)",
+        "CREATE INDEX idx_medical_assistance_status_type_created ON medical_assistance "
+        "(status, assistance_type, created_at)",
+    ]),
+    (5, 'index companion requests by womens_safety request', [
+        # MySQL already indexes the foreign key; SQLite does not
+        "CREATE INDEX idx_travel_companions_request ON travel_companions (request_id)",
+    ]),
+    (6, 'bulk ingestion checkpoints', [
+        ingest.CHECKPOINT_TABLE,
+    ]),
+    (7, 'write-behind receipts', [
+        writebehind.RECEIPTS_TABLE,
+    ]),
+    (8, 'count common lost & found items by normalized name', [
+        rollups.rebuild,
+    ]),
+    (9, 'found items register', [
+        matching.FOUND_ITEMS_TABLE,
+        # Matching a new report: unclaimed items on its train around its date
+        "CREATE INDEX idx_found_items_status_train_found ON found_items (status, train_key, found_at)",
+        "CREATE INDEX idx_found_items_complaint ON found_items (complaint_id)",
+    ]),
+    (10, 'station/time hotspot models', [
+        hotspots.MODELS_TABLE,
+        hotspots.CLUSTERS_TABLE,
+    ]),
+    (11, 'per-station forecast models', [
+        forecast.MODELS_TABLE,
+    ]),
+    (12, 'status event log and current assignee columns', [
+        events.EVENTS_TABLE,
+        # Timelines: one complaint's events in order; time-in-state scans a type
+        "CREATE INDEX idx_status_events_complaint ON complaint_status_events (complaint_type, complaint_id, id)",
+        "CREATE INDEX idx_status_events_changed ON complaint_status_events (complaint_type, changed_at)",
+        *[f"ALTER TABLE {table} ADD COLUMN {column}"
+          for table in COMPLAINT_TABLES
+          for column in ('assigned_volunteer_name VARCHAR(100)', 'assigned_volunteer_phone VARCHAR(15)',
+                         'assigned_volunteer_email VARCHAR(100)', 'assigned_at TIMESTAMP NULL')],
+        # Volunteer queues: closed statuses assigned to one volunteer, newest first
+        *[f"CREATE INDEX idx_{table}_assignee_status_created ON {table} "
+          f"(assigned_volunteer_email, status, created_at)" for table in COMPLAINT_TABLES],
+        backfill_assignees,
+        events.backfill,
+    ]),
+    (13, 'volunteer claims on open complaints', [
+        *[f"ALTER TABLE {table} ADD COLUMN {column}"
+          for table in COMPLAINT_TABLES
+          for column in ('claimed_by VARCHAR(100)', 'claim_expires_at DATETIME NULL')],
+        # Renewing and listing one volunteer's claims
+        *[f"CREATE INDEX idx_{table}_claim ON {table} (claimed_by, claim_expires_at)"
+          for table in COMPLAINT_TABLES],
+    ]),
+    (14, 'updated_at watermarks for the change feed', [
+        # Left NULL on existing rows (no table rewrite); writes stamp it from here on
+        *[f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME NULL" for table in COMPLAINT_TABLES],
+        *[f"CREATE INDEX idx_{table}_user_updated ON {table} (user_name, updated_at)"
+          for table in COMPLAINT_TABLES],
+        *[f"CREATE INDEX idx_{table}_updated ON {table} (updated_at)" for table in COMPLAINT_TABLES],
+    ]),
+    (15, 'month-partitioned archive tables for long-resolved complaints', [
+        archive.create_tables,
+        *archive.INDEXES,
+    ]),
+    (16, 'station registry with integer station ids', [
+        stations.STATIONS_TABLE,
+        stations.seed,
+        *[f"ALTER TABLE {source} ADD COLUMN {column} INT NULL"
+          for table in stations.STATION_FIELDS
+          for source in archive.sources(table)
+          for column in stations.id_columns(table)],
+        stations.backfill,
+        # find_travel_companions: the route on integers instead of two VARCHAR(100)s
+        _drop_index('womens_safety', 'idx_womens_safety_route'),
+        "CREATE INDEX idx_womens_safety_route_ids ON womens_safety "
+        "(boarding_station_id, destination_station_id, travel_date, looking_for_companion, status)",
+        # Count every spelling of a station under its registered name
+        rollups.rebuild,
+    ]),
+    (17, 'revoked session tokens', [
+        users.REVOKED_SESSIONS_TABLE,
+        # end_session prunes expired revocations
+        "CREATE INDEX idx_revoked_sessions_expires ON revoked_sessions (expires_at)",
+    ]),
+    (18, 'train key on lost & found reports for found-item matching', [
+        # Live reports only: archived ones are never matched
+        "ALTER TABLE lost_found ADD COLUMN train_key VARCHAR(50)",
+        matching.backfill_keys,
+        # match_found_item: one train's open reports around the find
+        "CREATE INDEX idx_lost_found_train_key ON lost_found (train_key, status, created_at)",
+    ]),
+    (19, 'common-item rollups over words in every script', [
+        # khoj.text.tokenize used to drop non-Latin words, so those items were counted blank
+        rollups.rebuild,
+    ]),
+    (20, 'claim expiry index for the volunteer queue change check', [
+        # changed_since(claims_since=...): leases that ran out since a queue page was read
+        *[f"CREATE INDEX idx_{table}_claim_expires ON {table} (claim_expires_at)" for table in COMPLAINT_TABLES],
+    ]),
+    (21, 'hotspot models stored as arrays', [
+        # Pickled models are no longer read; the next update refits (the clusters stay until then)
+        "DELETE FROM hotspot_models",
+    ]),
+    (22, 'forecast models stored as arrays', [
+        # Pickled models are no longer read; the next update or dashboard load refits
+        "DELETE FROM forecast_models",
+    ]),
+]
+
+VERSION_TABLE = '''CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+_lock = threading.Lock()
+_schema_ready = False
+
+
+def applied_versions(cursor):
+    cursor.execute(VERSION_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate():
+    """Apply every pending migration; returns the versions applied"""
+    applied = []
+    with transaction() as cursor:
+        # Keep two server processes from migrating the same database at once
+        if dialect() == 'mysql':
+            cursor.execute("SELECT GET_LOCK('khoj_schema_migrations', 60)")
+            cursor.fetchall()
+        try:
+            done = applied_versions(cursor)
+            for version, name, statements in MIGRATIONS:
+                if version in done:
+                    continue
+                # MySQL commits DDL implicitly, so a migration is only as atomic
+                # as its statements; keep each one small and re-runnable.
+                for statement in statements:
+                    if callable(statement):
+                        statement(cursor)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                               (version, name))
+                applied.append(version)
+        finally:
+            if dialect() == 'mysql':
+                cursor.execute("SELECT RELEASE_LOCK('khoj_schema_migrations')")
+                cursor.fetchall()
+    return applied
+
+
+def ensure_schema():
+    """Bring the schema up to date, once per process"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _lock:
+        if not _schema_ready:
+            migrate()
+            _schema_ready = True
+
+
+def status():
+    with transaction() as cursor:
+        done = applied_versions(cursor)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['status']:
+        for version, name, applied in status():
+            print(f"{version:>4}  {'applied' if applied else 'pending':<8} {name}")
+    else:
+        versions = migrate()
+        print(f"Applied migrations: {versions}" if versions else "Schema is up to date")
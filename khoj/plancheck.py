@@ -0,0 +1,200 @@
+"""EXPLAIN-based check that the hot queries are served by indexes
+
+Seeds a scratch database, runs each named query function while capturing the
+SQL it issues, and EXPLAINs every SELECT. Any full table scan is a failure.
+
+    python -m khoj.plancheck                    # temporary SQLite database
+    KHOJ_DB_NAME=khoj_scratch python -m khoj.plancheck --backend mysql
+
+The MySQL variant writes seed rows, so only point it at a scratch database.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from khoj import archive, db, events, matching, stations
+from khoj.complaints import (
+    STATUSES, application_changes, backfill_assignees, changed_since, claim_complaints, companion_index,
+    get_companion_requests, get_lost_found_complaints, get_medical_assistance_complaints, get_queue_page,
+    get_user_complaints, get_womens_safety_complaints, search_lost_found
+)
+from khoj.matching import ItemRecord, match_found_item, match_reports
+from khoj.migrations import migrate
+
+STATIONS = ['CSMT', 'Dadar', 'Thane', 'Kalyan', 'Kurla', 'Ghatkopar', 'Andheri',
+            'Borivali', 'Bandra', 'Churchgate', 'Panvel', 'Vashi']
+
+
+def _status(rng, statuses):
+    # Most history is resolved; the open queues are a small slice
+    return 'Resolved' if rng.random() < 0.85 else rng.choice(statuses)
+
+
+def seed(rows=5000, seed_value=7):
+    """Fill the complaint tables with a deterministic dataset"""
+    rng = random.Random(seed_value)
+    start = datetime(2025, 1, 1)
+    users = [f'user_{i}' for i in range(max(rows // 25, 1))]
+
+    def created_at():
+        return start + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+
+    with db.transaction() as cursor:
+        cursor.executemany("""
+            INSERT INTO lost_found
+            (user_name, train_number, compartment_number, seat_number, item_description,
+             phone_number, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, [(rng.choice(users), str(rng.randrange(11000, 11100)), f'S{rng.randrange(1, 12)}',
+               str(rng.randrange(1, 72)), rng.choice(['black bag', 'phone', 'wallet', 'umbrella']),
+               '9000000000', _status(rng, STATUSES['lost_found']), created_at())
+              for _ in range(rows)])
+        cursor.executemany("""
+            INSERT INTO medical_assistance
+            (user_name, symptoms, station_left, arriving_station, assistance_type, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [(rng.choice(users), rng.choice(['fever', 'chest pain', 'fainting']),
+               rng.choice(STATIONS), rng.choice(STATIONS),
+               rng.choice(['Ambulance Assistance', 'Volunteer Assistance']),
+               _status(rng, STATUSES['medical_assistance']), created_at())
+              for _ in range(rows)])
+        cursor.executemany("""
+            INSERT INTO womens_safety
+            (user_name, boarding_station, destination_station, time_of_boarding, phone_number,
+             travel_date, looking_for_companion, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, [(rng.choice(users), rng.choice(STATIONS), rng.choice(STATIONS),
+               f'{rng.randrange(5, 23):02d}:{rng.choice([0, 15, 30, 45]):02d}', '9000000000',
+               (start + timedelta(days=rng.randrange(365))).date(), rng.random() < 0.4,
+               _status(rng, STATUSES['womens_safety']), created_at())
+              for _ in range(rows)])
+        cursor.executemany("""
+            INSERT INTO volunteer_assignments
+            (complaint_type, complaint_id, volunteer_name, volunteer_phone, volunteer_email)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(rng.choice(['lost_found', 'medical_assistance', 'womens_safety']),
+               rng.randrange(1, rows + 1), f'volunteer_{v}', '9100000000', f'volunteer_{v}@khoj.in')
+              for v in (rng.randrange(50) for _ in range(rows // 3))])
+        backfill_assignees(cursor)
+        events.backfill(cursor)
+        stations.backfill(cursor)
+        matching.backfill_keys(cursor)
+        cursor.executemany("""
+            INSERT INTO travel_companions (request_id, companion_name, companion_phone, status)
+            VALUES (%s, %s, %s, %s)
+        """, [(rng.randrange(1, rows + 1), rng.choice(users), '9200000000',
+               rng.choice(['Pending', 'Accepted', 'Rejected']))
+              for _ in range(rows // 5)])
+        cursor.executemany("""
+            INSERT INTO found_items
+            (train_number, train_key, compartment_number, item_description, found_by, found_at, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [(train, train, f'S{rng.randrange(1, 12)}', rng.choice(['black bag', 'phone', 'wallet', 'umbrella']),
+               'volunteer_7', created_at(), rng.choice(['Unclaimed', 'Matched', 'Returned']))
+              for train in (str(rng.randrange(11000, 11100)) for _ in range(rows // 10))])
+        if db.dialect() == 'mysql':
+            for table in ('lost_found', 'medical_assistance', 'womens_safety', 'volunteer_assignments',
+                          'travel_companions', 'found_items', 'complaint_status_events'):
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+    return users
+
+
+def query_checks():
+    """(name, function, args[, kwargs]) for every query that must stay index-backed"""
+    return [
+        ('get_lost_found_complaints', get_lost_found_complaints, ()),
+        ('get_medical_assistance_complaints', get_medical_assistance_complaints, ()),
+        ('get_womens_safety_complaints', get_womens_safety_complaints, ()),
+        ('get_lost_found_complaints (volunteer)', get_lost_found_complaints, ('volunteer_7@khoj.in',)),
+        ('get_medical_assistance_complaints (volunteer)', get_medical_assistance_complaints, ('volunteer_7@khoj.in',)),
+        ('get_womens_safety_complaints (volunteer)', get_womens_safety_complaints, ('volunteer_7@khoj.in',)),
+        ('get_queue_page (train filter)', get_queue_page, ('lost_found', 'volunteer_7@khoj.in', None, 25),
+         {'train_number': '11042'}),
+        ('get_queue_page (assistance filter)', get_queue_page, ('medical_assistance', None, None, 25),
+         {'assistance_type': 'Ambulance Assistance', 'since': datetime(2025, 6, 1).date()}),
+        ('get_queue_page (station filter)', get_queue_page, ('womens_safety', None, None, 25),
+         {'station': 'Mumbai CST'}),
+        # Before the history reads, so they find archived rows
+        ('archive batch', archive.archive_batch, ('lost_found', datetime(2025, 4, 1), 100)),
+        ('get_user_complaints', get_user_complaints, ('user_7',)),
+        ('get_companion_requests', get_companion_requests, ('user_7',)),
+        ('companion index load', companion_index.refresh, (True,)),
+        ('search_lost_found', search_lost_found, ('black bag 11042',)),
+        ('match_found_item', match_found_item,
+         (ItemRecord(0, '11042', 'S4', 'black bag', datetime(2025, 6, 1, 10)),)),
+        ('match_reports', match_reports,
+         ([ItemRecord(0, '11042', 'S4', 'black bag', datetime(2025, 6, 1, 10))],)),
+        ('application_changes', application_changes, ('lost_found', 'user_7', datetime(2025, 6, 1))),
+        ('changed_since', changed_since, ('medical_assistance', datetime(2025, 6, 1))),
+        ('changed_since (claims)', changed_since, ('womens_safety', datetime(2099, 1, 1)),
+         {'claims_since': datetime(2025, 6, 1)}),
+        ('claim_complaints', claim_complaints, ('medical_assistance', 'volunteer_7@khoj.in', 5)),
+        ('status timeline', events.timeline, ('lost_found', 42)),
+        ('state spans', events.state_spans, ('medical_assistance',)),
+        ('state spans (since)', events.state_spans, ('womens_safety', datetime(2025, 12, 1).date())),
+    ]
+
+
+def full_scans(cursor, sql, params):
+    """Return the tables a statement reads with a full scan"""
+    if db.dialect() == 'mysql':
+        cursor.execute("EXPLAIN " + sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [row[columns.index('table')] for row in cursor.fetchall()
+                if row[columns.index('type')] == 'ALL']
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    scans = []
+    for row in cursor.fetchall():
+        match = re.match(r'SCAN (\w+)(.*)', row[3])
+        # SCAN CONSTANT ROW is a SELECT without a table
+        if match and 'INDEX' not in match.group(2) and row[3] != 'SCAN CONSTANT ROW':
+            scans.append(match.group(1))
+    return scans
+
+
+def check_query_plans(checks=None):
+    """EXPLAIN every SELECT the checked functions issue; returns the failures"""
+    failures = []
+    for name, func, args, *kwargs in checks or query_checks():
+        with db.capture_statements() as statements:
+            func(*args, **(kwargs[0] if kwargs else {}))
+        with db.transaction() as cursor:
+            for sql, params in statements:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                tables = full_scans(cursor, sql, params)
+                if tables:
+                    failures.append((name, tables, ' '.join(sql.split())))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--rows', type=int, default=5000, help="rows seeded per complaint table")
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite':
+        path = os.path.join(tempfile.mkdtemp(prefix='khoj-plancheck-'), 'plancheck.sqlite3')
+        db.configure('sqlite', path)
+    else:
+        db.configure('mysql')
+    migrate()
+    seed(args.rows)
+
+    failures = check_query_plans()
+    for name, tables, sql in failures:
+        print(f"FULL SCAN in {name} on {', '.join(tables)}: {sql}")
+    if failures:
+        return 1
+    print(f"All {len(query_checks())} query functions are index-backed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
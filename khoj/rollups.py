@@ -0,0 +1,384 @@
+"""Daily rollup tables behind the analytics dashboard
+
+complaint_rollup_daily counts complaints per day, complaint type, station,
+hour of day and status. complaint_rollup_terms counts the free-text values
+the insights rank (items, symptoms, routes, ...) per day. Both are kept up to
+date by the write functions in khoj.complaints, so dashboard queries only
+scan the days being shown. Stations are counted under their registered names
+(see khoj.stations), so every spelling of a station shares its buckets.
+
+    python -m khoj.rollups rebuild [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+"""
+import argparse
+from collections import Counter
+from datetime import date, timedelta
+
+from khoj import archive, snapshot, stations
+from khoj.db import inserted_value, on_duplicate_key, transaction
+from khoj.text import normalize_item
+
+DAILY_TABLE = '''CREATE TABLE IF NOT EXISTS complaint_rollup_daily (
+    day DATE NOT NULL,
+    complaint_type VARCHAR(50) NOT NULL,
+    station VARCHAR(100) NOT NULL,
+    hour TINYINT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    cases INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, complaint_type, station, hour, status)
+)'''
+
+TERMS_TABLE = '''CREATE TABLE IF NOT EXISTS complaint_rollup_terms (
+    day DATE NOT NULL,
+    complaint_type VARCHAR(50) NOT NULL,
+    dimension VARCHAR(20) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    cases INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, complaint_type, dimension, value)
+)'''
+
+DAILY_KEY = ('day', 'complaint_type', 'station', 'hour', 'status')
+TERMS_KEY = ('day', 'complaint_type', 'dimension', 'value')
+
+# Station column per complaint table (lost & found reports have none)
+STATION_COLUMNS = {
+    'lost_found': "''",
+    'medical_assistance': 'station_left',
+    'womens_safety': 'boarding_station',
+}
+
+# (dimension, SQL expression) pairs counted in complaint_rollup_terms.
+# Values are cut to the column width, so very long descriptions share a bucket.
+# Lost & found items are counted by normalized name (see NORMALIZED_TERMS).
+TERM_COLUMNS = {
+    'lost_found': [
+        ('item', 'item_description'),
+    ],
+    'medical_assistance': [
+        ('symptom', 'symptoms'),
+        ('assistance_type', 'assistance_type'),
+    ],
+    'womens_safety': [
+        ('route', "CONCAT(boarding_station, ' to ', destination_station)"),
+        ('station', 'boarding_station'),
+        ('station', 'destination_station'),
+    ],
+}
+
+# Dimensions whose SQL value is normalized in Python before it is counted
+NORMALIZED_TERMS = {
+    ('lost_found', 'item'): normalize_item,
+}
+
+
+# The same values computed from a row's columns, for batches counted without
+# reading the rows back (khoj.ingest)
+def _station(row, column):
+    """Registered name of a row's station (its text when it has no station id)"""
+    return stations.registry.name(row.get(f'{column}_id')) or row.get(column)
+
+
+ROW_STATION = {
+    'lost_found': lambda row: '',
+    'medical_assistance': lambda row: _station(row, 'station_left'),
+    'womens_safety': lambda row: _station(row, 'boarding_station'),
+}
+
+
+def _route(row):
+    boarding, destination = _station(row, 'boarding_station'), _station(row, 'destination_station')
+    if boarding is None or destination is None:
+        return None
+    return f"{boarding} to {destination}"
+
+
+ROW_TERMS = {
+    'lost_found': [
+        ('item', lambda row: normalize_item(row.get('item_description'))),
+    ],
+    'medical_assistance': [
+        ('symptom', lambda row: row.get('symptoms')),
+        ('assistance_type', lambda row: row.get('assistance_type')),
+    ],
+    'womens_safety': [
+        ('route', _route),
+        ('station', lambda row: _station(row, 'boarding_station')),
+        ('station', lambda row: _station(row, 'destination_station')),
+    ],
+}
+
+
+# named=False counts stations as written, for rebuilds run before the registry exists
+def _daily_select(table, named=True):
+    station = stations.canonical_sql(STATION_COLUMNS[table]) if named else STATION_COLUMNS[table]
+    return f"""
+        SELECT DATE(created_at), '{table}', COALESCE({station}, ''),
+               HOUR(created_at), status"""
+
+
+def _term_select(table, dimension, expression, named=True):
+    if named:
+        expression = stations.canonical_sql(expression)
+    return f"""
+        SELECT DATE(created_at) AS day, '{table}' AS complaint_type, '{dimension}' AS dimension,
+               SUBSTR(COALESCE({expression}, ''), 1, 255) AS value"""
+
+
+# Incremental maintenance (call inside the writing transaction)
+def _bump(cursor, table, complaint_id, delta, include_terms):
+    cursor.execute(f"""
+        INSERT INTO complaint_rollup_daily ({', '.join(DAILY_KEY)}, cases)
+        {_daily_select(table)}, %s
+        FROM {table} WHERE id = %s
+        {on_duplicate_key(DAILY_KEY, 'cases = cases + %s')}
+    """, (delta, complaint_id, delta))
+    if not include_terms:
+        return
+    for dimension, expression in TERM_COLUMNS[table]:
+        if (table, dimension) in NORMALIZED_TERMS:
+            cursor.execute(f"SELECT DATE(created_at), {expression} FROM {table} WHERE id = %s", (complaint_id,))
+            _add_terms(cursor, table, dimension, [row + (delta,) for row in cursor.fetchall()])
+            continue
+        cursor.execute(f"""
+            INSERT INTO complaint_rollup_terms ({', '.join(TERMS_KEY)}, cases)
+            {_term_select(table, dimension, expression)}, %s
+            FROM {table} WHERE id = %s
+            {on_duplicate_key(TERMS_KEY, 'cases = cases + %s')}
+        """, (delta, complaint_id, delta))
+
+
+def _add_terms(cursor, table, dimension, rows):
+    """Count [(day, raw value, cases)] under their normalized values"""
+    normalize = NORMALIZED_TERMS[(table, dimension)]
+    counts = Counter()
+    for day, value, cases in rows:
+        counts[(day, table, dimension, (normalize(value) or '')[:255])] += int(cases)
+    if counts:
+        cursor.executemany(f"""
+            INSERT INTO complaint_rollup_terms ({', '.join(TERMS_KEY)}, cases)
+            VALUES ({', '.join(['%s'] * (len(TERMS_KEY) + 1))})
+            {on_duplicate_key(TERMS_KEY, f'cases = cases + {inserted_value("cases")}')}
+        """, [bucket + (cases,) for bucket, cases in counts.items()])
+
+
+def record_complaint(cursor, table, complaint_id):
+    """Count a newly inserted complaint"""
+    _bump(cursor, table, complaint_id, 1, include_terms=True)
+
+
+def retract_status(cursor, table, complaint_id):
+    """Remove a complaint's current status bucket before its status changes"""
+    _bump(cursor, table, complaint_id, -1, include_terms=False)
+
+
+def record_status(cursor, table, complaint_id):
+    """Count a complaint under its (new) status"""
+    _bump(cursor, table, complaint_id, 1, include_terms=False)
+
+
+def record_rows(cursor, table, rows):
+    """Count a batch of inserted complaints from their column values (created_at and status set)"""
+    daily, terms = Counter(), Counter()
+    for row in rows:
+        day, hour = row['created_at'].date(), row['created_at'].hour
+        daily[(day, table, ROW_STATION[table](row) or '', hour, row['status'])] += 1
+        for dimension, value in ROW_TERMS[table]:
+            terms[(day, table, dimension, (value(row) or '')[:255])] += 1
+    for rollup, key, counts in (('complaint_rollup_daily', DAILY_KEY, daily),
+                                ('complaint_rollup_terms', TERMS_KEY, terms)):
+        if counts:
+            cursor.executemany(f"""
+                INSERT INTO {rollup} ({', '.join(key)}, cases)
+                VALUES ({', '.join(['%s'] * (len(key) + 1))})
+                {on_duplicate_key(key, f'cases = cases + {inserted_value("cases")}')}
+            """, [bucket + (cases,) for bucket, cases in counts.items()])
+
+
+# Backfill / rebuild
+def rebuild(cursor, since=None, until=None):
+    """Recompute the rollups for [since, until] (inclusive) from the live and archived complaints"""
+    where, params = _created_range(since, until)
+    day_where, day_params = _day_range(since, until)
+    cursor.execute(f"DELETE FROM complaint_rollup_daily WHERE {day_where}", day_params)
+    cursor.execute(f"DELETE FROM complaint_rollup_terms WHERE {day_where}", day_params)
+    # Early migrations rebuild before the archive tables and the station registry exist
+    archived, named = archive.installed(cursor), stations.installed(cursor)
+    if archived:
+        params = params * 2
+    for table in STATION_COLUMNS:
+        source = archive.history(table, where, archived=archived)
+        cursor.execute(f"""
+            INSERT INTO complaint_rollup_daily ({', '.join(DAILY_KEY)}, cases)
+            {_daily_select(table, named)}, COUNT(*)
+            FROM {source}
+            GROUP BY 1, 2, 3, 4, 5
+        """, params)
+        # One pass per table; dimensions that share a key (a route's two
+        # stations) are summed in the derived table instead of colliding
+        sql_terms = [(dimension, expression) for dimension, expression in TERM_COLUMNS[table]
+                     if (table, dimension) not in NORMALIZED_TERMS]
+        if sql_terms:
+            terms = ' UNION ALL '.join(
+                f"{_term_select(table, dimension, expression, named)} FROM {source}"
+                for dimension, expression in sql_terms
+            )
+            cursor.execute(f"""
+                INSERT INTO complaint_rollup_terms ({', '.join(TERMS_KEY)}, cases)
+                SELECT {', '.join(TERMS_KEY)}, COUNT(*)
+                FROM ({terms}) terms
+                GROUP BY {', '.join(TERMS_KEY)}
+            """, params * len(sql_terms))
+        for dimension, expression in TERM_COLUMNS[table]:
+            if (table, dimension) in NORMALIZED_TERMS:
+                cursor.execute(f"""
+                    SELECT DATE(created_at), {expression}, COUNT(*)
+                    FROM {source}
+                    GROUP BY 1, 2
+                """, params)
+                _add_terms(cursor, table, dimension, cursor.fetchall())
+
+
+def _created_range(since, until):
+    clauses, params = ['1 = 1'], []
+    if since:
+        clauses.append('created_at >= %s')
+        params.append(since)
+    if until:
+        clauses.append('created_at < %s')
+        params.append(until + timedelta(days=1))
+    return ' AND '.join(clauses), tuple(params)
+
+
+def _day_range(since, until):
+    clauses, params = ['1 = 1'], []
+    if since:
+        clauses.append('day >= %s')
+        params.append(since)
+    if until:
+        clauses.append('day <= %s')
+        params.append(until)
+    return ' AND '.join(clauses), tuple(params)
+
+
+# Reads for the dashboard
+def _fetch(sql, params):
+    with snapshot.reader() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def status_totals(since=None, until=None):
+    """[(complaint_type, status, cases)]"""
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT complaint_type, status, SUM(cases)
+        FROM complaint_rollup_daily WHERE {where}
+        GROUP BY complaint_type, status
+    """, params)
+
+
+def hour_totals(since=None, until=None):
+    """[(complaint_type, hour, cases)]"""
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT complaint_type, hour, SUM(cases)
+        FROM complaint_rollup_daily WHERE {where}
+        GROUP BY complaint_type, hour
+    """, params)
+
+
+def top_stations(complaint_type, limit, since=None, until=None):
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT station, SUM(cases) AS total
+        FROM complaint_rollup_daily WHERE complaint_type = %s AND {where}
+        GROUP BY station HAVING SUM(cases) > 0
+        ORDER BY total DESC, station LIMIT {int(limit)}
+    """, (complaint_type,) + params)
+
+
+def top_terms(complaint_type, dimension, limit=None, since=None, until=None):
+    where, params = _day_range(since, until)
+    limit_sql = f"LIMIT {int(limit)}" if limit else ''
+    return _fetch(f"""
+        SELECT value, SUM(cases) AS total
+        FROM complaint_rollup_terms
+        WHERE complaint_type = %s AND dimension = %s AND {where}
+        GROUP BY value HAVING SUM(cases) > 0
+        ORDER BY total DESC, value {limit_sql}
+    """, (complaint_type, dimension) + params)
+
+
+def weekday_hour_totals(complaint_type, since=None, until=None):
+    """[(day_of_week, hour, cases)] with MySQL DAYOFWEEK numbering (1 = Sunday)"""
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT DAYOFWEEK(day), hour, SUM(cases)
+        FROM complaint_rollup_daily WHERE complaint_type = %s AND {where}
+        GROUP BY DAYOFWEEK(day), hour
+    """, (complaint_type,) + params)
+
+
+def daily_totals(complaint_type=None, since=None, until=None):
+    """[(day, cases, resolved_cases)] ordered by day"""
+    where, params = _day_range(since, until)
+    if complaint_type:
+        where += ' AND complaint_type = %s'
+        params += (complaint_type,)
+    return _fetch(f"""
+        SELECT day, SUM(cases),
+               SUM(CASE WHEN status = 'Resolved' THEN cases ELSE 0 END)
+        FROM complaint_rollup_daily WHERE {where}
+        GROUP BY day ORDER BY day
+    """, params)
+
+
+def day_hour_totals(complaint_type, since=None, until=None):
+    """[(day, hour, cases)]"""
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT day, hour, SUM(cases)
+        FROM complaint_rollup_daily WHERE complaint_type = %s AND {where}
+        GROUP BY day, hour
+    """, (complaint_type,) + params)
+
+
+def first_day(complaint_type=None):
+    """Earliest day with rollup rows (for complaint_type), or None"""
+    where, params = ('complaint_type = %s', (complaint_type,)) if complaint_type else ('1 = 1', ())
+    rows = _fetch(f"SELECT day FROM complaint_rollup_daily WHERE {where} ORDER BY day LIMIT 1", params)
+    return rows[0][0] if rows else None
+
+
+def station_totals(since=None, until=None):
+    """[(complaint_type, station, cases)] for every station with complaints"""
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT complaint_type, station, SUM(cases)
+        FROM complaint_rollup_daily WHERE {where}
+        GROUP BY complaint_type, station HAVING SUM(cases) > 0
+    """, params)
+
+
+def station_hour_totals(since, until):
+    """[(day, complaint_type, station, hour, cases)] for the per-station forecasts"""
+    where, params = _day_range(since, until)
+    return _fetch(f"""
+        SELECT day, complaint_type, station, hour, SUM(cases)
+        FROM complaint_rollup_daily WHERE {where}
+        GROUP BY day, complaint_type, station, hour HAVING SUM(cases) > 0
+    """, params)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the KHOJ analytics rollups")
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--since', type=date.fromisoformat)
+    parser.add_argument('--until', type=date.fromisoformat)
+    args = parser.parse_args(argv)
+    with transaction() as cursor:
+        rebuild(cursor, args.since, args.until)
+    print("Rollups rebuilt")
+
+
+if __name__ == '__main__':
+    main()
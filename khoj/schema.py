@@ -0,0 +1,75 @@
+"""Table definitions for KHOJ (applied by khoj.migrations)"""
+
+TABLES = [
+    # Users Table
+    '''CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100),
+    email VARCHAR(100) UNIQUE,
+    password VARCHAR(255),
+    phone VARCHAR(15),
+    role ENUM('USER', 'VOLUNTEER')
+)''',
+
+    # Lost & Found Table
+    '''CREATE TABLE IF NOT EXISTS lost_found (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_name VARCHAR(100),
+    train_number VARCHAR(50),
+    compartment_number VARCHAR(50),
+    seat_number VARCHAR(50),
+    item_description TEXT,
+    phone_number VARCHAR(15),
+    status ENUM('Pending', 'Received', 'Assigned to Volunteer', 'Searching', 'Found', 'Out for Delivery', 'Resolved') DEFAULT 'Pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)''',
+
+    # Medical Assistance Table
+    '''CREATE TABLE IF NOT EXISTS medical_assistance (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_name VARCHAR(100),
+    symptoms TEXT,
+    station_left VARCHAR(100),
+    arriving_station VARCHAR(100),
+    assistance_type VARCHAR(50),
+    status ENUM('Pending', 'Received', 'Assigned to Volunteer', 'In Progress', 'Out for Assistance', 'Resolved') DEFAULT 'Pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)''',
+
+    # Women's Safety Table with Travel Companion Features
+    '''CREATE TABLE IF NOT EXISTS womens_safety (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_name VARCHAR(100),
+    boarding_station VARCHAR(100),
+    destination_station VARCHAR(100),
+    time_of_boarding VARCHAR(50),
+    phone_number VARCHAR(15),
+    travel_date DATE,
+    looking_for_companion BOOLEAN DEFAULT FALSE,
+    status ENUM('Pending', 'Received', 'Assigned to Volunteer', 'In Progress', 'Assistance Dispatched', 'Resolved') DEFAULT 'Pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)''',
+
+    # Travel Companions Table
+    '''CREATE TABLE IF NOT EXISTS travel_companions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    request_id INT,
+    companion_name VARCHAR(100),
+    companion_phone VARCHAR(15),
+    status ENUM('Pending', 'Accepted', 'Rejected') DEFAULT 'Pending',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (request_id) REFERENCES womens_safety(id)
+)''',
+
+    # Volunteer Assignments Table
+    '''CREATE TABLE IF NOT EXISTS volunteer_assignments (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    complaint_type VARCHAR(50),
+    complaint_id INT,
+    volunteer_name VARCHAR(100),
+    volunteer_phone VARCHAR(15),
+    volunteer_email VARCHAR(100),
+    assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)''',
+]
+
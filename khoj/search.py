@@ -0,0 +1,196 @@
+"""Full-text search over lost & found reports
+
+An in-memory inverted index over item_description, train_number and
+compartment_number. Each term maps to the ids of the reports containing it
+and a per-report weight; a query adds idf-weighted weights for its terms into
+a dense score array and keeps the best ids (newest first on ties). The last
+query word also matches as a prefix, so "umbr" finds umbrellas.
+
+The index is built lazily from the database, updated by the complaint write
+functions in this process, and catches up on reports written by other
+processes (bulk loads, other servers) by id at most every
+KHOJ_SEARCH_REFRESH seconds. Reports that have left the table (archived)
+are dropped with remove() when a search finds them gone.
+"""
+import math
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import NamedTuple
+
+import numpy as np
+
+from khoj.text import tokenize
+
+SEARCH_REFRESH = float(os.environ.get('KHOJ_SEARCH_REFRESH', '5'))
+# Reports are read back this many ids below the newest one seen, because ids
+# from concurrent transactions can commit out of order
+CATCH_UP_OVERLAP = 1000
+LOAD_PAGE = 50000
+MAX_PREFIX_TERMS = 50
+
+# Field weights: a train number match says more than a word in the description
+FIELD_WEIGHTS = {'item_description': 1.0, 'train_number': 2.0, 'compartment_number': 1.0}
+
+
+class SearchHit(NamedTuple):
+    id: int
+    score: float
+
+
+def _document_terms(item_description, train_number, compartment_number):
+    """{term: weight} for one report; long descriptions weigh each word a little less"""
+    weights = {}
+    for field, text in (('item_description', item_description), ('train_number', train_number),
+                        ('compartment_number', compartment_number)):
+        tokens = tokenize(text)
+        for token in tokens:
+            weight = FIELD_WEIGHTS[field] / (1 + 0.1 * len(tokens))
+            weights[token] = max(weights.get(token, 0.0), weight)
+    return weights
+
+
+class ItemSearchIndex:
+    """Inverted index of lost & found reports"""
+
+    def __init__(self, loader=None, refresh_interval=SEARCH_REFRESH):
+        self.loader = loader  # callable(after_id, limit) -> [(id, item, train, compartment)]
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._terms = {}  # term -> (array of ids, array of weights)
+        self._sorted_terms = None  # vocabulary for prefix lookups, rebuilt after new terms
+        self._indexed = bytearray()  # 1 at [id] once a report is in the index, 2 once removed
+        self._removed = np.zeros(0, dtype=np.int64)  # ids whose postings no longer count
+        self._documents = 0
+        self._max_id = 0
+        self._watermark = None  # highest id read from the database; None until loaded
+        self._refreshed_at = 0.0
+
+    def __len__(self):
+        return self._documents
+
+    # Updates
+    def add(self, report_id, item_description, train_number=None, compartment_number=None):
+        with self._lock:
+            self._add(report_id, item_description, train_number, compartment_number)
+
+    def _add(self, report_id, item_description, train_number, compartment_number):
+        if report_id < len(self._indexed) and self._indexed[report_id]:
+            return
+        if report_id >= len(self._indexed):
+            self._indexed.extend(bytes(max(report_id + 1 - len(self._indexed), len(self._indexed))))
+        self._indexed[report_id] = 1
+        self._documents += 1
+        self._max_id = max(self._max_id, report_id)
+        for term, weight in _document_terms(item_description, train_number, compartment_number).items():
+            postings = self._terms.get(term)
+            if postings is None:
+                postings = self._terms[term] = (array('i'), array('f'))
+                self._sorted_terms = None
+            postings[0].append(report_id)
+            postings[1].append(weight)
+
+    def add_many(self, reports):
+        with self._lock:
+            for report in reports:
+                self._add(*report)
+
+    def remove(self, report_ids):
+        """Stop returning reports; their postings stay but score nothing"""
+        with self._lock:
+            removed = [report_id for report_id in report_ids
+                       if report_id < len(self._indexed) and self._indexed[report_id] == 1]
+            for report_id in removed:
+                self._indexed[report_id] = 2
+            self._documents -= len(removed)
+            if removed:
+                self._removed = np.concatenate([self._removed, np.array(removed, dtype=np.int64)])
+
+    # Loading
+    def refresh(self, force=False):
+        """Read reports written since the last refresh (the whole table the first time)"""
+        if self.loader is None:
+            return
+        if not force and self._watermark is not None and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        # The first load blocks every search; later catch-ups are skipped while one runs
+        if not self._load_lock.acquire(blocking=self._watermark is None):
+            return
+        try:
+            after = 0 if self._watermark is None else max(self._watermark - CATCH_UP_OVERLAP, 0)
+            while True:
+                rows = self.loader(after, LOAD_PAGE)
+                self.add_many(rows)
+                if rows:
+                    after = rows[-1][0]
+                if len(rows) < LOAD_PAGE:
+                    break
+            self._watermark = max(self._watermark or 0, after)
+            self._refreshed_at = time.monotonic()
+        finally:
+            self._load_lock.release()
+
+    # Queries
+    def _expand(self, token):
+        """Vocabulary terms starting with token"""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._terms)
+        start = bisect_left(self._sorted_terms, token)
+        matches = []
+        for term in self._sorted_terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            matches.append(term)
+        return matches
+
+    @staticmethod
+    def _postings(ids, weights):
+        # Copies: a live view would stop add() from growing the arrays
+        return np.frombuffer(ids, dtype=np.int32).copy(), np.frombuffer(weights, dtype=np.float32).copy()
+
+    def _idf(self, matches):
+        return math.log(1 + (self._documents - matches + 0.5) / (matches + 0.5))
+
+    def search(self, query, limit=20):
+        """Best matching report ids for query, as SearchHit(id, score)"""
+        self.refresh()
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            if not self._documents:
+                return []
+            scores = np.zeros(self._max_id + 1, dtype=np.float32)
+            for position, token in enumerate(tokens):
+                terms = [(token, 1.0)]
+                if position == len(tokens) - 1:
+                    # The word being typed: prefix matches count a little less than the word itself
+                    terms += [(term, 0.8) for term in self._expand(token) if term != token]
+                matched = [(self._terms[term], factor) for term, factor in terms if term in self._terms]
+                if len(matched) == 1:
+                    ids, weights = self._postings(*matched[0][0])
+                    scores[ids] += weights * np.float32(self._idf(len(ids)) * matched[0][1])
+                elif matched:
+                    # A report matching several expansions of one word scores once, for the best
+                    word_scores = np.zeros_like(scores)
+                    for postings, factor in matched:
+                        ids, weights = self._postings(*postings)
+                        word_scores[ids] = np.maximum(word_scores[ids],
+                                                      weights * np.float32(self._idf(len(ids)) * factor))
+                    scores += word_scores
+            scores[self._removed] = 0
+            # Every matched term adds a positive score
+            candidates = np.flatnonzero(scores)
+            if not len(candidates):
+                return []
+            # Newest report first among equal scores
+            ranked = scores[candidates].astype(np.float64) + candidates / (self._max_id + 1) * 1e-4
+            if len(candidates) > limit:
+                top = np.argpartition(-ranked, limit - 1)[:limit]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-ranked[top], kind='stable')]
+            return [SearchHit(int(candidates[i]), float(scores[candidates[i]])) for i in top]
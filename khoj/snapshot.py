@@ -0,0 +1,475 @@
+"""Columnar snapshot of the complaint tables for the analytics dashboard
+
+Run on the primary database, the dashboard's scans (the khoj.rollups reads,
+the analyze_* frames, status durations) compete with live complaint writes.
+With KHOJ_ANALYTICS_BACKEND=snapshot they run instead on an embedded DuckDB
+over Parquet files exported from the complaint tables and the status log:
+
+    {KHOJ_SNAPSHOT_DIR}/{table}/month=YYYY-MM/data_0.parquet
+
+one file per table and month of created_at (changed_at for status events).
+Rows keep a day column, which row group statistics prune on. The first
+export copies every row, reading the database in id ranges of
+KHOJ_SNAPSHOT_CHUNK_ROWS. Later exports read only the rows written since
+the previous one (updated_at and new ids, see khoj.complaints' change feed)
+and rewrite just the months those rows fall in, each month's file replaced
+atomically. The rollup tables are views aggregating the complaint files, so
+the dashboard's SQL runs unchanged. Names and phone numbers are not
+exported. Archived complaints (khoj.archive) are exported with the live
+ones, and stay in the snapshot when they move to the archive. A table whose
+exported columns changed since the last export is copied in full again.
+
+    python -m khoj.snapshot export [--full] [--every SECONDS]
+    python -m khoj.snapshot status
+
+Run one exporter at a time. Until the first export has finished, analytics
+read the database.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from khoj import archive, metrics
+from khoj.stations import STATION_FIELDS, id_columns
+from khoj.cache import invalidate as invalidate_dashboard_cache
+from khoj.db import transaction
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # the snapshot backend is optional
+    duckdb = None
+
+BACKEND = os.environ.get('KHOJ_ANALYTICS_BACKEND', 'database')
+SNAPSHOT_DIR = os.environ.get('KHOJ_SNAPSHOT_DIR', 'khoj-snapshot')
+EXPORT_CHUNK_ROWS = int(os.environ.get('KHOJ_SNAPSHOT_CHUNK_ROWS', '50000'))
+
+STATE_FILE = 'snapshot.json'
+
+log = logging.getLogger(__name__)
+
+
+class SnapshotTable(NamedTuple):
+    name: str
+    columns: tuple  # exported as they are, id first
+    day_column: str  # rows are partitioned by the month of this column
+    changed: tuple  # WHERE clauses for rows written since a cursor (one %s each)
+
+
+COMPLAINT_COLUMNS = {
+    'lost_found': ('train_number', 'compartment_number', 'item_description'),
+    'medical_assistance': ('symptoms', 'station_left', 'arriving_station', 'assistance_type',
+                           'station_left_id', 'arriving_station_id'),
+    'womens_safety': ('boarding_station', 'destination_station', 'time_of_boarding',
+                      'boarding_station_id', 'destination_station_id'),
+}
+
+TABLES = [
+    SnapshotTable(table, ('id', 'created_at', 'updated_at', 'status') + columns, 'created_at',
+                  ('updated_at >= %s',))
+    for table, columns in COMPLAINT_COLUMNS.items()
+] + [
+    # Events are only appended; the per-type clauses use the (type, changed_at)
+    # index to catch ids that committed after a higher one was exported
+    SnapshotTable('complaint_status_events',
+                  ('id', 'complaint_type', 'complaint_id', 'from_status', 'to_status', 'changed_at'),
+                  'changed_at',
+                  tuple(f"complaint_type = '{table}' AND changed_at >= %s" for table in COMPLAINT_COLUMNS)),
+]
+
+INTEGER_COLUMNS = ('id', 'complaint_id', *[column for table in STATION_FIELDS for column in id_columns(table)])
+TIMESTAMP_COLUMNS = ('created_at', 'updated_at', 'changed_at')
+
+
+class TableFreshness(NamedTuple):
+    table: str
+    rows: int
+    as_of: datetime  # database time the last export read changes up to
+    exported_at: datetime
+    changed: int  # rows the last export wrote
+    seconds: float  # how long the last export took
+
+
+def configure(backend=None, directory=None):
+    """Switch the analytics backend ('database' or 'snapshot') and snapshot directory"""
+    global BACKEND, SNAPSHOT_DIR, _connection, _loaded
+    with _lock:
+        BACKEND = backend or BACKEND
+        SNAPSHOT_DIR = directory or SNAPSHOT_DIR
+        if _connection is not None:
+            _connection.close()
+        _connection, _loaded = None, None
+
+
+def enabled():
+    if BACKEND == 'database':
+        return False
+    if BACKEND != 'snapshot':
+        raise RuntimeError(f"Unknown KHOJ_ANALYTICS_BACKEND {BACKEND!r}; use 'database' or 'snapshot'")
+    if duckdb is None:
+        raise RuntimeError("KHOJ_ANALYTICS_BACKEND=snapshot needs duckdb and pyarrow installed")
+    return True
+
+
+# Export
+def _derived_columns(table):
+    """[(column, fn(row))]: the rollup station and terms, precomputed per row"""
+    # Imported here: khoj.rollups reads through this module
+    from khoj.rollups import ROW_STATION, ROW_TERMS
+    if table not in ROW_STATION:
+        return []
+    station = ROW_STATION[table]
+    columns = [('station', lambda row: station(row) or '')]
+    for number, (_, value) in enumerate(ROW_TERMS[table]):
+        columns.append((f'term_{number}', lambda row, value=value: (value(row) or '')[:255]))
+    return columns
+
+
+def _arrow_type(column):
+    if column in INTEGER_COLUMNS:
+        return pa.int64()
+    if column in TIMESTAMP_COLUMNS:
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def _schema(spec):
+    fields = [(column, _arrow_type(column)) for column in spec.columns]
+    fields += [(column, pa.string()) for column, _ in _derived_columns(spec.name)]
+    return pa.schema(fields + [('day', pa.date32()), ('month', pa.string())])
+
+
+def _to_arrow(spec, rows):
+    records = [dict(zip(spec.columns, row)) for row in rows]
+    data = {column: [record[column] for record in records] for column in spec.columns}
+    for column, value in _derived_columns(spec.name):
+        data[column] = [value(record) for record in records]
+    data['day'] = [record[spec.day_column].date() if record[spec.day_column] else None for record in records]
+    data['month'] = [f'{day:%Y-%m}' if day else None for day in data['day']]
+    return pa.Table.from_pydict(data, schema=_schema(spec))
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _month_file(directory, month):
+    return os.path.join(directory, f'month={month}', 'data_0.parquet')
+
+
+def _copy_by_month(con, select, directory):
+    con.execute(f"COPY ({select}) TO {_quote(directory)} (FORMAT PARQUET, PARTITION_BY (month))")
+
+
+def _read_parquet(paths):
+    paths = [paths] if isinstance(paths, str) else paths
+    return (f"read_parquet([{', '.join(_quote(path) for path in paths)}], "
+            f"hive_partitioning = true, hive_types = {{'month': VARCHAR}})")
+
+
+def _export_full(con, spec, directory):
+    """Copy the whole table; returns (last id, rows)"""
+    target = os.path.join(directory, spec.name)
+    staging, fresh, stale = target + '.staging.parquet', target + '.new', target + '.old'
+    last_id, rows = 0, 0
+    with pq.ParquetWriter(staging, _schema(spec)) as writer:
+        while True:
+            # One short read per id range, so the export never holds the tables
+            with transaction() as cursor:
+                if spec.name in archive.COMPLAINT_TABLES:
+                    source = archive.history(spec.name, 'id > %s', EXPORT_CHUNK_ROWS)
+                    params = (last_id, last_id)
+                else:
+                    source, params = f"{spec.name} WHERE id > %s", (last_id,)
+                cursor.execute(f"""
+                    SELECT {', '.join(spec.columns)} FROM {source}
+                    ORDER BY id LIMIT {EXPORT_CHUNK_ROWS}
+                """, params)
+                chunk = cursor.fetchall()
+            if not chunk:
+                break
+            writer.write_table(_to_arrow(spec, chunk))
+            last_id, rows = chunk[-1][0], rows + len(chunk)
+    shutil.rmtree(fresh, ignore_errors=True)
+    _copy_by_month(con, f"SELECT * FROM read_parquet({_quote(staging)}) ORDER BY id", fresh)
+    os.makedirs(fresh, exist_ok=True)
+    os.remove(staging)
+    shutil.rmtree(stale, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, stale)
+    os.replace(fresh, target)
+    shutil.rmtree(stale, ignore_errors=True)
+    return last_id, rows
+
+
+def _export_changes(con, spec, directory, last_id, since):
+    """Rewrite the months holding rows written since `since` or with ids above last_id; returns (last id, rows)"""
+    changed = {}
+    with transaction() as cursor:
+        cursor.execute(f"SELECT {', '.join(spec.columns)} FROM {spec.name} WHERE id > %s", (last_id,))
+        changed.update((row[0], row) for row in cursor.fetchall())
+        for clause in spec.changed:
+            cursor.execute(f"SELECT {', '.join(spec.columns)} FROM {spec.name} WHERE {clause}", (since,))
+            changed.update((row[0], row) for row in cursor.fetchall())
+    if not changed:
+        return last_id, 0
+    delta = _to_arrow(spec, list(changed.values()))
+    target = os.path.join(directory, spec.name)
+    staging = target + '.delta'
+    months = {month for month in delta.column('month').to_pylist() if month is not None}
+    existing = [path for path in (_month_file(target, month) for month in months) if os.path.exists(path)]
+    con.register('delta', delta)
+    try:
+        kept = (f"SELECT * FROM {_read_parquet(existing)} WHERE id NOT IN (SELECT id FROM delta) UNION ALL BY NAME "
+                if existing else '')
+        shutil.rmtree(staging, ignore_errors=True)
+        _copy_by_month(con, f"SELECT * FROM ({kept}SELECT * FROM delta WHERE month IS NOT NULL) ORDER BY id", staging)
+    finally:
+        con.unregister('delta')
+    for month in sorted(months):
+        os.makedirs(os.path.dirname(_month_file(target, month)), exist_ok=True)
+        os.replace(_month_file(staging, month), _month_file(target, month))
+    shutil.rmtree(staging, ignore_errors=True)
+    return max(last_id, max(changed)), len(changed)
+
+
+def _count_rows(con, directory, table):
+    paths = glob.glob(os.path.join(directory, table, '*', '*.parquet'))
+    if not paths:
+        return 0
+    return con.execute(f"SELECT COUNT(*) FROM {_read_parquet(paths)}").fetchone()[0]
+
+
+def load_state(directory=None):
+    """{table: last export's as-of time, last id, rows, ...} as saved by export()"""
+    try:
+        with open(os.path.join(directory or SNAPSHOT_DIR, STATE_FILE)) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(temporary, path)
+
+
+def export(full=False, directory=None):
+    """Bring the snapshot up to date (full=True re-copies every table); returns [TableFreshness]"""
+    from khoj.complaints import FEED_OVERLAP_SECONDS, feed_cursor
+    if duckdb is None:
+        raise RuntimeError("The analytics snapshot needs duckdb and pyarrow installed")
+    directory = directory or SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    state = load_state(directory)
+    con = duckdb.connect()
+    try:
+        for spec in TABLES:
+            started = time.perf_counter()
+            as_of = feed_cursor()  # taken first: rows written during the export are read again next time
+            previous = None if full else state.get(spec.name)
+            if previous and previous.get('columns') != list(spec.columns):
+                previous = None  # new columns (a migration) need every row again
+            if previous:
+                since = datetime.fromisoformat(previous['as_of']) - timedelta(seconds=FEED_OVERLAP_SECONDS)
+                last_id, changed = _export_changes(con, spec, directory, previous['last_id'], since)
+            else:
+                last_id, changed = _export_full(con, spec, directory)
+            state[spec.name] = {
+                'as_of': as_of.isoformat(sep=' '),
+                'last_id': last_id,
+                'columns': list(spec.columns),
+                'rows': _count_rows(con, directory, spec.name),
+                'changed': changed,
+                'exported_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+                'seconds': round(time.perf_counter() - started, 3),
+            }
+            _save_state(directory, state)  # per table, so a failed run keeps the finished ones
+    finally:
+        con.close()
+    return freshness(directory)
+
+
+def freshness(directory=None):
+    """[TableFreshness] of the exported tables"""
+    return [TableFreshness(table, entry['rows'], datetime.fromisoformat(entry['as_of']),
+                           datetime.fromisoformat(entry['exported_at']), entry['changed'], entry['seconds'])
+            for table, entry in load_state(directory).items()]
+
+
+def age_seconds(directory=None):
+    """Seconds since the least recently exported table was exported, or None without a snapshot"""
+    tables = freshness(directory)
+    if not tables:
+        return None
+    return (datetime.now() - min(table.exported_at for table in tables)).total_seconds()
+
+
+# Reads
+_lock = threading.Lock()
+_connection = None
+_loaded = None  # state file mtime the views were created for
+_warned = False
+
+
+def _create_views(con, directory):
+    from khoj.rollups import ROW_TERMS
+    con.execute("CREATE OR REPLACE MACRO mysql_dayofweek(d) AS dayofweek(d) + 1")
+    for spec in TABLES:
+        files = os.path.join(directory, spec.name, '*', '*.parquet')
+        if glob.glob(files):
+            source = _read_parquet(files)
+        else:
+            # Registered objects are not visible to cursors, so copy the schema into a table
+            con.register('empty', _schema(spec).empty_table())
+            con.execute(f"CREATE OR REPLACE TABLE empty_{spec.name} AS SELECT * FROM empty")
+            con.unregister('empty')
+            source = f'empty_{spec.name}'
+        con.execute(f"CREATE OR REPLACE VIEW {spec.name} AS SELECT * FROM {source}")
+    for table in COMPLAINT_COLUMNS:
+        # Archived complaints are exported with the live ones; readers that
+        # also open the archive table find it empty
+        con.execute(f"CREATE OR REPLACE VIEW {table}_archive AS SELECT * FROM {table} WHERE false")
+    daily = ' UNION ALL '.join(
+        f"SELECT day, '{table}' AS complaint_type, station, hour(created_at) AS hour, status FROM {table}"
+        for table in COMPLAINT_COLUMNS
+    )
+    con.execute(f"""
+        CREATE OR REPLACE VIEW complaint_rollup_daily AS
+        SELECT day, complaint_type, station, hour, status, COUNT(*) AS cases
+        FROM ({daily}) complaints GROUP BY ALL
+    """)
+    terms = ' UNION ALL '.join(
+        f"SELECT day, '{table}' AS complaint_type, '{dimension}' AS dimension, term_{number} AS value FROM {table}"
+        for table in COMPLAINT_COLUMNS for number, (dimension, _) in enumerate(ROW_TERMS[table])
+    )
+    con.execute(f"""
+        CREATE OR REPLACE VIEW complaint_rollup_terms AS
+        SELECT day, complaint_type, dimension, value, COUNT(*) AS cases
+        FROM ({terms}) terms GROUP BY ALL
+    """)
+
+
+def _open():
+    """The shared DuckDB connection, its views recreated when an export has landed; None before the first"""
+    global _connection, _loaded, _warned
+    try:
+        mtime = os.stat(os.path.join(SNAPSHOT_DIR, STATE_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        if not _warned:
+            log.warning("No analytics snapshot in %s yet; reading the database until "
+                        "`python -m khoj.snapshot export` has run", SNAPSHOT_DIR)
+            _warned = True
+        return None
+    if mtime != _loaded:
+        with _lock:
+            if mtime != _loaded:
+                if _connection is None:
+                    _connection = duckdb.connect()
+                _create_views(_connection, SNAPSHOT_DIR)
+                _loaded = mtime
+                invalidate_dashboard_cache()
+    return _connection
+
+
+def translate_sql(sql):
+    """khoj's MySQL-flavoured analytics SQL in DuckDB's dialect"""
+    return re.sub(r'\bDAYOFWEEK\(', 'mysql_dayofweek(', sql).replace('%s', '?')
+
+
+class _SnapshotCursor:
+    """DB-API cursor over the snapshot that takes the same SQL as khoj.db cursors"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), list(params))
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+    @property
+    def rowcount(self):
+        return -1
+
+
+@contextmanager
+def reader(buffered=True):
+    """A cursor for an analytics read: the snapshot's when it is the backend, else a database transaction
+
+    Either takes the same SQL against the complaint, status event and rollup
+    tables. buffered is passed on to khoj.db.transaction.
+    """
+    con = _open() if enabled() else None
+    if con is None:
+        with transaction(buffered) as cursor:
+            yield cursor
+        return
+    cursor = metrics.instrument(_SnapshotCursor(con.cursor()))
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+# CLI
+def _print_freshness(tables):
+    for table in tables:
+        print(f"{table.table:<26} {table.rows:>9} rows  as of {table.as_of:%Y-%m-%d %H:%M:%S}  "
+              f"exported {table.exported_at:%Y-%m-%d %H:%M:%S}  ({table.changed} rows in {table.seconds:.2f}s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--dir', help=f"snapshot directory (default {SNAPSHOT_DIR})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', parents=[common], help="write rows changed since the last export")
+    export_parser.add_argument('--full', action='store_true', help="re-copy every table")
+    export_parser.add_argument('--every', type=float, help="keep exporting, this many seconds apart")
+    commands.add_parser('status', parents=[common], help="show how fresh the snapshot is")
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        tables = freshness(args.dir)
+        if not tables:
+            print(f"no snapshot in {args.dir or SNAPSHOT_DIR}")
+            return 1
+        _print_freshness(tables)
+        print(f"oldest export {age_seconds(args.dir):.0f}s ago")
+        return 0
+    full = args.full
+    while True:
+        _print_freshness(export(full, args.dir))
+        if not args.every:
+            return 0
+        full = False
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
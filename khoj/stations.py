@@ -0,0 +1,390 @@
+"""Station registry: canonical station names with compact integer ids
+
+Stations are typed as free text ("CSMT", "Mumbai CST", "csmt "). Every value
+written to a station column is resolved to a row of the stations table and
+its id stored next to the text ({column}_id), so grouping, filtering and
+companion matching compare integers and every spelling of a station counts
+as that station. The text is kept as the user typed it.
+
+A name resolves, in order, by:
+- its key (case, accents, punctuation and words like "station" dropped,
+  "Rd" read as "Road", "C.S.T." as "cst") among the registered stations and
+  STATION_ALIASES,
+- a close match (difflib ratio of at least KHOJ_STATION_FUZZY_CUTOFF,
+  default 0.85) to a suburban line station or alias, for typos like "Dadr",
+- otherwise, on write, it is registered as a new station under its own
+  spelling.
+
+The registry is held in memory, loaded lazily and reloaded every
+KHOJ_STATION_REFRESH seconds to pick up stations registered by other
+processes. A station registered on write joins it only once the writing
+transaction commits, and inside a transaction the registry is never reloaded
+on a second connection (only a first load, which resolve() reads through the
+caller's cursor). complete() serves prefix lookups for autocomplete.
+
+    python -m khoj.stations lookup "Mumbai CST"
+    python -m khoj.stations complete dad
+    python -m khoj.stations backfill     # ids for rows written without them
+"""
+import argparse
+import difflib
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+from khoj.db import after_commit, dialect, on_duplicate_key, transaction, transaction_state
+from khoj.text import words as text_words
+
+FUZZY_CUTOFF = float(os.environ.get('KHOJ_STATION_FUZZY_CUTOFF', '0.85'))
+STATION_REFRESH = float(os.environ.get('KHOJ_STATION_REFRESH', '300'))
+MISS_RELOAD_SECONDS = 5  # an unknown id reloads the registry at most this often
+BACKFILL_ROWS = 5000
+
+# Mumbai suburban lines, stations in running order
+LINES = {
+    'Western': [
+        'Churchgate', 'Marine Lines', 'Charni Road', 'Grant Road', 'Mumbai Central', 'Mahalaxmi',
+        'Lower Parel', 'Prabhadevi', 'Dadar', 'Matunga Road', 'Mahim', 'Bandra', 'Khar Road',
+        'Santacruz', 'Vile Parle', 'Andheri', 'Jogeshwari', 'Ram Mandir', 'Goregaon', 'Malad',
+        'Kandivali', 'Borivali', 'Dahisar', 'Mira Road', 'Bhayandar', 'Naigaon', 'Vasai Road',
+        'Nallasopara', 'Virar',
+    ],
+    'Central': [
+        'CSMT', 'Masjid', 'Sandhurst Road', 'Byculla', 'Chinchpokli', 'Currey Road', 'Parel',
+        'Dadar', 'Matunga', 'Sion', 'Kurla', 'Vidyavihar', 'Ghatkopar', 'Vikhroli', 'Kanjurmarg',
+        'Bhandup', 'Nahur', 'Mulund', 'Thane', 'Kalwa', 'Mumbra', 'Diva', 'Kopar', 'Dombivli',
+        'Thakurli', 'Kalyan',
+    ],
+    'Harbour': [
+        'CSMT', 'Masjid', 'Sandhurst Road', 'Dockyard Road', 'Reay Road', 'Cotton Green', 'Sewri',
+        'Vadala Road', 'GTB Nagar', 'Chunabhatti', 'Kurla', 'Tilak Nagar', 'Chembur', 'Govandi',
+        'Mankhurd', 'Vashi', 'Sanpada', 'Juinagar', 'Nerul', 'Seawoods', 'Belapur CBD', 'Kharghar',
+        'Manasarovar', 'Khandeshwar', 'Panvel',
+    ],
+}
+STATION_ALIASES = {
+    'cst': 'CSMT', 'vt': 'CSMT', 'chhatrapati shivaji maharaj terminus': 'CSMT',
+    'mumbai cst': 'CSMT', 'bombay central': 'Mumbai Central', 'vasai': 'Vasai Road',
+    'belapur': 'Belapur CBD', 'cbd belapur': 'Belapur CBD',
+}
+KNOWN_STATIONS = sorted({station for stations in LINES.values() for station in stations})
+
+# Complaint table -> its station columns; each has an INT {column}_id beside it
+STATION_FIELDS = {
+    'medical_assistance': ('station_left', 'arriving_station'),
+    'womens_safety': ('boarding_station', 'destination_station'),
+}
+
+STATIONS_TABLE = '''CREATE TABLE IF NOT EXISTS stations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    station_key VARCHAR(100) NOT NULL UNIQUE
+)'''
+
+
+# Keys
+# Words dropped from ('') or rewritten in a key
+_KEY_WORDS = {'station': '', 'stn': '', 'rly': '', 'railway': '', 'jn': '', 'junction': '', 'rd': 'road'}
+
+
+@lru_cache(maxsize=4096)
+def station_key(name):
+    """Matching key of a station name: 'C.S.T. Stn' -> 'cst', 'Vasai Rd' -> 'vasai road'
+
+    Words in any script are kept ('दादर' keys as itself); a non-empty name never
+    gets an empty key.
+    """
+    words, initials = [], False
+    for word in text_words(name):
+        word = _KEY_WORDS.get(word, word)
+        if not word:
+            continue
+        # Runs of single letters are an abbreviation: "c s t" -> "cst"
+        if len(word) == 1 and word.isalpha():
+            if initials:
+                words[-1] += word
+                continue
+            initials = True
+        else:
+            initials = False
+        words.append(word)
+    # A name of dropped words or punctuation alone still keys as itself
+    return (' '.join(words) or ' '.join(str(name or '').casefold().split()))[:100]
+
+
+_FUZZY_KEYS = sorted({station_key(station) for station in KNOWN_STATIONS}
+                     | {station_key(alias) for alias in STATION_ALIASES})
+
+
+# Registry
+class StationRegistry:
+    """Station ids by key and names by id, with close-match and prefix lookups"""
+
+    def __init__(self, loader=None, ttl=STATION_REFRESH):
+        self.loader = loader  # callable returning (id, name, station_key) rows, or None
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._clear()
+
+    def _clear(self):
+        self._names = {}  # id -> name
+        self._ids = {}  # key -> id, aliases included
+        self._keys = []  # sorted keys, for prefix lookups
+        self._fuzzy = []  # keys of line stations and aliases, for close matches
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self, rows):
+        """Replace the registry with (id, name, station_key) rows"""
+        with self._lock:
+            self._clear()
+            for station_id, name, key in rows:
+                self._names[station_id] = name
+                self._ids[key] = station_id
+            for alias, station in STATION_ALIASES.items():
+                station_id = self._ids.get(station_key(station))
+                if station_id is not None:
+                    self._ids.setdefault(station_key(alias), station_id)
+            self._keys = sorted(self._ids)
+            self._fuzzy = [key for key in _FUZZY_KEYS if key in self._ids]
+            self._loaded_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """Reload from the loader when the registry is missing or older than the TTL
+
+        Inside a transaction() a loaded registry is used as it is: reloading
+        would check out a second pooled connection while one is held.
+        """
+        if self.loader is None:
+            return
+        if self._loaded_at is not None:
+            if transaction_state() is not None:
+                return
+            if not force and time.monotonic() - self._loaded_at <= self.ttl:
+                return
+        self.load(self.loader())
+
+    def _remember(self, registered):
+        """Add registered stations, key -> (id, name)"""
+        with self._lock:
+            for key, (station_id, name) in registered.items():
+                self._names[station_id] = name
+                if key not in self._ids:
+                    insort(self._keys, key)
+                self._ids[key] = station_id
+
+    def _pending(self, create=False):
+        """Stations registered by the open transaction, key -> (id, name); None outside one
+
+        They are remembered once it commits: if it rolls back the ids have no
+        row and may be handed to other stations.
+        """
+        state = transaction_state()
+        if state is None:
+            return None
+        registrations = state.setdefault('stations', {})
+        pending = registrations.get(self)
+        if pending is None and create:
+            pending = registrations[self] = {}
+            after_commit(lambda: self._remember(pending))
+        return pending
+
+    # Lookups
+    def lookup(self, name):
+        """Id of the station `name` refers to, None if it matches none"""
+        self.refresh()
+        return self._match(name)
+
+    def _match(self, name):
+        key = station_key(name)
+        if not key:
+            return None
+        station_id = self._ids.get(key)
+        if station_id is None:
+            station_id = (self._pending() or {}).get(key, (None,))[0]
+        if station_id is None and len(key) >= 3:
+            close = difflib.get_close_matches(key, self._fuzzy, n=1, cutoff=FUZZY_CUTOFF)
+            if close:
+                station_id = self._ids[close[0]]
+        return station_id
+
+    def resolve(self, cursor, name):
+        """Id of the station `name` refers to, registering a new station if it matches none
+
+        Runs in the caller's transaction, and loads the registry through its
+        cursor the first time. None for a blank name.
+        """
+        if self._loaded_at is None:
+            cursor.execute("SELECT id, name, station_key FROM stations")
+            self.load(cursor.fetchall())
+        station_id = self._match(name)
+        key = station_key(name)
+        if station_id is not None or not key:
+            return station_id
+        cursor.execute(f"""
+            INSERT INTO stations (name, station_key) VALUES (%s, %s)
+            {on_duplicate_key(('station_key',), 'station_key = station_key')}
+        """, (' '.join(str(name).split())[:100], key))
+        # Another process may have registered the key first
+        cursor.execute("SELECT id, name FROM stations WHERE station_key = %s", (key,))
+        station_id, registered = cursor.fetchone()
+        pending = self._pending(create=True)
+        if pending is None:
+            self._remember({key: (station_id, registered)})
+        else:
+            pending[key] = (station_id, registered)
+        return station_id
+
+    def name(self, station_id):
+        """Registered name of a station id; None for None or an unknown id"""
+        if station_id is None:
+            return None
+        self.refresh()
+        name = self._names.get(station_id)
+        if name is None:
+            for pending_id, pending_name in (self._pending() or {}).values():
+                if pending_id == station_id:
+                    return pending_name
+        if (name is None and self.loader is not None and transaction_state() is None
+                and time.monotonic() - self._loaded_at > MISS_RELOAD_SECONDS):
+            # Registered by another process since the last load
+            self.refresh(force=True)
+            name = self._names.get(station_id)
+        return name
+
+    def complete(self, prefix, limit=10):
+        """Names of the stations with a key or alias starting with prefix's key, in key order"""
+        self.refresh()
+        key = station_key(prefix)
+        keys = self._keys
+        names = {}
+        for candidate in keys[bisect_left(keys, key):]:
+            if not candidate.startswith(key) or len(names) == limit:
+                break
+            names.setdefault(self._names[self._ids[candidate]], None)
+        return list(names)
+
+
+def _load():
+    with transaction() as cursor:
+        cursor.execute("SELECT id, name, station_key FROM stations")
+        return cursor.fetchall()
+
+
+registry = StationRegistry(_load)
+
+
+def id_columns(table):
+    """The station id columns of a complaint table, in STATION_FIELDS order"""
+    return [f'{column}_id' for column in STATION_FIELDS.get(table, ())]
+
+
+def station_ids(cursor, table, values):
+    """{column}_id -> station id for the station columns of a complaint's values (registering new ones)"""
+    return {f'{column}_id': registry.resolve(cursor, values.get(column)) for column in STATION_FIELDS.get(table, ())}
+
+
+def canonical_sql(expression):
+    """expression with its station columns read as the registered station names"""
+    return _STATION_COLUMN.sub(
+        lambda match: f"COALESCE((SELECT s.name FROM stations s WHERE s.id = {match[1]}_id), {match[1]})",
+        expression)
+
+
+_STATION_COLUMN = re.compile(
+    r'\b(' + '|'.join(column for columns in STATION_FIELDS.values() for column in columns) + r')\b')
+
+
+# Schema and backfill
+def installed(cursor):
+    """Whether the registry exists yet (rollup rebuilds run in migrations before it does)"""
+    if dialect() == 'mysql':
+        cursor.execute("""
+            SELECT 1 FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'stations'
+        """)
+    else:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stations'")
+    return bool(cursor.fetchall())
+
+
+def seed(cursor):
+    """Register the suburban line stations"""
+    cursor.executemany(f"""
+        INSERT INTO stations (name, station_key) VALUES (%s, %s)
+        {on_duplicate_key(('station_key',), 'station_key = station_key')}
+    """, [(station, station_key(station)) for station in KNOWN_STATIONS])
+
+
+def backfill(cursor, tables=tuple(STATION_FIELDS)):
+    """Fill in the station ids of live and archived rows written without them; returns rows updated"""
+    # Resolved by a registry loaded through this transaction, which may have
+    # just created the stations; the shared one reloads once it commits
+    resolver = StationRegistry()
+    cursor.execute("SELECT id, name, station_key FROM stations")
+    resolver.load(cursor.fetchall())
+    after_commit(lambda: registry.refresh(force=True))
+    updated = 0
+    for table in tables:
+        columns = STATION_FIELDS[table]
+        ids = id_columns(table)
+        resolved = {}
+        for source in (table, f'{table}_archive'):
+            last_id = 0
+            while True:
+                cursor.execute(f"""
+                    SELECT id, {', '.join(columns)}, {', '.join(ids)}
+                    FROM {source} WHERE id > %s ORDER BY id LIMIT {BACKFILL_ROWS}
+                """, (last_id,))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                changes = []
+                for row in rows:
+                    names, known = row[1:1 + len(columns)], row[1 + len(columns):]
+                    if all(station_id is not None for name, station_id in zip(names, known) if name):
+                        continue
+                    for name in names:
+                        if name not in resolved:
+                            resolved[name] = resolver.resolve(cursor, name)
+                    changes.append(tuple(resolved[name] for name in names) + (row[0],))
+                if changes:
+                    cursor.executemany(f"""
+                        UPDATE {source} SET {', '.join(f'{column} = %s' for column in ids)}
+                        WHERE id = %s
+                    """, changes)
+                    updated += len(changes)
+                last_id = rows[-1][0]
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    lookup = commands.add_parser('lookup', help="the station a name resolves to")
+    lookup.add_argument('name')
+    complete = commands.add_parser('complete', help="stations starting with a prefix")
+    complete.add_argument('prefix')
+    complete.add_argument('--limit', type=int, default=10)
+    commands.add_parser('backfill', help="station ids for rows written without them")
+    args = parser.parse_args(argv)
+    if args.command == 'lookup':
+        station_id = registry.lookup(args.name)
+        print(f"{station_id}  {registry.name(station_id)}" if station_id is not None else "no match")
+    elif args.command == 'complete':
+        for name in registry.complete(args.prefix, args.limit):
+            print(name)
+    else:
+        with transaction() as cursor:
+            print(f"{backfill(cursor)} rows updated")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
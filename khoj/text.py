@@ -0,0 +1,79 @@
+"""Tokenizing and normalizing free-text complaint fields
+
+Shared by the item search index and the "common items" rollup, so
+"black bag", "Black Bag " and "bag (black)" are the same item everywhere.
+"""
+import re
+import unicodedata
+
+STOPWORDS = {
+    'a', 'an', 'and', 'at', 'for', 'from', 'in', 'is', 'it', 'its', 'my', 'of', 'on', 'one',
+    'or', 'some', 'the', 'to', 'was', 'with',
+}
+
+COLOURS = {
+    'black', 'blue', 'brown', 'gold', 'golden', 'green', 'grey', 'maroon', 'orange', 'pink',
+    'purple', 'red', 'silver', 'white', 'yellow',
+}
+
+# Words that describe an item rather than name it; they lead a normalized item
+ATTRIBUTES = COLOURS | {
+    'big', 'large', 'small', 'new', 'old',
+    'cloth', 'cotton', 'leather', 'metal', 'plastic', 'steel',
+}
+
+SYNONYMS = {
+    'gray': 'grey', 'cellphone': 'phone', 'mobile': 'phone', 'smartphone': 'phone',
+    'spectacles': 'spectacle', 'specs': 'spectacle', 'glasses': 'spectacle',
+    'handbag': 'bag', 'backpack': 'bag', 'suitcase': 'bag', 'luggage': 'bag',
+    'purse': 'wallet', 'headphone': 'earphone',
+}
+
+# Letters and digits of any script, with the marks written inside a word
+# (Devanagari and other Indic vowel signs); "_" is not a word character here
+_MARKS = ''.join(chr(code) for code in range(0x300, 0x10000) if unicodedata.category(chr(code)).startswith('M'))
+_WORD = re.compile(f'(?:[^\\W_]|[{re.escape(_MARKS)}])+')
+_ASCII_WORD = re.compile(r'[a-z0-9]+')  # the same on ASCII text, and faster
+
+
+def _stem(word):
+    # Plurals only: bags -> bag, boxes -> box, batteries -> battery; keeps glass, bus
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'xes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def words(text):
+    """Case-folded, accent-free words of `text` in any script, in order"""
+    text = str(text or '')
+    if text.isascii():
+        return _ASCII_WORD.findall(text.lower())
+    # Only combining marks go (accents: "café" -> "cafe"), not the letters they sit on
+    return _WORD.findall(''.join(char for char in unicodedata.normalize('NFKD', text)
+                                 if not unicodedata.combining(char)).casefold())
+
+
+def tokenize(text):
+    """Case-folded, accent-free, singular tokens without stopwords; words in any script are kept"""
+    if not text:
+        return []
+    tokens = []
+    for word in words(text):
+        word = _stem(SYNONYMS.get(word, word))
+        word = SYNONYMS.get(word, word)
+        if word not in STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+def normalize_item(description):
+    """Canonical item name: attribute words first (sorted), then the rest in order, no repeats"""
+    tokens = list(dict.fromkeys(tokenize(description)))
+    return ' '.join(sorted(token for token in tokens if token in ATTRIBUTES)
+                    + [token for token in tokens if token not in ATTRIBUTES])
@@ -0,0 +1,70 @@
+"""User management functions"""
+import time
+
+from khoj.auth import (
+    check_password, clear_login_attempts, hash_password, throttle_client, throttle_login, verify_session_token
+)
+from khoj.db import IntegrityError, on_duplicate_key, transaction
+
+# Sessions ended before their token expired; a row is kept until that expiry (epoch seconds)
+REVOKED_SESSIONS_TABLE = '''CREATE TABLE IF NOT EXISTS revoked_sessions (
+    session_id VARCHAR(32) PRIMARY KEY,
+    expires_at BIGINT NOT NULL
+)'''
+
+
+def register_user(name, email, password, phone, role, client_ip=None):
+    """Raises khoj.auth.LoginThrottled when the address is over its limit, like authenticate_user"""
+    throttle_client(client_ip)
+    hashed_pw = hash_password(password)
+    try:
+        with transaction() as cursor:
+            cursor.execute("INSERT INTO users (name, email, password, phone, role) VALUES (%s, %s, %s, %s, %s)",
+                           (name, email, hashed_pw, phone, role))
+        return True
+    except IntegrityError:
+        return False
+
+
+def authenticate_user(email, password, client_ip=None):
+    """Raises khoj.auth.LoginThrottled when the account or address is over its limit"""
+    throttle_login(email, client_ip)
+    with transaction() as cursor:
+        cursor.execute("SELECT id, name, password, role, phone FROM users WHERE email=%s", (email,))
+        user = cursor.fetchone()
+    if user and check_password(password, user[2]):
+        clear_login_attempts(email)
+        return user[0], user[1], user[3], user[4], email
+    return None, None, None, None, None
+
+
+def restore_session(token):
+    """The user tuple authenticate_user returns for a session token, None if it is bad, expired or revoked
+
+    The role and profile are read from users, not the token, so a demotion takes
+    effect the next time the cookie is restored (a session already logged in
+    keeps the role it started with) and a deleted user's sessions stop working.
+    """
+    claims = verify_session_token(token)
+    if claims is None:
+        return None
+    with transaction() as cursor:
+        cursor.execute("SELECT 1 FROM revoked_sessions WHERE session_id = %s", (claims['sid'],))
+        if cursor.fetchone():
+            return None
+        cursor.execute("SELECT id, name, role, phone, email FROM users WHERE id=%s", (claims['id'],))
+        return cursor.fetchone()
+
+
+def end_session(token):
+    """Revoke a session token so it stops working before it expires"""
+    claims = verify_session_token(token)
+    if claims is None:
+        return
+    with transaction() as cursor:
+        cursor.execute(f"""
+            INSERT INTO revoked_sessions (session_id, expires_at) VALUES (%s, %s)
+            {on_duplicate_key(('session_id',), 'expires_at = expires_at')}
+        """, (claims['sid'], claims['exp']))
+        # Expired tokens fail verification anyway
+        cursor.execute("DELETE FROM revoked_sessions WHERE expires_at < %s", (int(time.time()),))
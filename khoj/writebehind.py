@@ -0,0 +1,363 @@
+"""Optional write-behind queue for Home page submissions
+
+With KHOJ_WRITE_BEHIND=1, submit() appends the submission to a local SQLite
+journal and returns its ticket straight away; a background thread drains the
+journal into the database, many submissions per transaction. The journal is
+drained in ticket order, so one user's submissions are written in the order
+they were made. Each written ticket leaves a receipt in write_queue_receipts
+inside the same transaction, so a submission is never written twice, even if
+the server stops between the commit and the journal update.
+
+Medical requests can skip the queue (submit(..., immediate=True)); without
+write-behind every submission is written immediately. Submissions are checked
+against the column limits (khoj.ingest.validate) before they are queued; a
+queued one the database still refuses (an integrity or data error) is split
+out of its group and marked failed, so it cannot hold up the submissions
+behind it. Failed tickets are listed to their submitter
+(failed_submissions) and counted in queue_metrics(). Operational errors
+(lock waits, deadlocks, lost connections) fail no submission: the group is
+retried with backoff.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: receipts still stop double writes
+    fcntl = None
+
+from khoj.complaints import SUBMISSION_COLUMNS, add_complaint, complaints_written, insert_complaint
+from khoj.db import DataError, IntegrityError, transaction
+from khoj.ingest import validate
+
+WRITE_BEHIND = os.environ.get('KHOJ_WRITE_BEHIND', '0') == '1'
+# Medical requests are written immediately unless this is set to 0
+MEDICAL_IMMEDIATE = os.environ.get('KHOJ_MEDICAL_IMMEDIATE', '1') == '1'
+JOURNAL_PATH = os.environ.get('KHOJ_WRITE_QUEUE_PATH', 'khoj-write-queue.sqlite3')
+GROUP_SIZE = int(os.environ.get('KHOJ_WRITE_QUEUE_GROUP_SIZE', '200'))  # submissions per commit
+# Seconds the writer waits after a wake-up so near-simultaneous submissions share a commit
+LINGER = float(os.environ.get('KHOJ_WRITE_QUEUE_LINGER', '0.02'))
+POLL_INTERVAL = 1.0
+MAX_BACKOFF = 30.0
+KEEP_WRITTEN = 24 * 3600  # seconds written tickets stay in the journal
+
+RECEIPTS_TABLE = '''CREATE TABLE IF NOT EXISTS write_queue_receipts (
+    journal CHAR(32) NOT NULL,
+    ticket BIGINT NOT NULL,
+    complaint_type VARCHAR(50) NOT NULL,
+    complaint_id INT NOT NULL,
+    written_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (journal, ticket)
+)'''
+
+_JOURNAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS journal (
+    ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+    complaint_type TEXT NOT NULL,
+    user_name TEXT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    complaint_id INTEGER,
+    error TEXT,
+    written_at REAL
+);
+CREATE INDEX IF NOT EXISTS journal_state ON journal (state, ticket);
+CREATE TABLE IF NOT EXISTS journal_meta (key TEXT PRIMARY KEY, value TEXT);
+'''
+
+log = logging.getLogger(__name__)
+
+
+class Submission(NamedTuple):
+    ticket: Optional[int]  # None when written immediately
+    complaint_id: Optional[int]  # None until the writer has written it
+    queued: bool
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    raise TypeError(f"Cannot queue {type(value).__name__}")
+
+
+def _decode(obj):
+    if '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    if '$date' in obj:
+        return date.fromisoformat(obj['$date'])
+    return obj
+
+
+class WriteQueue:
+    """Durable FIFO of submissions with a group-committing writer thread"""
+
+    def __init__(self, path=JOURNAL_PATH, group_size=GROUP_SIZE, linger=LINGER):
+        self.path = path
+        self.group_size = group_size
+        self.linger = linger
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._lock_file = None
+        self._stats_lock = threading.Lock()
+        self._written = self._batches = self._failed = 0
+        self._last_error = None
+        conn = self._journal()
+        conn.executescript(_JOURNAL_SCHEMA)
+        conn.execute("INSERT OR IGNORE INTO journal_meta VALUES ('journal_id', ?)", (uuid.uuid4().hex,))
+        conn.commit()
+        self.journal_id = conn.execute("SELECT value FROM journal_meta WHERE key = 'journal_id'").fetchone()[0]
+
+    def _journal(self):
+        # One connection per thread; the journal is only ever touched locally
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    # Producer side
+    def enqueue(self, table_name, values):
+        """Append a submission to the journal; returns its ticket"""
+        conn = self._journal()
+        with conn:
+            ticket = conn.execute(
+                "INSERT INTO journal (complaint_type, user_name, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (table_name, values.get('user_name'), json.dumps(values, default=_encode), time.time())
+            ).lastrowid
+        self.start()
+        self._wake.set()
+        return ticket
+
+    def ticket_status(self, ticket):
+        """(state, complaint_id, error) for a ticket, or None if it is unknown or pruned"""
+        return self._journal().execute(
+            "SELECT state, complaint_id, error FROM journal WHERE ticket = ?", (ticket,)
+        ).fetchone()
+
+    def pending_for_user(self, user_name):
+        return self._journal().execute(
+            "SELECT COUNT(*) FROM journal WHERE state = 'queued' AND user_name = ?", (user_name,)
+        ).fetchone()[0]
+
+    def failed_for_user(self, user_name):
+        """[(ticket, complaint_type, error)] of user_name's submissions the database refused"""
+        return self._journal().execute(
+            "SELECT ticket, complaint_type, error FROM journal WHERE state = 'failed' AND user_name = ? "
+            "ORDER BY ticket", (user_name,)
+        ).fetchall()
+
+    def metrics(self):
+        depth, oldest = self._journal().execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM journal WHERE state = 'queued'"
+        ).fetchone()
+        with self._stats_lock:
+            return {
+                'depth': depth,
+                'lag_seconds': time.time() - oldest if oldest else 0.0,
+                'written': self._written,
+                'batches': self._batches,
+                'avg_batch': self._written / self._batches if self._batches else 0.0,
+                'failed': self._failed,
+                'writer_running': bool(self._thread and self._thread.is_alive()),
+                'last_error': self._last_error,
+            }
+
+    # Writer side
+    def start(self):
+        """Start the writer thread unless this or another process already drains the journal"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if fcntl is not None and self._lock_file is None:
+                lock_file = open(self.path + '.lock', 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return  # another server process is the writer
+                self._lock_file = lock_file
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='khoj-write-behind', daemon=True)
+            self._thread.start()
+
+    def stop(self, drain=True, timeout=30):
+        """Stop the writer, by default after writing everything queued"""
+        if drain:
+            deadline = time.monotonic() + timeout
+            while (self._thread is not None and self._thread.is_alive() and self.metrics()['depth']
+                   and time.monotonic() < deadline):
+                self._wake.set()
+                time.sleep(0.01)
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff = 0.0
+        last_prune = 0.0
+        while not self._stop.is_set():
+            entries = self._next_group()
+            if not entries:
+                if time.monotonic() - last_prune > 3600:
+                    self._prune()
+                    last_prune = time.monotonic()
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                if self.linger:
+                    time.sleep(self.linger)
+                continue
+            try:
+                self.write_group(entries)
+                backoff = 0.0
+            except Exception as error:  # unreachable, locked or deadlocked: keep the entries and retry
+                log.exception("write-behind group of %d failed", len(entries))
+                with self._stats_lock:
+                    self._last_error = repr(error)
+                backoff = min(max(backoff * 2, 0.5), MAX_BACKOFF)
+                self._stop.wait(backoff)
+
+    def _next_group(self):
+        rows = self._journal().execute(
+            "SELECT ticket, complaint_type, payload, enqueued_at FROM journal "
+            "WHERE state = 'queued' ORDER BY ticket LIMIT ?", (self.group_size,)
+        ).fetchall()
+        # Stamped with the submission time, not the time the writer got to it:
+        # the seconds waited come off the database's clock (see insert_complaint)
+        now = time.time()
+        return [(ticket, table_name, json.loads(payload, object_hook=_decode), max(now - enqueued_at, 0.0))
+                for ticket, table_name, payload, enqueued_at in rows]
+
+    def write_group(self, entries):
+        """Write journal entries in one transaction; a group with a refused row is split to find the bad entry"""
+        written = self._write_split(entries)
+        self._mark_written(written)
+        complaints_written([(table_name, complaint_id, values)
+                            for _, table_name, complaint_id, values in written])
+
+    def _write_split(self, entries):
+        try:
+            return self._commit(entries)
+        except IntegrityError + DataError as error:
+            # Only errors about a row's values; anything else (a lock timeout, a
+            # deadlock) goes up to _run, which retries the whole group
+            if len(entries) == 1:
+                self._mark_failed(entries[0][0], repr(error))
+                return []
+            middle = len(entries) // 2
+            return self._write_split(entries[:middle]) + self._write_split(entries[middle:])
+
+    def _commit(self, entries):
+        tickets = [entry[0] for entry in entries]
+        written = []
+        with transaction() as cursor:
+            cursor.execute(f"""
+                SELECT ticket, complaint_id FROM write_queue_receipts
+                WHERE journal = %s AND ticket IN ({', '.join(['%s'] * len(tickets))})
+            """, (self.journal_id, *tickets))
+            done = dict(cursor.fetchall())
+            receipts = []
+            for ticket, table_name, values, waited in entries:
+                if ticket in done:  # committed before the journal was updated
+                    written.append((ticket, table_name, done[ticket], values))
+                    continue
+                complaint_id = insert_complaint(cursor, table_name, values, waited)
+                receipts.append((self.journal_id, ticket, table_name, complaint_id))
+                written.append((ticket, table_name, complaint_id, values))
+            if receipts:
+                cursor.executemany("""
+                    INSERT INTO write_queue_receipts (journal, ticket, complaint_type, complaint_id)
+                    VALUES (%s, %s, %s, %s)
+                """, receipts)
+        return written
+
+    def _mark_written(self, written):
+        if not written:
+            return
+        conn = self._journal()
+        with conn:
+            conn.executemany("UPDATE journal SET state = 'written', complaint_id = ?, written_at = ? WHERE ticket = ?",
+                             [(complaint_id, time.time(), ticket) for ticket, _, complaint_id, _ in written])
+        with self._stats_lock:
+            self._written += len(written)
+            self._batches += 1
+
+    def _mark_failed(self, ticket, error):
+        conn = self._journal()
+        with conn:
+            conn.execute("UPDATE journal SET state = 'failed', error = ? WHERE ticket = ?", (error, ticket))
+        log.error("write-behind ticket %d refused by the database: %s", ticket, error)
+        with self._stats_lock:
+            self._failed += 1
+            self._last_error = error
+
+    def _prune(self):
+        conn = self._journal()
+        with conn:
+            conn.execute("DELETE FROM journal WHERE state = 'written' AND written_at < ?",
+                         (time.time() - KEEP_WRITTEN,))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteQueue()
+    return _queue
+
+
+def start():
+    """Resume draining anything left in the journal (no-op without write-behind)"""
+    if WRITE_BEHIND:
+        get_queue().start()
+
+
+def submit(table_name, values, immediate=False):
+    """Queue a Home page submission, or write it now without write-behind or when immediate
+
+    Raises ValueError, listing the problems, for values the table cannot hold.
+    """
+    if table_name not in SUBMISSION_COLUMNS:
+        raise ValueError(f"Unknown complaint table: {table_name}")
+    _, errors = validate(table_name, values)
+    if errors:
+        raise ValueError('; '.join(errors))
+    if not WRITE_BEHIND or immediate:
+        return Submission(None, add_complaint(table_name, values), False)
+    return Submission(get_queue().enqueue(table_name, values), None, True)
+
+
+def pending_submissions(user_name):
+    """Submissions of user_name still waiting in the journal"""
+    return get_queue().pending_for_user(user_name) if WRITE_BEHIND else 0
+
+
+def failed_submissions(user_name):
+    """[(ticket, complaint_type, error)] of user_name's queued submissions that could not be saved"""
+    return get_queue().failed_for_user(user_name) if WRITE_BEHIND else []
+
+
+def queue_metrics():
+    return get_queue().metrics() if WRITE_BEHIND else None